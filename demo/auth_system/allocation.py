@@ -0,0 +1,193 @@
+"""
+Payment allocation against a customer's pending stock transactions.
+
+Planning and applying are kept apart: the plan_* functions work purely in
+memory on rows that have already been read, and apply_allocation writes a
+finished plan back with a single bulk_update, plus its audit log entries
+(see audit.py). The write path narrows the rows it reads to those a payment
+can actually reach with a window-function running total, so a payment
+against hundreds of open invoices reads and writes only the invoices it
+settles.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Sum, Value, Window, prefetch_related_objects
+from django.db.models.expressions import RowRange
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .audit import log_bulk_changes, remember_original
+from .models import CustomerLedger, Transaction
+
+OPEN_PAYMENT_STATUSES = ['pending', 'partial']
+
+# Order in which automatic allocation settles pending stock transactions
+ALLOCATION_ORDERINGS = {
+    'oldest_first': ('created_at', 'id'),
+    'smallest_first': ('balance', 'created_at', 'id'),
+    'largest_first': ('-balance', 'created_at', 'id'),
+}
+
+
+def allocation_ordering(sort_order):
+    return ALLOCATION_ORDERINGS.get(sort_order, ALLOCATION_ORDERINGS['oldest_first'])
+
+
+def pending_stock_transactions(customer_id):
+    """
+    Stock transactions of a customer that still carry a balance
+    """
+    return Transaction.objects.filter(
+        customer_id=customer_id,
+        transaction_type='stock',
+        payment_status__in=OPEN_PAYMENT_STATUSES
+    )
+
+
+def sort_for_allocation(transactions, sort_order='oldest_first'):
+    """
+    In-memory equivalent of ordering pending transactions for allocation
+    """
+    transactions = list(transactions)
+    for field in reversed(allocation_ordering(sort_order)):
+        name = field.lstrip('-')
+        transactions.sort(key=lambda tx: getattr(tx, name), reverse=field.startswith('-'))
+    return transactions
+
+
+def covering_pending_transactions(customer_id, amount, sort_order='oldest_first'):
+    """
+    Pending stock transactions, in allocation order, that a payment of
+    `amount` reaches: those whose preceding balances add up to less than the
+    amount. Computed in one query with a running total over the balances.
+    """
+    ordering = allocation_ordering(sort_order)
+    order_by = [F(field[1:]).desc() if field.startswith('-') else F(field).asc() for field in ordering]
+    return pending_stock_transactions(customer_id).filter(
+        balance__gt=0
+    ).annotate(
+        covered_before=Coalesce(
+            Window(Sum('balance'), order_by=order_by, frame=RowRange(start=None, end=-1)),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2)
+        )
+    ).filter(
+        covered_before__lt=amount
+    ).order_by(*ordering)
+
+
+def plan_automatic_allocation(transactions, amount):
+    """
+    Spread `amount` over `transactions` in the order given, settling each
+    one before moving to the next.
+    Returns the plan as (transaction, amount_to_apply) pairs and the part of
+    the amount left over.
+    """
+    remaining_payment = Decimal(str(amount))
+    plan = []
+    for pending_tx in transactions:
+        if remaining_payment <= 0:
+            break
+
+        current_balance = Decimal(str(pending_tx.balance or '0'))
+        if current_balance > 0:
+            amount_to_apply = min(remaining_payment, current_balance)
+            plan.append((pending_tx, amount_to_apply))
+            remaining_payment -= amount_to_apply
+    return plan, remaining_payment
+
+
+def plan_manual_allocation(transactions, allocations):
+    """
+    Apply explicit per-transaction amounts, given as {transaction_id: Decimal},
+    never allocating more than a transaction's balance.
+    Returns the plan as (transaction, amount_to_apply) pairs.
+    """
+    plan = []
+    for tx in transactions:
+        allocation_amount = allocations.get(tx.id, Decimal('0'))
+        if allocation_amount > 0:
+            current_balance = Decimal(str(tx.balance or '0'))
+            # Ensure we don't allocate more than the balance
+            amount_to_apply = min(allocation_amount, current_balance)
+            plan.append((tx, amount_to_apply))
+    return plan
+
+
+def preview_allocation(transactions, amount, sort_order='oldest_first', allocations=None):
+    """
+    Work out what a payment would do to `transactions` (the customer's
+    pending stock transactions, already read) without writing anything.
+    Uses manual `allocations` ({transaction_id: Decimal}) when given,
+    otherwise the automatic strategy named by `sort_order`.
+    """
+    amount = Decimal(str(amount))
+    transactions = sort_for_allocation(transactions, sort_order)
+
+    if allocations:
+        plan = plan_manual_allocation(transactions, allocations)
+    else:
+        plan, _ = plan_automatic_allocation(transactions, amount)
+
+    preview = []
+    for tx, amount_to_apply in plan:
+        new_balance = Decimal(str(tx.balance or '0')) - amount_to_apply
+        preview.append({
+            'id': tx.id,
+            'transaction_date': tx.transaction_date,
+            'total': str(tx.total),
+            'balance': str(tx.balance),
+            'amount_applied': str(amount_to_apply),
+            'new_balance': str(new_balance),
+            'new_status': 'paid' if new_balance == 0 else 'partial'
+        })
+
+    total_pending = sum((Decimal(str(tx.balance or '0')) for tx in transactions), Decimal('0'))
+    total_allocated = sum((amount_to_apply for _, amount_to_apply in plan), Decimal('0'))
+    return {
+        'allocations': preview,
+        'summary': {
+            'payment_amount': float(amount),
+            'total_pending_before': float(total_pending),
+            'total_allocated': float(total_allocated),
+            'total_pending_after': float(total_pending - total_allocated),
+            'unallocated_amount': float(amount - total_allocated)
+        }
+    }
+
+
+def settle(tx, amount_to_apply):
+    """
+    Apply an allocated amount to a stock transaction in memory
+    """
+    remember_original(tx)
+    current_balance = Decimal(str(tx.balance or '0'))
+    tx.amount_paid = Decimal(str(tx.amount_paid or '0')) + amount_to_apply
+    tx.balance = current_balance - amount_to_apply
+    tx.payment_status = 'paid' if tx.balance == 0 else 'partial'
+    return {
+        'id': tx.id,
+        'amount_applied': str(amount_to_apply),
+        'new_balance': str(tx.balance)
+    }
+
+
+def apply_allocation(plan):
+    """
+    Write an allocation plan with a single bulk_update, log it and fold the
+    settled amounts into the customers' balance summaries.
+    Returns the updated_transactions payload for the API response.
+    """
+    now = timezone.now()
+    updated_transactions = []
+    for tx, amount_to_apply in plan:
+        updated_transactions.append(settle(tx, amount_to_apply))
+        tx.updated_at = now
+
+    settled = [tx for tx, _ in plan]
+    Transaction.objects.bulk_update(settled, ['amount_paid', 'balance', 'payment_status', 'updated_at'])
+    # Entries name the customer, load them together
+    prefetch_related_objects(settled, 'customer')
+    log_bulk_changes(updated=settled)
+    CustomerLedger.sync_many(settled)
+    return updated_transactions
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AuthSystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auth_system'
+
+    def ready(self):
+        from .search import reinstall_search_index
+
+        post_migrate.connect(reinstall_search_index, sender=self)
@@ -0,0 +1,78 @@
+"""
+Audit log entries for bulk writes.
+
+django-auditlog records changes from the save signals, which bulk_create and
+bulk_update skip. The bulk write paths (ledger appends, inventory deltas,
+payment allocation) record them here instead: the same LogEntry rows
+auditlog writes when instances are saved one at a time, inserted with a
+single bulk_create per batch.
+
+Call remember_original() on an instance before changing it in memory, then
+log_bulk_changes() once the bulk write is done.
+"""
+import copy
+
+from auditlog.cid import get_cid
+from auditlog.context import auditlog_disabled
+from auditlog.diff import model_instance_diff
+from auditlog.models import LogEntry
+from auditlog.registry import auditlog
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import pre_save
+from django.utils.encoding import smart_str
+
+
+def remember_original(instance):
+    """
+    Keep a copy of `instance` as loaded, to diff against when it is logged.
+    Only the first call counts, so an instance can be changed several times.
+    """
+    if not hasattr(instance, '_audit_original'):
+        instance._audit_original = copy.copy(instance)
+
+
+def _log_entry(instance, action, changes):
+    entry = LogEntry(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_pk=str(instance.pk),
+        object_id=instance.pk,
+        object_repr=smart_str(instance),
+        serialized_data=LogEntry.objects._get_serialized_data_or_none(instance),
+        action=action,
+        changes=changes,
+        cid=get_cid()
+    )
+    # auditlog's set_actor() context fills in the actor and remote address
+    # from a pre_save receiver, which bulk_create would skip
+    pre_save.send(sender=LogEntry, instance=entry, raw=False, using=entry._state.db, update_fields=None)
+    return entry
+
+
+def log_bulk_changes(created=(), updated=()):
+    """
+    Write create entries for the `created` instances and update entries for
+    the `updated` ones that went through remember_original(), with one
+    insert. Unregistered models and unchanged instances are skipped.
+    """
+    if auditlog_disabled.get():
+        return []
+
+    use_json = settings.AUDITLOG_STORE_JSON_CHANGES
+    entries = []
+    for instance in created:
+        if auditlog.contains(instance.__class__):
+            changes = model_instance_diff(None, instance, use_json_for_changes=use_json)
+            if changes:
+                entries.append(_log_entry(instance, LogEntry.Action.CREATE, changes))
+    for instance in updated:
+        original = instance.__dict__.pop('_audit_original', None)
+        if original is None or not auditlog.contains(instance.__class__):
+            continue
+        changes = model_instance_diff(original, instance, use_json_for_changes=use_json)
+        if changes:
+            entries.append(_log_entry(instance, LogEntry.Action.UPDATE, changes))
+
+    if not entries:
+        return []
+    return LogEntry.objects.bulk_create(entries)
@@ -0,0 +1,121 @@
+"""
+Versioned response cache for read-heavy report endpoints.
+
+Entries are keyed by endpoint, normalized query parameters and a data version
+counter. Writes to the data the reports are built from bump the counter (the
+post_save/post_delete receivers in models.py, and explicitly in the bulk
+paths that bypass those signals), which moves every reader to fresh keys: old
+entries are never served again and simply expire, so there is nothing to
+purge. Only the cache operations every Django backend supports are used
+(get/set/add/incr), so it works with the local-memory and file-based caches.
+
+Endpoints whose default period is relative to today (the insights) also key
+on the current date, so their entries are not served after midnight.
+"""
+import functools
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .pagination import set_next_cursor
+
+VERSION_KEY = 'report_cache:version'
+STATS_KEYS = {'hits': 'report_cache:hits', 'misses': 'report_cache:misses'}
+# Superseded versions are never read again, this only bounds how long they linger
+RESPONSE_TIMEOUT = 60 * 60
+
+
+def _incr(key, initial=1):
+    # incr() raises ValueError when the key is missing or has been evicted
+    if cache.add(key, initial, timeout=None):
+        return initial
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, initial, timeout=None)
+        return initial
+
+
+def new_version():
+    """
+    Starting value for a version counter that is missing, e.g. because the
+    cache evicted it. Nanoseconds since the epoch are ahead of any value an
+    earlier counter reached, so entries stored under old versions never
+    become current again.
+    """
+    return time.time_ns()
+
+
+def data_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, new_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    """
+    Invalidate all cached responses. Inside a transaction the version is
+    bumped again on commit, as a concurrent reader may have cached the
+    pre-commit data under the first bump.
+    """
+    _incr(VERSION_KEY, new_version())
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incr(VERSION_KEY, new_version()))
+
+
+def cache_stats():
+    stats = {name: cache.get(key, 0) for name, key in STATS_KEYS.items()}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['data_version'] = data_version()
+    return stats
+
+
+def response_cache_key(name, query_params, version, today=None):
+    # Parameter order (and the order of repeated values) does not change the result
+    params = sorted((key, sorted(query_params.getlist(key))) for key in query_params)
+    if today is not None:
+        params.append(['today', today.isoformat()])
+    digest = hashlib.md5(json.dumps(params).encode()).hexdigest()
+    return f'report_cache:{name}:{version}:{digest}'
+
+
+def cached_response(name, date_relative=False):
+    """
+    Cache successful responses of a DRF function view under `name`.
+    Set `date_relative` for views whose result depends on today's date.
+    The X-Next-Cursor header is cached along with the data. Streaming
+    (?stream=...) and export (?file_format=...) requests are passed straight
+    through.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.GET.get('stream') or request.GET.get('file_format'):
+                return view(request, *args, **kwargs)
+
+            today = timezone.localdate() if date_relative else None
+            key = response_cache_key(name, request.GET, data_version(), today)
+            entry = cache.get(key)
+            if entry is not None:
+                _incr(STATS_KEYS['hits'])
+                data, next_cursor = entry
+                response = set_next_cursor(Response(data), next_cursor)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _incr(STATS_KEYS['misses'])
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, (response.data, response.get('X-Next-Cursor')), timeout=RESPONSE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
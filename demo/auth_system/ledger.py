@@ -0,0 +1,121 @@
+"""
+Running-balance maintenance for the customer transaction ledger.
+
+A customer's ledger is ordered by LEDGER_ORDERING. New transactions normally
+land at the end and take their running balance from the CustomerLedger head.
+When a transaction is inserted, edited or deleted somewhere in the middle,
+every later row's running_balance has to be rewritten; recompute_running_balances
+does that for the affected suffix only, with a single UPDATE driven by a
+window-function cumulative sum.
+
+The head also carries a balance summary (stock billed, payments, pending)
+that write paths keep current; balance_summaries() recomputes it from the
+raw transactions for reconciliation.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Q, Subquery, Sum, Value, When, Window
+from django.db.models.functions import Coalesce, Round
+from django.db.models.expressions import RowRange
+
+LEDGER_ORDERING = ('transaction_date', 'transaction_time', 'created_at', 'id')
+
+
+def _ledger_key_q(key, strict_lookup, last_lookup):
+    """
+    Build a Q comparing the ledger position of a row against `key`, a
+    (transaction_date, transaction_time, created_at, id) tuple, as a nested
+    lexicographic comparison.
+    """
+    q = Q(**{f'{LEDGER_ORDERING[-1]}__{last_lookup}': key[-1]})
+    for field, value in reversed(list(zip(LEDGER_ORDERING[:-1], key[:-1]))):
+        q = Q(**{f'{field}__{strict_lookup}': value}) | (Q(**{field: value}) & q)
+    return q
+
+
+def ledger_key_after(key):
+    """
+    Q matching transactions at or after `key` in ledger order.
+    """
+    return _ledger_key_q(key, 'gt', 'gte')
+
+
+def ledger_key_before(key):
+    """
+    Q matching transactions strictly before `key` in ledger order.
+    """
+    return _ledger_key_q(key, 'lt', 'lt')
+
+
+def recompute_running_balances(customer_id, start_key=None):
+    """
+    Rewrite running_balance for a customer's transactions from `start_key`
+    (inclusive) to the end of the ledger, or the whole ledger if no key is
+    given. The suffix is anchored on the running balance of the row just
+    before it, so only the affected rows are touched.
+    Returns the number of rows updated.
+    """
+    from .models import Transaction
+
+    ledger_rows = Transaction.objects.filter(customer_id=customer_id)
+    suffix = ledger_rows
+    opening_balance = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+    if start_key is not None:
+        suffix = suffix.filter(ledger_key_after(start_key))
+        previous = ledger_rows.filter(ledger_key_before(start_key)).order_by(
+            *(f'-{field}' for field in LEDGER_ORDERING)
+        ).values('running_balance')[:1]
+        opening_balance = Coalesce(Subquery(previous), opening_balance)
+
+    signed_amount = Case(
+        When(transaction_type='stock', then=F('total')),
+        default=-F('amount_paid'),
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+    suffix = suffix.annotate(
+        new_running_balance=Round(
+            opening_balance + Window(
+                Sum(signed_amount),
+                order_by=[F(field).asc() for field in LEDGER_ORDERING],
+                frame=RowRange(start=None, end=0)
+            ),
+            2
+        )
+    ).order_by().values('id', 'new_running_balance')
+
+    suffix_sql, params = suffix.query.sql_with_params()
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET running_balance = suffix.new_running_balance '
+                f'FROM ({suffix_sql}) AS suffix WHERE {table}.id = suffix.id',
+                params
+            )
+            return cursor.rowcount
+
+
+def balance_summaries(customer_ids=None):
+    """
+    Balance summary of each customer computed from its transactions, in one
+    grouped query: {customer_id: (stock billed, payments received, pending)}.
+    """
+    from .models import Transaction
+
+    transactions = Transaction.objects.all()
+    if customer_ids is not None:
+        transactions = transactions.filter(customer_id__in=customer_ids)
+
+    rows = transactions.order_by().values('customer_id').annotate(
+        stock_amount=Sum('total', filter=Q(transaction_type='stock')),
+        payment_amount=Sum('amount_paid', filter=Q(transaction_type='payment')),
+        pending_amount=Sum('balance', filter=Q(transaction_type='stock'))
+    )
+    return {
+        row['customer_id']: (
+            row['stock_amount'] or 0,
+            row['payment_amount'] or 0,
+            row['pending_amount'] or 0
+        )
+        for row in rows
+    }
+
@@ -0,0 +1,24 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from auth_system.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily purchase and payment rollups from the raw transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            help='First date to rebuild (YYYY-MM-DD); defaults to the earliest',
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Last date to rebuild (YYYY-MM-DD); defaults to the latest',
+        )
+
+    def handle(self, *args, **options):
+        purchase_rows, payment_rows = rebuild_rollups(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {purchase_rows} daily purchase rollups and {payment_rows} daily payment rollups"
+        ))
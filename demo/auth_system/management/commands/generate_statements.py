@@ -0,0 +1,68 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from auth_system.statements import enqueue_month_end_batch, generate_statement, queued_statement_job_ids
+
+class Command(BaseCommand):
+    help = 'Renders queued customer PDF statements in a process pool, optionally queuing a month-end batch first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            type=str,
+            help='Queue statements of this month (YYYY-MM) for all customers first',
+        )
+        parser.add_argument(
+            '--customer',
+            type=int,
+            action='append',
+            help='Limit the --month batch to this customer ID (repeatable)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Render the jobs queued right now and exit instead of polling',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        if options['month']:
+            queued = enqueue_month_end_batch(options['month'], customer_ids=options['customer'], created_by='generate_statements')
+            self.stdout.write(f"Queued {queued} statements for {options['month']}")
+
+        while True:
+            job_ids = queued_statement_job_ids()
+            if not job_ids:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Rendering {len(job_ids)} statements with {options['workers']} workers")
+            completed = failed = 0
+            # Workers open their own database connections; never share the parent's
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+                for job_id, status, error in pool.map(generate_statement, job_ids):
+                    if status == 'completed':
+                        completed += 1
+                    elif status == 'failed':
+                        failed += 1
+                        self.stderr.write(f"Statement job {job_id} failed: {error}")
+
+            self.stdout.write(self.style.SUCCESS(f"Rendered {completed} statements, {failed} failed"))
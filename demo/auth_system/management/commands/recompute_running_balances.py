@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from auth_system.ledger import recompute_running_balances
+from auth_system.models import Transaction, CustomerLedger
+
+class Command(BaseCommand):
+    help = 'Recomputes transaction running balances, e.g. after a bulk import of backdated rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--customer',
+            type=int,
+            help='Recompute only the ledger of a specific customer ID',
+        )
+
+    def handle(self, *args, **options):
+        customer_id = options['customer']
+
+        customer_ids = Transaction.objects.order_by().values_list('customer_id', flat=True).distinct()
+        if customer_id:
+            customer_ids = customer_ids.filter(customer_id=customer_id)
+        customer_ids = list(customer_ids)
+
+        with transaction.atomic():
+            # Lock every head first so no write lands while the ledgers are rebuilt
+            CustomerLedger.lock_many(customer_ids)
+            updated = 0
+            for customer_id in customer_ids:
+                updated += recompute_running_balances(customer_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {updated} running balances for {len(customer_ids)} customers"
+        ))
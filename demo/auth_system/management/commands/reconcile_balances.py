@@ -0,0 +1,66 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from auth_system.ledger import balance_summaries
+from auth_system.models import Transaction, CustomerLedger
+
+class Command(BaseCommand):
+    help = 'Verifies (or with --fix, rebuilds) the customer balance summaries against the raw transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--customer',
+            type=int,
+            help='Reconcile only a specific customer ID',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rewrite summaries that do not match instead of only reporting them',
+        )
+
+    def handle(self, *args, **options):
+        customer_id = options['customer']
+        fix = options['fix']
+
+        customer_ids = Transaction.objects.order_by().values_list('customer_id', flat=True).distinct()
+        if customer_id:
+            customer_ids = customer_ids.filter(customer_id=customer_id)
+        customer_ids = list(customer_ids)
+
+        with transaction.atomic():
+            # Lock the heads so no write changes the totals while comparing
+            ledgers = CustomerLedger.lock_many(customer_ids)
+            expected = balance_summaries(customer_ids)
+
+            mismatched = []
+            zero = Decimal('0')
+            for ledger in ledgers.values():
+                stock_amount, payment_amount, pending_amount = expected.get(ledger.customer_id, (zero, zero, zero))
+                actual = (ledger.total_stock_amount, ledger.total_payments, ledger.total_pending, ledger.running_balance)
+                wanted = (stock_amount, payment_amount, pending_amount, stock_amount - payment_amount)
+                if actual == wanted:
+                    continue
+
+                self.stdout.write(self.style.WARNING(
+                    f"Customer {ledger.customer_id}: stock {actual[0]} (expected {wanted[0]}), "
+                    f"payments {actual[1]} (expected {wanted[1]}), pending {actual[2]} (expected {wanted[2]}), "
+                    f"balance {actual[3]} (expected {wanted[3]})"
+                ))
+                (ledger.total_stock_amount, ledger.total_payments,
+                 ledger.total_pending, ledger.running_balance) = wanted
+                mismatched.append(ledger)
+
+            if fix and mismatched:
+                CustomerLedger.objects.bulk_update(mismatched, [
+                    'total_stock_amount', 'total_payments', 'total_pending', 'running_balance'
+                ])
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS(f"All {len(ledgers)} balance summaries match"))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(mismatched)} of {len(ledgers)} balance summaries"))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f"{len(mismatched)} of {len(ledgers)} balance summaries do not match; run with --fix to rebuild them"
+            ))
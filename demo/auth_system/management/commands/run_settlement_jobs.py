@@ -0,0 +1,51 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from auth_system.settlement import LeaseLost, claim_settlement_job, run_settlement_job
+
+class Command(BaseCommand):
+    help = 'Processes queued bulk settlement jobs (create_bulk_payment?mode=job)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs queued right now and exit instead of polling',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='Take over running jobs that made no progress for this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        once = options['once']
+        poll_interval = options['poll_interval']
+        stale_after = timedelta(seconds=options['stale_after'])
+
+        while True:
+            job = claim_settlement_job(stale_after)
+            if job is None:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            self.stdout.write(f"Processing settlement job {job.id} ({job.total_customers} customers)")
+            try:
+                job = run_settlement_job(job)
+            except LeaseLost as e:
+                self.stdout.write(self.style.WARNING(str(e)))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"Settlement job {job.id} {job.status}: "
+                f"{job.processed_customers - job.failed_customers} settled, {job.failed_customers} failed"
+            ))
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:24
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_ledgers(apps, schema_editor):
+    """
+    Number existing transactions per customer in creation order, recompute
+    their running balances and create the matching ledger heads.
+    """
+    Transaction = apps.get_model('auth_system', 'Transaction')
+    CustomerLedger = apps.get_model('auth_system', 'CustomerLedger')
+
+    customer_ids = Transaction.objects.values_list('customer_id', flat=True).order_by().distinct()
+    for customer_id in customer_ids:
+        transactions = list(
+            Transaction.objects.filter(customer_id=customer_id).order_by('created_at', 'id')
+        )
+        running_balance = Decimal('0')
+        for sequence, txn in enumerate(transactions, start=1):
+            if txn.transaction_type == 'stock':
+                running_balance += txn.total or 0
+            else:
+                running_balance -= txn.amount_paid or 0
+            txn.sequence = sequence
+            txn.running_balance = running_balance
+
+        Transaction.objects.bulk_update(transactions, ['sequence', 'running_balance'], batch_size=500)
+        CustomerLedger.objects.create(
+            customer_id=customer_id,
+            running_balance=running_balance,
+            last_sequence=len(transactions),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('running_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_sequence', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='auth_system.customer')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='sequence',
+            field=models.PositiveBigIntegerField(default=0, help_text="Position of this transaction in the customer's ledger"),
+        ),
+        migrations.RunPython(backfill_ledgers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('customer', 'sequence'), name='unique_transaction_sequence_per_customer'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:27
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def recompute_in_ledger_order(apps, schema_editor):
+    """
+    Running balances now follow transaction date/time rather than creation
+    time. Recompute them in the new order and record each customer's latest
+    ledger position on its head.
+    """
+    Transaction = apps.get_model('auth_system', 'Transaction')
+    CustomerLedger = apps.get_model('auth_system', 'CustomerLedger')
+
+    for ledger in CustomerLedger.objects.all():
+        transactions = list(
+            Transaction.objects.filter(customer_id=ledger.customer_id).order_by(
+                'transaction_date', 'transaction_time', 'created_at', 'id'
+            )
+        )
+        if not transactions:
+            continue
+
+        running_balance = Decimal('0')
+        for txn in transactions:
+            if txn.transaction_type == 'stock':
+                running_balance += txn.total or 0
+            else:
+                running_balance -= txn.amount_paid or 0
+            txn.running_balance = running_balance
+        Transaction.objects.bulk_update(transactions, ['running_balance'], batch_size=500)
+
+        latest = transactions[-1]
+        ledger.last_transaction_date = latest.transaction_date
+        ledger.last_transaction_time = latest.transaction_time
+        ledger.last_created_at = latest.created_at
+        ledger.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0002_customer_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerledger',
+            name='last_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customerledger',
+            name='last_transaction_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customerledger',
+            name='last_transaction_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(recompute_in_ledger_order, migrations.RunPython.noop),
+    ]
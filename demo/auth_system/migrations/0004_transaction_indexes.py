@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0003_ledger_position'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['quality_type'], name='inventory_quality_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['customer', 'created_at'], name='txn_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['customer', 'transaction_date', 'transaction_time', 'created_at'], name='txn_customer_ledger_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['customer', 'transaction_type', 'payment_status'], name='txn_customer_type_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', 'transaction_date'], name='txn_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['payment_type'], name='txn_payment_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('payment_status__in', ['pending', 'partial'])), fields=['customer', 'transaction_type', 'created_at'], name='txn_open_balance_idx'),
+        ),
+    ]
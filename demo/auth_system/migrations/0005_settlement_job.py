@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0004_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('payments', models.JSONField(help_text='The create_bulk_payment request payload')),
+                ('created_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('total_customers', models.PositiveIntegerField(default=0)),
+                ('processed_customers', models.PositiveIntegerField(default=0)),
+                ('failed_customers', models.PositiveIntegerField(default=0)),
+                ('results', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='settlement_job_queue_idx')],
+            },
+        ),
+    ]
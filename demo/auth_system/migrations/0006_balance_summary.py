@@ -0,0 +1,57 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:37
+
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def backfill_balance_summary(apps, schema_editor):
+    """
+    Fill in each ledger head's balance summary from its transactions
+    """
+    Transaction = apps.get_model('auth_system', 'Transaction')
+    CustomerLedger = apps.get_model('auth_system', 'CustomerLedger')
+
+    totals = {
+        row['customer_id']: row
+        for row in Transaction.objects.order_by().values('customer_id').annotate(
+            stock_amount=Sum('total', filter=Q(transaction_type='stock')),
+            payment_amount=Sum('amount_paid', filter=Q(transaction_type='payment')),
+            pending_amount=Sum('balance', filter=Q(transaction_type='stock'))
+        )
+    }
+
+    ledgers = list(CustomerLedger.objects.filter(customer_id__in=totals))
+    for ledger in ledgers:
+        row = totals[ledger.customer_id]
+        ledger.total_stock_amount = row['stock_amount'] or 0
+        ledger.total_payments = row['payment_amount'] or 0
+        ledger.total_pending = row['pending_amount'] or 0
+    CustomerLedger.objects.bulk_update(
+        ledgers, ['total_stock_amount', 'total_payments', 'total_pending'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0005_settlement_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerledger',
+            name='total_payments',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='customerledger',
+            name='total_pending',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='customerledger',
+            name='total_stock_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_balance_summary, migrations.RunPython.noop),
+    ]
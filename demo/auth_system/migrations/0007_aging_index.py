@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0006_balance_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('payment_status__in', ['pending', 'partial']), ('transaction_type', 'stock')), fields=['customer', 'transaction_date', 'balance'], name='txn_open_stock_aging_idx'),
+        ),
+    ]
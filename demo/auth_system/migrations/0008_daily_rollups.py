@@ -0,0 +1,82 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_daily_rollups(apps, schema_editor):
+    """
+    Aggregate the existing transactions into the new rollup tables
+    """
+    Transaction = apps.get_model('auth_system', 'Transaction')
+    DailyPurchaseRollup = apps.get_model('auth_system', 'DailyPurchaseRollup')
+    DailyPaymentRollup = apps.get_model('auth_system', 'DailyPaymentRollup')
+
+    purchases = Transaction.objects.order_by().filter(transaction_type='stock').values(
+        'transaction_date', rollup_quality_type=Coalesce('quality_type', Value(''))
+    ).annotate(rollup_quantity=Sum('quantity'), rollup_total=Sum('total'), rollup_count=Count('id'))
+    DailyPurchaseRollup.objects.bulk_create([
+        DailyPurchaseRollup(
+            date=row['transaction_date'],
+            quality_type=row['rollup_quality_type'],
+            quantity=row['rollup_quantity'] or 0,
+            total_amount=row['rollup_total'] or 0,
+            transaction_count=row['rollup_count']
+        )
+        for row in purchases
+    ], batch_size=500)
+
+    payments = Transaction.objects.order_by().filter(transaction_type='payment').values(
+        'transaction_date', 'bank_account_id', rollup_payment_type=Coalesce('payment_type', Value(''))
+    ).annotate(rollup_amount=Sum('amount_paid'), rollup_count=Count('id'))
+    DailyPaymentRollup.objects.bulk_create([
+        DailyPaymentRollup(
+            date=row['transaction_date'],
+            payment_type=row['rollup_payment_type'],
+            bank_account_id=row['bank_account_id'],
+            amount=row['rollup_amount'] or 0,
+            transaction_count=row['rollup_count']
+        )
+        for row in payments
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0007_aging_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPurchaseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quality_type', models.CharField(blank=True, default='', max_length=50)),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transaction_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'quality_type'), name='unique_purchase_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_type', models.CharField(blank=True, default='', max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('bank_account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='auth_system.bankaccount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('bank_account__isnull', False)), fields=('date', 'payment_type', 'bank_account'), name='unique_payment_rollup'), models.UniqueConstraint(condition=models.Q(('bank_account__isnull', True)), fields=('date', 'payment_type'), name='unique_payment_rollup_no_account')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_rollups, migrations.RunPython.noop),
+    ]
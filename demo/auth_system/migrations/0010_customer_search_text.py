@@ -0,0 +1,97 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:52
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copies of auth_system.search as of this migration, so later changes
+# to the live helpers do not change what it does
+FTS_TABLE = 'auth_system_customer_search'
+SEARCH_FIELDS = ('name', 'email', 'phone_number', 'company_name', 'gst_number', 'pan_number')
+
+
+def search_words(value):
+    return re.findall(r'[^\W_]+', (value or '').lower())
+
+
+def customer_search_text(customer):
+    words = []
+    for field in SEARCH_FIELDS:
+        words += search_words(getattr(customer, field, ''))
+    digits = re.sub(r'\D', '', customer.phone_number or '')
+    for number in (digits, digits[-10:]):
+        if number and number not in words:
+            words.append(number)
+    return ' ' + ' '.join(words) if words else ''
+
+
+def backfill_search_text(apps, schema_editor):
+    """
+    Fill search_text for the existing customers
+    """
+    Customer = apps.get_model('auth_system', 'Customer')
+    customers = list(Customer.objects.all())
+    for customer in customers:
+        customer.search_text = customer_search_text(customer)
+    Customer.objects.bulk_update(customers, ['search_text'], batch_size=500)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "search_text, content='auth_system_customer', content_rowid='id')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON auth_system_customer BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON auth_system_customer BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF search_text ON auth_system_customer BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+            f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END"
+        )
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            available = cursor.fetchone() is not None
+        if not available:
+            return
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS customer_search_text_trgm_idx '
+            'ON auth_system_customer USING gin (search_text gin_trgm_ops)'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for suffix in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS customer_search_text_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0009_statement_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
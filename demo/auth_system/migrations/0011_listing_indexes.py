@@ -0,0 +1,21 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0010_customer_search_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_at', 'id'], name='customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryexpense',
+            index=models.Index(fields=['inventory', 'created_at'], name='expense_inventory_created_idx'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:01
+
+import re
+
+from django.db import migrations, models
+
+
+# Frozen copies of the auth_system.search normalizers as of this migration
+def normalize_phone(value):
+    return re.sub(r'\D', '', value or '')[-10:] or None
+
+
+def normalize_digits(value):
+    return re.sub(r'\D', '', value or '') or None
+
+
+def normalize_code(value):
+    return re.sub(r'[^0-9A-Z]', '', (value or '').upper()) or None
+
+
+IDENTIFIERS = [
+    ('phone_number', 'normalized_phone', normalize_phone),
+    ('aadhaar_number', 'normalized_aadhaar', normalize_digits),
+    ('pan_number', 'normalized_pan', normalize_code),
+    ('gst_number', 'normalized_gst', normalize_code),
+]
+
+
+def backfill_normalized_identifiers(apps, schema_editor):
+    """
+    Fill the normalized identifiers of the existing customers
+    """
+    Customer = apps.get_model('auth_system', 'Customer')
+    customers = list(Customer.objects.all())
+    for customer in customers:
+        for field, normalized_field, normalize in IDENTIFIERS:
+            setattr(customer, normalized_field, normalize(getattr(customer, field)))
+    Customer.objects.bulk_update(
+        customers,
+        ['normalized_phone', 'normalized_aadhaar', 'normalized_pan', 'normalized_gst'],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0011_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='normalized_aadhaar',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='normalized_gst',
+            field=models.CharField(blank=True, editable=False, max_length=15, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='normalized_pan',
+            field=models.CharField(blank=True, editable=False, max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='normalized_phone',
+            field=models.CharField(blank=True, editable=False, max_length=15, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['normalized_phone'], name='customer_phone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['normalized_aadhaar'], name='customer_aadhaar_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['normalized_pan'], name='customer_pan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['normalized_gst'], name='customer_gst_idx'),
+        ),
+        migrations.RunPython(backfill_normalized_identifiers, migrations.RunPython.noop),
+    ]
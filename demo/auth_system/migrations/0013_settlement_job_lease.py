@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0012_normalized_identifiers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='settlementjob',
+            name='lease',
+            field=models.PositiveIntegerField(default=0, help_text='Number of times the job was claimed'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_system', '0013_settlement_job_lease'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='running_balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+    ]
@@ -7,7 +7,17 @@ from auditlog.models import AuditlogHistoryField
 from auditlog.registry import auditlog
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
 import pyotp
+from decimal import Decimal
+from .audit import log_bulk_changes, remember_original
+from .cache import bump_data_version
+from .ledger import LEDGER_ORDERING, recompute_running_balances
+from .search import customer_search_text, set_normalized_identifiers
+from .typeahead import customer_deleted, customer_saved
+from .rollups import add_contribution, apply_rollup_deltas, fold_bank_account, rollup_contribution, update_rollups
 
 ADMIN_PHONE = os.getenv('ADMIN_PHONE')
 ADMIN_EMAIL = os.getenv('ADMIN_EMAIL')
@@ -100,7 +110,9 @@ class Transaction(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    running_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Same precision as CustomerLedger.running_balance, which it is copied from
+    running_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    sequence = models.PositiveBigIntegerField(default=0, help_text="Position of this transaction in the customer's ledger")
     
     bank_account = models.ForeignKey(
         'BankAccount',
@@ -119,6 +131,94 @@ class Transaction(models.Model):
         if not self.transaction_type:
             raise ValidationError("Transaction type must be specified")
             
+        self.set_payment_state()
+
+        # Calculate running balance
+        with transaction.atomic():
+            if not self.pk:
+                # Append to the customer's ledger head instead of looking up
+                # the previous transaction
+                ledger = CustomerLedger.lock_for(self.customer_id)
+                in_order = ledger.append(self)
+                super().save(*args, **kwargs)
+
+                # A backdated row invalidates the running balance of every
+                # later row, so recompute the ledger from here on
+                if not in_order:
+                    recompute_running_balances(self.customer_id, self.ledger_key)
+
+                update_rollups(current=rollup_contribution(self))
+            else:
+                super().save(*args, **kwargs)
+                self.sync_ledger()
+                if hasattr(self, '_rollup_state'):
+                    update_rollups(self._rollup_state, rollup_contribution(self))
+
+            self._ledger_state = self.ledger_state()
+            self._rollup_state = rollup_contribution(self)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the ledger position and amounts as loaded, so edits that
+        # move or resize the transaction can be detected on save
+        if all(field in field_names for field in ('transaction_type', 'total', 'amount_paid', 'balance') + LEDGER_ORDERING):
+            instance._ledger_state = instance.ledger_state()
+        # Same for the daily rollup the transaction is counted in
+        if all(field in field_names for field in (
+            'transaction_type', 'transaction_date', 'quality_type', 'quantity',
+            'total', 'payment_type', 'bank_account_id', 'amount_paid'
+        )):
+            instance._rollup_state = rollup_contribution(instance)
+        return instance
+
+    def sync_ledger(self):
+        """
+        Propagate an edit of an existing transaction's amounts or ledger
+        position to the ledger head and the running balances after it.
+        """
+        previous_state = getattr(self, '_ledger_state', None)
+        if previous_state is None:
+            return
+
+        previous_key, previous_amount, previous_summary = previous_state
+        key, amount, summary = self.ledger_state()
+        if previous_state == (key, amount, summary):
+            return
+
+        ledger = CustomerLedger.lock_for(self.customer_id)
+        ledger.running_balance += amount - previous_amount
+        ledger.add_to_summary(summary)
+        ledger.add_to_summary(previous_summary, sign=-1)
+        ledger.extend_to(key)
+        ledger.save()
+        if (previous_key, previous_amount) != (key, amount):
+            recompute_running_balances(self.customer_id, min(previous_key, key))
+
+    def ledger_state(self):
+        """
+        Ledger position, running balance effect and summary amounts, as
+        compared by sync_ledger to detect edits
+        """
+        return (self.ledger_key, self.ledger_amount, self.summary_amounts)
+
+    @property
+    def ledger_key(self):
+        """
+        Position of this transaction in ledger order (see ledger.LEDGER_ORDERING)
+        """
+        return (
+            self._meta.get_field('transaction_date').to_python(self.transaction_date),
+            self._meta.get_field('transaction_time').to_python(self.transaction_time),
+            self._meta.get_field('created_at').to_python(self.created_at),
+            self.pk
+        )
+
+    def set_payment_state(self):
+        """
+        Derive balance and payment_status before the transaction is written.
+        Also used by bulk writes, which bypass save().
+        """
         if self.transaction_type == 'stock':
             if not self.pk:  # New transaction
                 # Don't override amount_paid and balance if they're already set
@@ -142,22 +242,25 @@ class Transaction(models.Model):
             
             # Removed automatic payment application logic since it's handled in the view
 
-        # Calculate running balance
-        with transaction.atomic():
-            previous_transaction = Transaction.objects.filter(
-                customer=self.customer,
-                created_at__lt=self.created_at
-            ).order_by('-created_at').first()
-
-            if previous_transaction:
-                if self.transaction_type == 'stock':
-                    self.running_balance = previous_transaction.running_balance + self.total
-                else:  # payment
-                    self.running_balance = previous_transaction.running_balance - self.amount_paid
-            else:
-                self.running_balance = self.total if self.transaction_type == 'stock' else -self.amount_paid
+    @property
+    def ledger_amount(self):
+        """
+        Signed effect of this transaction on the customer's running balance
+        """
+        if self.transaction_type == 'stock':
+            return Decimal(str(self.total or 0))
+        return -Decimal(str(self.amount_paid or 0))
 
-            super().save(*args, **kwargs)
+    @property
+    def summary_amounts(self):
+        """
+        What this transaction adds to the customer's balance summary:
+        (stock billed, payments received, pending balance)
+        """
+        zero = Decimal('0')
+        if self.transaction_type == 'stock':
+            return (Decimal(str(self.total or 0)), zero, Decimal(str(self.balance or 0)))
+        return (zero, Decimal(str(self.amount_paid or 0)), zero)
 
     def clean(self):
         if self.payment_type == 'bank' and not self.bank_account:
@@ -170,6 +273,41 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer', 'sequence'],
+                name='unique_transaction_sequence_per_customer'
+            )
+        ]
+        indexes = [
+            # Customer transaction listings, newest first
+            models.Index(fields=['customer', 'created_at'], name='txn_customer_created_idx'),
+            # Ledger order, used by running-balance recomputes
+            models.Index(
+                fields=['customer', 'transaction_date', 'transaction_time', 'created_at'],
+                name='txn_customer_ledger_idx'
+            ),
+            # Per-customer stock/payment totals and status lookups
+            models.Index(
+                fields=['customer', 'transaction_type', 'payment_status'],
+                name='txn_customer_type_status_idx'
+            ),
+            # Purchase and payment insights filtered by date
+            models.Index(fields=['transaction_type', 'transaction_date'], name='txn_type_date_idx'),
+            models.Index(fields=['payment_type'], name='txn_payment_type_idx'),
+            # Open balances only: pending lookups, allocation and aging
+            models.Index(
+                fields=['customer', 'transaction_type', 'created_at'],
+                condition=models.Q(payment_status__in=['pending', 'partial']),
+                name='txn_open_balance_idx'
+            ),
+            # Open stock balances by age: covers the receivables aging report
+            models.Index(
+                fields=['customer', 'transaction_date', 'balance'],
+                condition=models.Q(transaction_type='stock', payment_status__in=['pending', 'partial']),
+                name='txn_open_stock_aging_idx'
+            ),
+        ]
 
 class Customer(models.Model):
     user = models.ForeignKey(
@@ -186,9 +324,28 @@ class Customer(models.Model):
     pan_number = models.CharField(max_length=10, blank=True, null=True)
     aadhaar_number = models.CharField(max_length=12, null=True, blank=True)  # Remove unique constraint temporarily
     company_name = models.CharField(max_length=100, blank=True)
+    # Normalized name/email/phone/company/GST/PAN words, indexed for
+    # search_customers (see search.py); rewritten on every save
+    search_text = models.TextField(blank=True, default='', editable=False)
+    # Identifiers normalized for indexed exact lookups (see search.IDENTIFIERS):
+    # phone digits without country code, Aadhaar digits, PAN/GST upper-cased
+    normalized_phone = models.CharField(max_length=15, null=True, blank=True, editable=False)
+    normalized_aadhaar = models.CharField(max_length=12, null=True, blank=True, editable=False)
+    normalized_pan = models.CharField(max_length=10, null=True, blank=True, editable=False)
+    normalized_gst = models.CharField(max_length=15, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    DERIVED_FIELDS = ['search_text', 'normalized_phone', 'normalized_aadhaar', 'normalized_pan', 'normalized_gst']
+
+    def save(self, *args, **kwargs):
+        self.search_text = customer_search_text(self)
+        set_normalized_identifiers(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.DERIVED_FIELDS)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -196,6 +353,15 @@ class Customer(models.Model):
         permissions = [
             ("can_edit_sensitive_info", "Can edit sensitive information like Aadhaar and PAN")
         ]
+        indexes = [
+            # Customer listing, newest first, paged by (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='customer_created_idx'),
+            # Exact identifier lookups and duplicate checks
+            models.Index(fields=['normalized_phone'], name='customer_phone_idx'),
+            models.Index(fields=['normalized_aadhaar'], name='customer_aadhaar_idx'),
+            models.Index(fields=['normalized_pan'], name='customer_pan_idx'),
+            models.Index(fields=['normalized_gst'], name='customer_gst_idx'),
+        ]
 
 class BankAccount(models.Model):
     customer = models.ForeignKey(
@@ -232,6 +398,242 @@ class BankAccount(models.Model):
     def __str__(self):
         return f"{self.bank_name} - {self.account_number}"
 
+class CustomerLedger(models.Model):
+    """
+    Denormalized head of a customer's transaction ledger.
+    Holds the current running balance and the last sequence number handed out,
+    so a new transaction can be appended without scanning earlier rows, and a
+    balance summary (stock billed, payments, pending) kept up to date in the
+    same transaction as every write. reconcile_balances rebuilds it.
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, related_name='ledger')
+    running_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_sequence = models.PositiveBigIntegerField(default=0)
+    # Balance summary
+    total_stock_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_payments = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_pending = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Ledger position of the latest transaction, used to detect backdated inserts
+    last_transaction_date = models.DateField(null=True, blank=True)
+    last_transaction_time = models.TimeField(null=True, blank=True)
+    last_created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def lock_for(cls, customer_id):
+        """
+        Fetch (creating if needed) the ledger head for a customer, locked for
+        the rest of the current transaction.
+        """
+        ledger, created = cls.objects.select_for_update().get_or_create(customer_id=customer_id)
+        return ledger
+
+    @classmethod
+    def lock_many(cls, customer_ids):
+        """
+        Bulk version of lock_for. Heads are locked in customer order so that
+        concurrent batches cannot deadlock. Returns a dict keyed by customer id.
+        """
+        customer_ids = sorted(set(customer_ids))
+        cls.objects.bulk_create(
+            [cls(customer_id=customer_id) for customer_id in customer_ids],
+            ignore_conflicts=True
+        )
+        ledgers = cls.objects.select_for_update().filter(
+            customer_id__in=customer_ids
+        ).order_by('customer_id')
+        return {ledger.customer_id: ledger for ledger in ledgers}
+
+    @classmethod
+    def summary_for(cls, customer_id):
+        """
+        Ledger head of a customer for reading the balance summary, unlocked.
+        Customers without transactions get an empty, unsaved head.
+        """
+        return cls.objects.filter(customer_id=customer_id).first() or cls(customer_id=customer_id)
+
+    @property
+    def advance_amount(self):
+        """
+        Payments received beyond the stock billed so far (negative if the
+        customer owes money)
+        """
+        return self.total_payments - self.total_stock_amount
+
+    def add_to_summary(self, amounts, sign=1):
+        stock_amount, payment_amount, pending_amount = amounts
+        self.total_stock_amount += sign * stock_amount
+        self.total_payments += sign * payment_amount
+        self.total_pending += sign * pending_amount
+
+    def extend_to(self, key):
+        """
+        Move the recorded latest ledger position forward to `key` if it is
+        later. Returns False if `key` sorts before the current position.
+        """
+        position = key[:3]
+        latest = (self.last_transaction_date, self.last_transaction_time, self.last_created_at)
+        if self.last_transaction_date is not None and position < latest:
+            return False
+        self.last_transaction_date, self.last_transaction_time, self.last_created_at = position
+        return True
+
+    def assign(self, txn):
+        """
+        Give an unsaved transaction the next sequence number and running
+        balance, advancing the head in memory only.
+        Returns False if the transaction is backdated, in which case its
+        running balance (and every later one) still has to be recomputed.
+        """
+        self.last_sequence += 1
+        self.running_balance += txn.ledger_amount
+        self.add_to_summary(txn.summary_amounts)
+        txn.sequence = self.last_sequence
+        txn.running_balance = self.running_balance
+        return self.extend_to(txn.ledger_key)
+
+    def append(self, txn):
+        """
+        Assign the next sequence number and running balance to an unsaved
+        transaction and persist the new head.
+        """
+        in_order = self.assign(txn)
+        self.save()
+        return in_order
+
+    @classmethod
+    def append_many(cls, transactions, ledgers=None):
+        """
+        Write a batch of new transactions with a single bulk insert, numbering
+        them in list order. Pass `ledgers` (from lock_many) if the heads are
+        already locked. bulk_create bypasses Transaction.save, so payment state
+        and the audit log entries are taken care of here.
+        """
+        if not transactions:
+            return []
+
+        with transaction.atomic():
+            if ledgers is None:
+                ledgers = cls.lock_many(txn.customer_id for txn in transactions)
+
+            backdated = []
+            for txn in transactions:
+                txn.set_payment_state()
+                if not ledgers[txn.customer_id].assign(txn):
+                    backdated.append(txn)
+
+            created = Transaction.objects.bulk_create(transactions)
+            log_bulk_changes(created=created)
+            bump_data_version()
+
+            # Fold the whole batch into the daily rollups at once
+            rollup_deltas = {}
+            for txn in created:
+                txn._rollup_state = rollup_contribution(txn)
+                add_contribution(rollup_deltas, txn._rollup_state)
+            apply_rollup_deltas(rollup_deltas)
+
+            now = timezone.now()
+            heads = [ledgers[customer_id] for customer_id in {txn.customer_id for txn in transactions}]
+            for ledger in heads:
+                ledger.updated_at = now
+            cls.objects.bulk_update(heads, [
+                'last_sequence', 'running_balance', 'last_transaction_date',
+                'last_transaction_time', 'last_created_at', 'total_stock_amount',
+                'total_payments', 'total_pending', 'updated_at'
+            ])
+
+            # One recompute per customer, from its earliest backdated row
+            earliest = {}
+            for txn in backdated:
+                key = txn.ledger_key
+                if txn.customer_id not in earliest or key < earliest[txn.customer_id]:
+                    earliest[txn.customer_id] = key
+            for customer_id, key in earliest.items():
+                recompute_running_balances(customer_id, key)
+
+        for txn in created:
+            txn._ledger_state = txn.ledger_state()
+        return created
+
+    @classmethod
+    def sync_many(cls, transactions, ledgers=None):
+        """
+        Bulk version of Transaction.sync_ledger for rows just written with
+        bulk_update (e.g. payment allocations): folds the change in each
+        row's amounts into its customer's head and writes the heads with one
+        bulk_update. Pass `ledgers` (from lock_many) if the heads are already
+        locked and loaded. Edits that move a row in ledger order still go
+        through save().
+        """
+        zero = Decimal('0')
+        deltas = {}
+        recompute_from = {}
+        for txn in transactions:
+            previous_state = getattr(txn, '_ledger_state', None)
+            if previous_state is None:
+                continue
+            state = txn.ledger_state()
+            if state == previous_state:
+                continue
+
+            previous_key, previous_amount, previous_summary = previous_state
+            key, amount, summary = state
+            delta = deltas.setdefault(txn.customer_id, [zero, zero, zero, zero])
+            delta[0] += amount - previous_amount
+            for index in range(3):
+                delta[index + 1] += summary[index] - previous_summary[index]
+            if amount != previous_amount:
+                start_key = min(previous_key, key)
+                recompute_from[txn.customer_id] = min(recompute_from.get(txn.customer_id, start_key), start_key)
+            txn._ledger_state = state
+
+        if not deltas:
+            return
+
+        with transaction.atomic():
+            if ledgers is None:
+                ledgers = cls.lock_many(deltas)
+
+            now = timezone.now()
+            heads = []
+            for customer_id, (running, stock_amount, payment_amount, pending_amount) in deltas.items():
+                ledger = ledgers[customer_id]
+                ledger.running_balance += running
+                ledger.add_to_summary((stock_amount, payment_amount, pending_amount))
+                ledger.updated_at = now
+                heads.append(ledger)
+            cls.objects.bulk_update(heads, [
+                'running_balance', 'total_stock_amount', 'total_payments', 'total_pending', 'updated_at'
+            ])
+            bump_data_version()
+
+            for customer_id, start_key in recompute_from.items():
+                recompute_running_balances(customer_id, start_key)
+
+    def __str__(self):
+        return f"Ledger for {self.customer.name} - {self.running_balance}"
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_from_ledger(sender, instance, **kwargs):
+    ledger = CustomerLedger.objects.select_for_update().filter(customer_id=instance.customer_id).first()
+    if ledger is None:
+        # The customer (and its ledger) is being deleted as well
+        return
+    ledger.running_balance -= instance.ledger_amount
+    ledger.add_to_summary(instance.summary_amounts, sign=-1)
+    ledger.save(update_fields=['running_balance', 'total_stock_amount', 'total_payments', 'total_pending', 'updated_at'])
+    recompute_running_balances(instance.customer_id, instance.ledger_key)
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_from_rollups(sender, instance, **kwargs):
+    update_rollups(previous=rollup_contribution(instance))
+
+@receiver(pre_delete, sender=BankAccount)
+def fold_bank_account_rollups(sender, instance, **kwargs):
+    # The account's payments keep their amounts but lose the account
+    fold_bank_account(instance.id)
+
 # Register models with auditlog
 auditlog.register(CustomUser)
 auditlog.register(Transaction)
@@ -255,14 +657,68 @@ class Inventory(models.Model):
     class Meta:
         unique_together = ('customer', 'quality_type')
         verbose_name_plural = 'Inventories'
+        indexes = [
+            models.Index(fields=['quality_type'], name='inventory_quality_type_idx'),
+        ]
 
     def save(self, *args, **kwargs):
+        self.update_avg_cost()
+        super().save(*args, **kwargs)
+
+    def update_avg_cost(self):
         # Calculate average cost if quantity is greater than 0
         if self.quantity > 0:
             self.avg_cost = self.total_cost / self.quantity
         else:
             self.avg_cost = 0
-        super().save(*args, **kwargs)
+
+    @classmethod
+    def apply_deltas(cls, deltas, created_by=None):
+        """
+        Add coalesced stock movements to inventory in one pass.
+        `deltas` maps (customer_id, quality_type) to a (quantity, total_cost)
+        pair; existing rows are locked and updated together and missing rows
+        are created together, with their audit log entries.
+        """
+        if not deltas:
+            return []
+
+        existing = cls.objects.select_for_update(of=('self',)).select_related('customer').filter(
+            customer_id__in={customer_id for customer_id, _ in deltas},
+            quality_type__in={quality_type for _, quality_type in deltas}
+        )
+        items = {(item.customer_id, item.quality_type): item for item in existing}
+
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for (customer_id, quality_type), (quantity, total_cost) in deltas.items():
+            item = items.get((customer_id, quality_type))
+            if item is None:
+                item = cls(
+                    customer_id=customer_id,
+                    quality_type=quality_type,
+                    quantity=Decimal('0'),
+                    total_cost=Decimal('0'),
+                    created_by=created_by
+                )
+                to_create.append(item)
+            else:
+                remember_original(item)
+                to_update.append(item)
+
+            item.quantity += quantity
+            item.total_cost += total_cost
+            item.update_avg_cost()
+            item.updated_at = now
+
+        cls.objects.bulk_create(to_create)
+        cls.objects.bulk_update(to_update, ['quantity', 'total_cost', 'avg_cost', 'updated_at'])
+        # Entries name the customer, load them together
+        prefetch_related_objects(to_create, 'customer')
+        log_bulk_changes(created=to_create, updated=to_update)
+        bump_data_version()
+        return to_create + to_update
 
     def __str__(self):
         return f"{self.customer.name} - {self.quality_type} - {self.quantity}"
@@ -284,9 +740,165 @@ class InventoryExpense(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.CharField(max_length=100, blank=True, null=True)
     
+    class Meta:
+        indexes = [
+            # Expense history per inventory item, newest first
+            models.Index(fields=['inventory', 'created_at'], name='expense_inventory_created_idx'),
+        ]
+    
     def __str__(self):
         return f"Expense for {self.inventory.customer.name} - {self.inventory.quality_type}"
 
 # Register new models with auditlog
 auditlog.register(Inventory)
 auditlog.register(InventoryExpense)
+
+# Any change to the data behind the insight and inventory reports moves the
+# report cache to a new version (see cache.py)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+@receiver(post_save, sender=InventoryExpense)
+@receiver(post_delete, sender=InventoryExpense)
+def invalidate_report_cache(sender, instance, **kwargs):
+    bump_data_version()
+
+@receiver(post_save, sender=Customer)
+def update_customer_typeahead(sender, instance, **kwargs):
+    customer_saved(instance)
+
+@receiver(post_delete, sender=Customer)
+def remove_customer_from_typeahead(sender, instance, **kwargs):
+    customer_deleted(instance.id)
+
+class SettlementJob(models.Model):
+    """
+    A create_bulk_payment batch queued for background processing by the
+    run_settlement_jobs command. Each customer's payments are settled and
+    recorded in `results` in one transaction, so a job that is interrupted
+    picks up with the customers it has not finished yet. `lease` is bumped
+    on every claim and checked with the job row locked before each customer
+    is committed, so a worker whose job was taken over stops.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    payments = models.JSONField(help_text="The create_bulk_payment request payload")
+    created_by = models.CharField(max_length=100, blank=True, null=True)
+    total_customers = models.PositiveIntegerField(default=0)
+    processed_customers = models.PositiveIntegerField(default=0)
+    failed_customers = models.PositiveIntegerField(default=0)
+    # Per-customer outcome keyed by customer id
+    results = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, null=True)
+    lease = models.PositiveIntegerField(default=0, help_text="Number of times the job was claimed")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='settlement_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Settlement job {self.id} ({self.status})"
+
+class DailyPurchaseRollup(models.Model):
+    """
+    Stock transactions aggregated per (transaction_date, quality_type), kept
+    current on every write (see rollups.py) so purchase insights cost
+    depends on the number of days, not of transactions.
+    """
+    date = models.DateField()
+    # '' stands for transactions without a quality type
+    quality_type = models.CharField(max_length=50, blank=True, default='')
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'quality_type'], name='unique_purchase_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.quality_type} - {self.total_amount}"
+
+class DailyPaymentRollup(models.Model):
+    """
+    Payment transactions aggregated per (transaction_date, payment_type,
+    bank_account), kept current on every write (see rollups.py).
+    """
+    date = models.DateField()
+    # '' stands for payments without a payment type
+    payment_type = models.CharField(max_length=20, blank=True, default='')
+    # Rows of a deleted account are folded into the no-account row first
+    bank_account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, null=True, blank=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'payment_type', 'bank_account'],
+                condition=models.Q(bank_account__isnull=False),
+                name='unique_payment_rollup'
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'payment_type'],
+                condition=models.Q(bank_account__isnull=True),
+                name='unique_payment_rollup_no_account'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.payment_type} - {self.amount}"
+
+class StatementJob(models.Model):
+    """
+    A customer PDF statement for one period, rendered in the background by
+    the generate_statements command and stored under STATEMENTS_ROOT.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='statement_jobs')
+    period_start = models.DateField()
+    period_end = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # Month-end batches share a label such as '2026-09'
+    batch = models.CharField(max_length=20, blank=True, null=True)
+    opening_balance = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    closing_balance = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    # Relative to STATEMENTS_ROOT
+    file_path = models.CharField(max_length=255, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_by = models.CharField(max_length=100, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='statement_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Statement {self.period_start} - {self.period_end} for {self.customer_id} ({self.status})"
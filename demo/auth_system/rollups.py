@@ -0,0 +1,183 @@
+"""
+Daily rollups of purchases and payments.
+
+DailyPurchaseRollup holds stock quantity, amount and count per
+(transaction_date, quality_type); DailyPaymentRollup holds payment amount and
+count per (transaction_date, payment_type, bank_account). Every Transaction
+write folds its contribution into the matching row in the same database
+transaction: save() and the post_delete receiver one row at a time,
+CustomerLedger.append_many once per batch. rebuild_rollups() recomputes them
+from the raw transactions (backfill_rollups command).
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .cache import bump_data_version
+
+ROLLUP_AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+def rollup_contribution(txn):
+    """
+    What a transaction adds to the daily rollups, as comparable tuples:
+    (rollup model, key fields, amount fields), or None.
+    """
+    from .models import DailyPaymentRollup, DailyPurchaseRollup
+
+    date = txn._meta.get_field('transaction_date').to_python(txn.transaction_date)
+    if txn.transaction_type == 'stock':
+        return (
+            DailyPurchaseRollup,
+            (('date', date), ('quality_type', txn.quality_type or '')),
+            (
+                ('quantity', Decimal(str(txn.quantity or 0))),
+                ('total_amount', Decimal(str(txn.total or 0))),
+                ('transaction_count', 1),
+            )
+        )
+    if txn.transaction_type == 'payment':
+        return (
+            DailyPaymentRollup,
+            (('date', date), ('payment_type', txn.payment_type or ''), ('bank_account_id', txn.bank_account_id)),
+            (
+                ('amount', Decimal(str(txn.amount_paid or 0))),
+                ('transaction_count', 1),
+            )
+        )
+    return None
+
+
+def add_contribution(deltas, contribution, sign=1):
+    """
+    Accumulate a contribution into `deltas`, keyed by (model, key fields)
+    """
+    if contribution is None:
+        return
+    model, key, amounts = contribution
+    totals = deltas.setdefault((model, key), {})
+    for field, value in amounts:
+        totals[field] = totals.get(field, 0) + sign * value
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Write accumulated deltas: create missing rollup rows, then increment
+    each one with a single UPDATE, in a fixed order so concurrent writers
+    lock rows in the same sequence.
+    """
+    by_model = {}
+    for (model, key), amounts in deltas.items():
+        if any(amounts.values()):
+            by_model.setdefault(model, []).append((key, amounts))
+
+    for model in sorted(by_model, key=lambda model: model.__name__):
+        entries = sorted(by_model[model], key=lambda entry: [str(value) for _, value in entry[0]])
+        model.objects.bulk_create(
+            [model(**dict(key)) for key, _ in entries],
+            ignore_conflicts=True
+        )
+        for key, amounts in entries:
+            model.objects.filter(**dict(key)).update(
+                **{field: F(field) + value for field, value in amounts.items()}
+            )
+
+
+def update_rollups(previous=None, current=None):
+    """
+    Replace one transaction's `previous` contribution with `current`
+    (either may be None for inserts and deletes).
+    """
+    if previous == current:
+        return
+    deltas = {}
+    add_contribution(deltas, previous, sign=-1)
+    add_contribution(deltas, current)
+    apply_rollup_deltas(deltas)
+
+
+def fold_bank_account(bank_account_id):
+    """
+    Move a bank account's payment rollups to the no-account rows, as its
+    payments lose the account when it is deleted
+    """
+    from .models import DailyPaymentRollup
+
+    deltas = {}
+    for rollup in DailyPaymentRollup.objects.filter(bank_account_id=bank_account_id):
+        add_contribution(deltas, (
+            DailyPaymentRollup,
+            (('date', rollup.date), ('payment_type', rollup.payment_type), ('bank_account_id', None)),
+            (('amount', rollup.amount), ('transaction_count', rollup.transaction_count))
+        ))
+    apply_rollup_deltas(deltas)
+
+
+def rebuild_rollups(start=None, end=None):
+    """
+    Recompute the rollups for dates in [start, end] (all dates by default)
+    from the raw transactions. Returns (purchase rows, payment rows) written.
+    """
+    from .models import DailyPaymentRollup, DailyPurchaseRollup, Transaction
+
+    date_filter = {}
+    if start:
+        date_filter['__gte'] = start
+    if end:
+        date_filter['__lte'] = end
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Keep transaction writes out until the rebuilt rows are in place
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {Transaction._meta.db_table} IN SHARE MODE')
+
+        transactions = Transaction.objects.order_by().filter(
+            **{f'transaction_date{lookup}': value for lookup, value in date_filter.items()}
+        )
+
+        DailyPurchaseRollup.objects.filter(
+            **{f'date{lookup}': value for lookup, value in date_filter.items()}
+        ).delete()
+        purchases = transactions.filter(transaction_type='stock').values(
+            'transaction_date', rollup_quality_type=Coalesce('quality_type', Value(''))
+        ).annotate(
+            rollup_quantity=Coalesce(Sum('quantity'), Value(Decimal('0')), output_field=ROLLUP_AMOUNT),
+            rollup_total=Coalesce(Sum('total'), Value(Decimal('0')), output_field=ROLLUP_AMOUNT),
+            rollup_count=Count('id')
+        )
+        purchase_rollups = DailyPurchaseRollup.objects.bulk_create([
+            DailyPurchaseRollup(
+                date=row['transaction_date'],
+                quality_type=row['rollup_quality_type'],
+                quantity=row['rollup_quantity'],
+                total_amount=row['rollup_total'],
+                transaction_count=row['rollup_count']
+            )
+            for row in purchases
+        ], batch_size=500)
+
+        DailyPaymentRollup.objects.filter(
+            **{f'date{lookup}': value for lookup, value in date_filter.items()}
+        ).delete()
+        payments = transactions.filter(transaction_type='payment').values(
+            'transaction_date', 'bank_account_id', rollup_payment_type=Coalesce('payment_type', Value(''))
+        ).annotate(
+            rollup_amount=Coalesce(Sum('amount_paid'), Value(Decimal('0')), output_field=ROLLUP_AMOUNT),
+            rollup_count=Count('id')
+        )
+        payment_rollups = DailyPaymentRollup.objects.bulk_create([
+            DailyPaymentRollup(
+                date=row['transaction_date'],
+                payment_type=row['rollup_payment_type'],
+                bank_account_id=row['bank_account_id'],
+                amount=row['rollup_amount'],
+                transaction_count=row['rollup_count']
+            )
+            for row in payments
+        ], batch_size=500)
+
+    bump_data_version()
+    return len(purchase_rollups), len(payment_rollups)
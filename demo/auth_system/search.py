@@ -0,0 +1,256 @@
+"""
+Indexed customer search.
+
+Customer.search_text holds the searchable fields (name, email, phone,
+company, GST, PAN) lower-cased and split into words, plus the phone's digits
+run together, and is rewritten on every save. Each search term must match the
+start of a word, all terms must match, and results are ranked:
+
+- SQLite: an external-content FTS5 table over search_text, kept in sync by
+  triggers on the customer table, queried with prefix terms and ranked by
+  bm25. Migrations that rebuild the customer table (SQLite does that for
+  most ALTERs) drop the triggers, so install_search_index runs again after
+  every migrate (AuthSystemConfig.ready connects reinstall_search_index to
+  post_migrate).
+- PostgreSQL: a pg_trgm GIN index on search_text serves the word-prefix
+  LIKE filters; ranked by word_similarity to the query.
+- Other backends (and PostgreSQL servers without pg_trgm): the same LIKE
+  filters without an index, in id order.
+
+Results are capped at MAX_SEARCH_RESULTS per request and continue with a
+cursor over (rank, id).
+
+Exact lookups by identifier (IDENTIFIERS) use the normalized_* columns
+instead, each with a plain B-tree index and also rewritten on every save.
+"""
+import base64
+import json
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+
+MAX_SEARCH_RESULTS = 100
+FTS_TABLE = 'auth_system_customer_search'
+SEARCH_FIELDS = ('name', 'email', 'phone_number', 'company_name', 'gst_number', 'pan_number')
+
+
+def search_words(value):
+    return re.findall(r'[^\W_]+', (value or '').lower())
+
+
+def customer_search_text(customer):
+    """
+    Normalized search_text of a customer (or a historical model instance).
+    Words are separated and preceded by single spaces, so ' ' + term matches
+    the start of any word.
+    """
+    words = []
+    for field in SEARCH_FIELDS:
+        words += search_words(getattr(customer, field, ''))
+    digits = re.sub(r'\D', '', customer.phone_number or '')
+    # Whole number, and without a country code so local numbers match too
+    for number in (digits, digits[-10:]):
+        if number and number not in words:
+            words.append(number)
+    return ' ' + ' '.join(words) if words else ''
+
+
+def normalize_phone(value):
+    # Digits only, without a country code
+    return re.sub(r'\D', '', value or '')[-10:] or None
+
+
+def normalize_digits(value):
+    return re.sub(r'\D', '', value or '') or None
+
+
+def normalize_code(value):
+    # PAN/GST: upper case, no spaces or separators
+    return re.sub(r'[^0-9A-Z]', '', (value or '').upper()) or None
+
+
+# Exact-lookup columns: (lookup parameter, source field, normalized field, normalizer)
+IDENTIFIERS = [
+    ('phone', 'phone_number', 'normalized_phone', normalize_phone),
+    ('aadhaar', 'aadhaar_number', 'normalized_aadhaar', normalize_digits),
+    ('pan', 'pan_number', 'normalized_pan', normalize_code),
+    ('gst', 'gst_number', 'normalized_gst', normalize_code),
+]
+
+
+def set_normalized_identifiers(customer):
+    for _, field, normalized_field, normalize in IDENTIFIERS:
+        setattr(customer, normalized_field, normalize(getattr(customer, field)))
+
+
+def identifier_filter(params):
+    """
+    Q matching customers with any of the identifiers given in `params`
+    (phone/aadhaar/pan/gst), or None if none is given
+    """
+    q = None
+    for name, _, normalized_field, normalize in IDENTIFIERS:
+        value = normalize(params.get(name))
+        if value:
+            condition = Q(**{normalized_field: value})
+            q = condition if q is None else q | condition
+    return q
+
+
+def duplicate_identifier(data):
+    """
+    Label of the first unique identifier (Aadhaar, PAN, GST) in `data` that
+    another customer already has, or None; one index probe per identifier
+    """
+    from .models import Customer
+
+    labels = {'aadhaar_number': 'Aadhaar number', 'pan_number': 'PAN', 'gst_number': 'GST number'}
+    for _, field, normalized_field, normalize in IDENTIFIERS:
+        value = normalize(data.get(field)) if field in labels else None
+        if value and Customer.objects.filter(**{normalized_field: value}).exists():
+            return labels[field]
+    return None
+
+
+def install_search_index(schema_editor):
+    """
+    Create the backend's search index over auth_system_customer.search_text
+    (idempotent). Run after every migrate by reinstall_search_index.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "search_text, content='auth_system_customer', content_rowid='id')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON auth_system_customer BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON auth_system_customer BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF search_text ON auth_system_customer BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+            f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END"
+        )
+        # Index whatever the table already holds
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            available = cursor.fetchone() is not None
+        if not available:
+            # Server without the contrib extensions: search still works,
+            # unindexed and unranked
+            return
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS customer_search_text_trgm_idx '
+            'ON auth_system_customer USING gin (search_text gin_trgm_ops)'
+        )
+
+
+def reinstall_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate handler: put back the triggers a table-remaking migration
+    dropped. Skipped until search_text exists (before migration 0010).
+    """
+    target = connections[using]
+    with target.cursor() as cursor:
+        if 'auth_system_customer' not in target.introspection.table_names(cursor):
+            return
+        columns = [column.name for column in target.introspection.get_table_description(cursor, 'auth_system_customer')]
+    if 'search_text' not in columns:
+        return
+    with target.schema_editor() as schema_editor:
+        install_search_index(schema_editor)
+
+
+_trigram_installed = None
+
+
+def _has_trigram():
+    # Checked once per process; the extension comes with the migrations
+    global _trigram_installed
+    if _trigram_installed is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_installed = cursor.fetchone() is not None
+    return _trigram_installed
+
+
+def _encode_cursor(rank, customer_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, customer_id]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        rank, customer_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return float(rank), int(customer_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def _fts_ranked_ids(terms, after, limit):
+    """
+    (bm25, id) pairs of customers matching every term as a word prefix,
+    best first (bm25 is lower for better matches)
+    """
+    match = ' '.join(f'"{term}"*' for term in terms)
+    sql = f'SELECT rowid, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    params = [match]
+    if after:
+        sql += f' AND (bm25({FTS_TABLE}) > %s OR (bm25({FTS_TABLE}) = %s AND rowid > %s))'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY score, rowid LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(score, customer_id) for customer_id, score in cursor.fetchall()]
+
+
+def search_customers_page(queryset, query, cursor=None, limit=MAX_SEARCH_RESULTS):
+    """
+    One ranked page of the customers in `queryset` matching `query`.
+    Returns (customers, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for a malformed cursor.
+    """
+    terms = search_words(query)
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    after = _decode_cursor(cursor) if cursor else None
+    if not terms:
+        return [], None
+
+    if connection.vendor == 'sqlite':
+        ranked = _fts_ranked_ids(terms, after, limit + 1)
+        page = ranked[:limit]
+        next_cursor = _encode_cursor(*page[-1]) if len(ranked) > limit else None
+        # Matches outside `queryset` are dropped after ranking
+        customers = queryset.in_bulk([customer_id for _, customer_id in page])
+        return [customers[customer_id] for _, customer_id in page if customer_id in customers], next_cursor
+
+    matches = queryset
+    for term in terms:
+        matches = matches.filter(search_text__contains=' ' + term)
+
+    if connection.vendor == 'postgresql' and _has_trigram():
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        matches = matches.annotate(search_rank=TrigramWordSimilarity(' '.join(terms), 'search_text'))
+        if after:
+            matches = matches.filter(Q(search_rank__lt=after[0]) | Q(search_rank=after[0], id__gt=after[1]))
+        customers = list(matches.order_by('-search_rank', 'id')[:limit + 1])
+    else:
+        if after:
+            matches = matches.filter(id__gt=after[1])
+        customers = list(matches.order_by('id')[:limit + 1])
+
+    if len(customers) <= limit:
+        return customers, None
+    customers = customers[:limit]
+    last = customers[-1]
+    return customers, _encode_cursor(getattr(last, 'search_rank', 0), last.id)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Customer, Transaction, BankAccount, Inventory, InventoryExpense
+from .models import Customer, Transaction, BankAccount, Inventory, InventoryExpense, SettlementJob, StatementJob
+from django.urls import reverse
 from django.utils import timezone
 
 User = get_user_model()
@@ -24,8 +25,33 @@ class BankAccountSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id']
         
-class CustomerSerializer(serializers.ModelSerializer):
-    bank_accounts = serializers.SerializerMethodField()
+def fields_from(request):
+    """
+    Field names requested with ?fields=id,name,..., or None for all fields
+    """
+    fields = request.GET.get('fields')
+    if not fields:
+        return None
+    return [name.strip() for name in fields.split(',') if name.strip()]
+
+class SparseFieldsMixin:
+    """
+    Accepts a `fields` argument (see fields_from) and serializes only those
+    fields. Raises ValueError for names the serializer does not have.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            unknown = set(fields) - set(self.fields)
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Reads the bank_accounts relation, so list views can prefetch it
+    bank_accounts = BankAccountSerializer(many=True, read_only=True)
     
     class Meta:
         model = Customer
@@ -36,11 +62,25 @@ class CustomerSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at']
 
-    def get_bank_accounts(self, obj):
-        bank_accounts = BankAccount.objects.filter(customer=obj)
-        return BankAccountSerializer(bank_accounts, many=True).data
+class CustomerPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Customer reference that resolves against a `customers` dict in the
+    serializer context when one is given, so batch endpoints can load all
+    customers with a single in_bulk() instead of one query per row.
+    """
+    def to_internal_value(self, data):
+        customers = self.context.get('customers')
+        if customers is None:
+            return super().to_internal_value(data)
+        try:
+            return customers[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    customer = CustomerPrimaryKeyField(queryset=Customer.objects.all())
     customer_name = serializers.SerializerMethodField()
     customer_phone = serializers.CharField(source='customer.phone_number', read_only=True)
     bank_account = BankAccountSerializer(read_only=True)
@@ -163,3 +203,46 @@ class InventoryExpenseSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'created_by']
 
+class SettlementJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for bulk settlement job status
+    """
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SettlementJob
+        fields = [
+            'id', 'status', 'created_by', 'total_customers',
+            'processed_customers', 'failed_customers', 'progress',
+            'results', 'error', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        if not obj.total_customers:
+            return 100.0
+        return round(obj.processed_customers * 100 / obj.total_customers, 1)
+
+class StatementJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for PDF statement job status
+    """
+    customer_name = serializers.CharField(source='customer.name', read_only=True)
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StatementJob
+        fields = [
+            'id', 'customer', 'customer_name', 'period_start', 'period_end',
+            'status', 'batch', 'opening_balance', 'closing_balance',
+            'download_url', 'error', 'created_by', 'created_at',
+            'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != 'completed':
+            return None
+        url = reverse('download_statement', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
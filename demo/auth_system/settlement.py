@@ -0,0 +1,284 @@
+"""
+Bulk settlement: record a batch of customer payments and allocate each one
+to the customer's pending stock transactions, oldest first.
+
+Batches can be settled right away (settle_payments) or queued as a
+SettlementJob and worked off by the run_settlement_jobs command, one
+customer per transaction.
+
+A worker that stalls can have its job taken over by another one. Each claim
+bumps the job's lease. Before each customer, the worker locks the job row
+and checks that its lease is still current and that the customer is not in
+the results yet, so a customer is never settled twice.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .allocation import OPEN_PAYMENT_STATUSES, allocation_ordering, plan_automatic_allocation, settle
+from .audit import log_bulk_changes
+from .models import BankAccount, Customer, CustomerLedger, SettlementJob, Transaction
+from .serializers import TransactionSerializer
+
+
+def load_batch_references(payments_data):
+    """
+    Fetch the customers and bank accounts a batch of payments refers to,
+    one query each. Raises ValidationError if any of them does not exist.
+    """
+    customer_ids = {int(payment.get('customer_id')) for payment in payments_data}
+    customers = Customer.objects.in_bulk(customer_ids)
+    if len(customers) != len(customer_ids):
+        raise ValidationError("No Customer matches the given query.")
+
+    bank_account_ids = set()
+    for payment in payments_data:
+        bank_account_id = payment.get('bank_account_id') or payment.get('bank_account')
+        if bank_account_id and payment.get('payment_type') == 'bank':
+            bank_account_ids.add(int(bank_account_id))
+    bank_accounts = BankAccount.objects.in_bulk(bank_account_ids)
+    if len(bank_accounts) != len(bank_account_ids):
+        raise ValidationError("No BankAccount matches the given query.")
+
+    return customers, bank_accounts
+
+
+def settle_payments(payments_data, username):
+    """
+    Create the payment transactions in `payments_data` and allocate them.
+
+    Customers, bank accounts and pending stock transactions for the whole
+    batch are read up front with one query each, allocations are worked out
+    in Decimal in memory (several payments for the same customer see each
+    other's effect), and everything is written back with one bulk_create and
+    one bulk_update per table, audit log entries included.
+
+    Returns (saved_payments, updated_transactions) as sent by
+    create_bulk_payment.
+    """
+    with transaction.atomic():
+        customers, bank_accounts = load_batch_references(payments_data)
+        customer_ids = set(customers)
+
+        ledgers = CustomerLedger.lock_many(customer_ids)
+
+        # Get pending transactions for every customer in the batch
+        pending_by_customer = defaultdict(list)
+        pending_transactions = Transaction.objects.filter(
+            customer_id__in=customer_ids,
+            transaction_type='stock',
+            payment_status__in=OPEN_PAYMENT_STATUSES
+        ).order_by('customer_id', *allocation_ordering('oldest_first'))
+        for pending_tx in pending_transactions:
+            # Audit entries name the customer
+            pending_tx.customer = customers[pending_tx.customer_id]
+            pending_by_customer[pending_tx.customer_id].append(pending_tx)
+
+        new_payments = []
+        settled_transactions = {}
+        updated_transactions = []
+
+        for payment in payments_data:
+            customer_id = payment.get('customer_id')
+            customer = customers[int(customer_id)]
+            payment_amount = Decimal(str(payment.get('amount_paid', 0)))
+            payment_type = payment.get('payment_type', 'bank')
+
+            # Get bank account if provided - check both field names
+            bank_account_id = payment.get('bank_account_id') or payment.get('bank_account')
+            bank_account = None
+            # Only an explicit 'bank' payment takes the account, although the
+            # type is stored as 'bank' when left out
+            if bank_account_id and payment.get('payment_type') == 'bank':
+                bank_account = bank_accounts[int(bank_account_id)]
+
+            # Create the payment transaction
+            transaction_data = {
+                'customer': customer.id,
+                'transaction_type': 'payment',
+                'payment_type': payment_type,
+                'quality_type': 'payment',
+                'quantity': 1,
+                'rate': payment_amount,
+                'total': payment_amount,
+                'amount_paid': payment_amount,
+                'balance': 0,
+                'notes': payment.get('notes', ''),
+                'transaction_date': payment.get('transaction_date', timezone.now().date()),
+                'transaction_time': payment.get('transaction_time', timezone.now().time()),
+                'payment_status': 'paid',
+                'created_by': username
+            }
+
+            # Add bank_account_id if payment type is bank
+            if bank_account:
+                transaction_data['bank_account_id'] = bank_account.id
+
+            serializer = TransactionSerializer(data=transaction_data, context={'customers': customers})
+            if not serializer.is_valid():
+                raise ValidationError(f"Validation error for payment: {serializer.errors}")
+            payment_transaction = Transaction(**serializer.validated_data)
+            payment_transaction.bank_account = bank_account
+            new_payments.append(payment_transaction)
+
+            # Update pending transactions with this payment
+            plan, remaining_payment = plan_automatic_allocation(
+                pending_by_customer[customer.id], payment_amount
+            )
+            customer_updated_transactions = []
+            for pending_tx, amount_to_apply in plan:
+                settle(pending_tx, amount_to_apply)
+                settled_transactions[pending_tx.id] = pending_tx
+                customer_updated_transactions.append({
+                    'id': pending_tx.id,
+                    'amount_applied': float(amount_to_apply),
+                    'new_balance': float(pending_tx.balance)
+                })
+
+            updated_transactions.append({
+                'customer_id': customer_id,
+                'updated_transactions': customer_updated_transactions,
+                'remaining_payment': float(remaining_payment)
+            })
+
+        created_payments = CustomerLedger.append_many(new_payments, ledgers)
+
+        now = timezone.now()
+        for pending_tx in settled_transactions.values():
+            pending_tx.updated_at = now
+        Transaction.objects.bulk_update(
+            list(settled_transactions.values()),
+            ['amount_paid', 'balance', 'payment_status', 'updated_at']
+        )
+        log_bulk_changes(updated=settled_transactions.values())
+        CustomerLedger.sync_many(settled_transactions.values(), ledgers)
+
+    saved_payments = TransactionSerializer(created_payments, many=True).data
+    return saved_payments, updated_transactions
+
+
+def enqueue_settlement_job(payments_data, username):
+    """
+    Validate a create_bulk_payment batch and queue it as a SettlementJob
+    """
+    if not isinstance(payments_data, list) or not payments_data:
+        raise ValidationError("Expected a non-empty list of payments.")
+    for payment in payments_data:
+        for field in ['customer_id', 'amount_paid']:
+            if not payment.get(field):
+                raise ValidationError(f"Missing required field: {field}")
+        try:
+            Decimal(str(payment.get('amount_paid')))
+        except ArithmeticError:
+            raise ValidationError(f"Invalid amount_paid: {payment.get('amount_paid')}")
+
+    customers, bank_accounts = load_batch_references(payments_data)
+    return SettlementJob.objects.create(
+        payments=payments_data,
+        created_by=username,
+        total_customers=len(customers)
+    )
+
+
+class LeaseLost(Exception):
+    """
+    The job was claimed by another worker since this one claimed it
+    """
+
+
+def claim_settlement_job(stale_after=None):
+    """
+    Mark the oldest queued job as running and return it, or None if the
+    queue is empty. The claim is a conditional UPDATE, so concurrent workers
+    never pick up the same job. With `stale_after` (a timedelta), a running
+    job that has made no progress for that long is taken over as well.
+    """
+    claimable = Q(status='queued')
+    if stale_after is not None:
+        claimable |= Q(status='running', updated_at__lt=timezone.now() - stale_after)
+
+    candidates = SettlementJob.objects.filter(claimable).order_by('created_at').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = SettlementJob.objects.filter(claimable, id=job_id).update(
+            status='running',
+            lease=F('lease') + 1,
+            started_at=Coalesce(F('started_at'), now),
+            updated_at=now
+        )
+        if claimed:
+            return SettlementJob.objects.get(id=job_id)
+    return None
+
+
+def lock_job(job):
+    """
+    Lock the job row for the current transaction and load its progress into
+    `job`. Raises LeaseLost if another worker has claimed it in the meantime.
+    """
+    current = SettlementJob.objects.select_for_update().get(id=job.id)
+    if current.lease != job.lease:
+        raise LeaseLost(f"Settlement job {job.id} was taken over by another worker")
+    job.results = current.results
+    job.processed_customers = current.processed_customers
+    job.failed_customers = current.failed_customers
+
+
+def run_settlement_job(job):
+    """
+    Settle a claimed job customer by customer. Each customer's payments and
+    their entry in job.results are committed together; a customer that
+    fails is recorded and the job moves on to the next one. Raises
+    LeaseLost, leaving the job to its new owner, if it was taken over.
+    """
+    payments_by_customer = defaultdict(list)
+    for payment in job.payments:
+        payments_by_customer[str(int(payment.get('customer_id')))].append(payment)
+
+    try:
+        for customer_id, customer_payments in payments_by_customer.items():
+            try:
+                with transaction.atomic():
+                    lock_job(job)
+                    if customer_id in job.results:
+                        # Already settled before the job was interrupted
+                        continue
+
+                    saved_payments, updated_transactions = settle_payments(customer_payments, job.created_by)
+                    job.results[customer_id] = {
+                        'status': 'settled',
+                        'payments': [payment['id'] for payment in saved_payments],
+                        'updated_transactions': updated_transactions
+                    }
+                    job.processed_customers += 1
+                    job.save(update_fields=['results', 'processed_customers', 'updated_at'])
+            except LeaseLost:
+                raise
+            except Exception as e:
+                with transaction.atomic():
+                    # Reloads the progress the rolled back attempt changed
+                    lock_job(job)
+                    job.results[customer_id] = {'status': 'failed', 'error': str(e)}
+                    job.processed_customers += 1
+                    job.failed_customers += 1
+                    job.save(update_fields=['results', 'processed_customers', 'failed_customers', 'updated_at'])
+    except LeaseLost:
+        raise
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+    else:
+        job.status = 'completed'
+
+    with transaction.atomic():
+        status, error = job.status, job.error
+        lock_job(job)
+        job.status, job.error = status, error
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+    return job
@@ -0,0 +1,225 @@
+"""
+Customer PDF statements.
+
+A StatementJob names a customer and a period. The generate_statements command
+renders queued jobs in a process pool: each worker claims a job with a
+conditional UPDATE, reads the period's transactions in ledger order together
+with the running balances before and at the end of the period, renders the
+PDF with reportlab and stores it under settings.STATEMENTS_ROOT, from where
+the download endpoint serves it.
+"""
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.utils import timezone
+
+from .ledger import LEDGER_ORDERING
+from .models import Customer, StatementJob, Transaction
+
+
+def month_period(month):
+    """
+    First and last day of a 'YYYY-MM' month
+    """
+    year, month_number = (int(part) for part in month.split('-'))
+    start = date(year, month_number, 1)
+    next_month = date(year + month_number // 12, month_number % 12 + 1, 1)
+    return start, next_month - timedelta(days=1)
+
+
+def enqueue_statement_job(customer, period_start, period_end, created_by=None):
+    if period_start > period_end:
+        raise ValueError('start_date must not be after end_date')
+    return StatementJob.objects.create(
+        customer=customer,
+        period_start=period_start,
+        period_end=period_end,
+        created_by=created_by
+    )
+
+
+def enqueue_month_end_batch(month, customer_ids=None, created_by=None):
+    """
+    Queue statements of `month` ('YYYY-MM') for all customers (or the given
+    ones). Customers that already have a job in the batch are skipped, so a
+    batch can be queued again after an interruption.
+    Returns the number of jobs queued.
+    """
+    period_start, period_end = month_period(month)
+    customers = Customer.objects.all()
+    if customer_ids:
+        customers = customers.filter(id__in=customer_ids)
+    customers = customers.exclude(statement_jobs__batch=month)
+
+    jobs = StatementJob.objects.bulk_create([
+        StatementJob(
+            customer_id=customer_id,
+            period_start=period_start,
+            period_end=period_end,
+            batch=month,
+            created_by=created_by
+        )
+        for customer_id in customers.order_by('id').values_list('id', flat=True)
+    ], batch_size=500)
+    return len(jobs)
+
+
+def queued_statement_job_ids():
+    return list(StatementJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True))
+
+
+def statement_data(customer, period_start, period_end):
+    """
+    Transactions of a customer dated within the period in ledger order,
+    with the running balance before the period (opening) and after its last
+    transaction (closing).
+    """
+    ledger = Transaction.objects.filter(customer=customer).order_by()
+    previous = ledger.filter(transaction_date__lt=period_start).order_by(
+        *(f'-{field}' for field in LEDGER_ORDERING)
+    ).values_list('running_balance', flat=True).first()
+    opening_balance = previous if previous is not None else Decimal('0')
+
+    transactions = list(ledger.filter(
+        transaction_date__gte=period_start,
+        transaction_date__lte=period_end
+    ).select_related('bank_account').order_by(*LEDGER_ORDERING))
+
+    closing_balance = transactions[-1].running_balance if transactions else opening_balance
+    return {
+        'customer': customer,
+        'period_start': period_start,
+        'period_end': period_end,
+        'opening_balance': opening_balance,
+        'closing_balance': closing_balance,
+        'transactions': transactions,
+        'total_billed': sum((txn.total or 0 for txn in transactions if txn.transaction_type == 'stock'), Decimal('0')),
+        'total_paid': sum((txn.amount_paid or 0 for txn in transactions if txn.transaction_type == 'payment'), Decimal('0')),
+    }
+
+
+def render_statement_pdf(data, path):
+    """
+    Write the statement described by `data` (see statement_data) to `path`
+    """
+    # Only the statement workers need reportlab
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    customer = data['customer']
+    story = [
+        Paragraph(f"Statement of Account - {escape(customer.name)}", styles['Title']),
+        Paragraph(f"Phone: {customer.phone_number or '-'}", styles['Normal']),
+        Paragraph(f"Period: {data['period_start']:%d %b %Y} to {data['period_end']:%d %b %Y}", styles['Normal']),
+        Spacer(1, 6 * mm),
+    ]
+
+    summary = Table([
+        ['Opening Balance', f"{data['opening_balance']:.2f}"],
+        ['Stock Billed', f"{data['total_billed']:.2f}"],
+        ['Payments Received', f"{data['total_paid']:.2f}"],
+        ['Closing Balance', f"{data['closing_balance']:.2f}"],
+    ], colWidths=[50 * mm, 35 * mm], hAlign='LEFT')
+    summary.setStyle(TableStyle([
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('LINEABOVE', (0, -1), (-1, -1), 0.5, colors.grey),
+    ]))
+    story += [summary, Spacer(1, 6 * mm)]
+
+    rows = [['Date', 'Type', 'Details', 'Debit', 'Credit', 'Balance']]
+    rows.append([f"{data['period_start']:%d-%m-%Y}", '', 'Opening balance', '', '', f"{data['opening_balance']:.2f}"])
+    for txn in data['transactions']:
+        if txn.transaction_type == 'stock':
+            details = f"{txn.quality_type} - {txn.quantity} @ {txn.rate}"
+            debit, credit = f"{txn.total:.2f}", ''
+        else:
+            details = txn.payment_type or ''
+            if txn.bank_account:
+                details += f" ({txn.bank_account.bank_name} {txn.bank_account.account_number})"
+            debit, credit = '', f"{txn.amount_paid:.2f}"
+        rows.append([
+            f"{txn.transaction_date:%d-%m-%Y}",
+            txn.get_transaction_type_display(),
+            Paragraph(escape(details), styles['BodyText']),
+            debit,
+            credit,
+            f"{txn.running_balance:.2f}"
+        ])
+
+    table = Table(rows, repeatRows=1, colWidths=[22 * mm, 18 * mm, 70 * mm, 22 * mm, 22 * mm, 24 * mm])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2980b9')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+    ]))
+    story.append(table)
+
+    SimpleDocTemplate(
+        path,
+        pagesize=A4,
+        title=f"Statement {customer.name}",
+        leftMargin=12 * mm,
+        rightMargin=12 * mm
+    ).build(story)
+
+
+def statement_path(job):
+    return os.path.join(
+        str(job.customer_id),
+        f"statement_{job.customer_id}_{job.period_start}_{job.period_end}_{job.id}.pdf"
+    )
+
+
+def generate_statement(job_id):
+    """
+    Claim and render one queued job. Runs in the generate_statements worker
+    processes; returns (job_id, status, error).
+    """
+    now = timezone.now()
+    claimed = StatementJob.objects.filter(id=job_id, status='queued').update(
+        status='running',
+        started_at=now,
+        updated_at=now
+    )
+    if not claimed:
+        # Taken by another worker, or no longer queued
+        return job_id, None, None
+
+    job = StatementJob.objects.select_related('customer').get(id=job_id)
+    try:
+        data = statement_data(job.customer, job.period_start, job.period_end)
+
+        relative_path = statement_path(job)
+        full_path = os.path.join(settings.STATEMENTS_ROOT, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Render next to the final name so a download never sees half a file
+        partial_path = full_path + '.part'
+        render_statement_pdf(data, partial_path)
+        os.replace(partial_path, full_path)
+
+        job.opening_balance = data['opening_balance']
+        job.closing_balance = data['closing_balance']
+        job.file_path = relative_path
+        job.status = 'completed'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=[
+        'opening_balance', 'closing_balance', 'file_path',
+        'status', 'error', 'finished_at', 'updated_at'
+    ])
+    return job.id, job.status, job.error
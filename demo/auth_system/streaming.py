@@ -0,0 +1,45 @@
+"""
+Newline-delimited JSON (NDJSON) streaming for large list responses.
+
+Opt-in with ?stream=ndjson. Rows come from a queryset iterated with
+iterator(chunk_size=STREAM_CHUNK_SIZE) (a server-side cursor on PostgreSQL),
+are encoded one JSON document per line and sent through a
+StreamingHttpResponse, so worker memory stays flat however many rows match
+and the client gets the first lines while the rest are still being read.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+STREAM_CHUNK_SIZE = 2000
+# Lines are sent in batches of this many to keep write overhead down
+LINES_PER_WRITE = 200
+
+
+def wants_ndjson(request):
+    return request.GET.get('stream') == 'ndjson'
+
+
+def ndjson_response(rows, header=None):
+    """
+    Stream `rows` (an iterable of JSON-serializable dicts) as NDJSON, after
+    an optional `header` line (e.g. {'summary': {...}}).
+    """
+    def lines():
+        if header is not None:
+            yield json.dumps(header, cls=DjangoJSONEncoder) + '\n'
+
+        batch = []
+        for row in rows:
+            batch.append(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+            if len(batch) >= LINES_PER_WRITE:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    # Ask proxies such as nginx not to buffer the whole stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,1704 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import date, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from auditlog.models import LogEntry
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .allocation import covering_pending_transactions
+from .cache import VERSION_KEY, bump_data_version, data_version
+from .ledger import LEDGER_ORDERING, balance_summaries
+from .models import (
+    BankAccount, Customer, CustomerLedger, DailyPaymentRollup, DailyPurchaseRollup, Inventory, InventoryExpense,
+    SettlementJob, StatementJob, Transaction
+)
+from .settlement import LeaseLost, claim_settlement_job, enqueue_settlement_job, run_settlement_job, settle_payments
+from .statements import generate_statement, render_statement_pdf, statement_data
+from . import search, typeahead
+
+
+def make_user(username):
+    return get_user_model().objects.create_user(
+        username=username,
+        password=username,
+        phone_number='9000000000',
+        email=f'{username}@example.com'
+    )
+
+
+def make_customer(name='Customer', phone_number='9848000000'):
+    return Customer.objects.create(name=name, phone_number=phone_number, email='customer@example.com')
+
+
+def stock(customer, total, **fields):
+    fields = dict({'quality_type': 'A', 'payment_type': 'cash'}, **fields)
+    return Transaction(customer=customer, transaction_type='stock', quantity=Decimal('1'),
+                       rate=Decimal(total), total=Decimal(total), **fields)
+
+
+def payment(customer, amount, **fields):
+    fields = dict({'quality_type': 'payment', 'payment_type': 'cash'}, **fields)
+    return Transaction(customer=customer, transaction_type='payment', quantity=Decimal('1'),
+                       rate=Decimal(amount), total=Decimal(amount), amount_paid=Decimal(amount), **fields)
+
+
+def ledger_rows(customer):
+    return list(Transaction.objects.filter(customer=customer).order_by(*LEDGER_ORDERING).values_list(
+        'sequence', 'running_balance'
+    ))
+
+
+class LedgerHeadTests(TestCase):
+    """
+    New transactions take their sequence number and running balance from
+    the customer's ledger head instead of the previous row.
+    """
+    def setUp(self):
+        self.customer = make_customer()
+        self.other = make_customer(name='Other', phone_number='9848000001')
+
+    def test_save_appends_to_the_head(self):
+        stock(self.customer, '100').save()
+        stock(self.customer, '50').save()
+        payment(self.customer, '70').save()
+
+        self.assertEqual(ledger_rows(self.customer), [(1, Decimal('100')), (2, Decimal('150')), (3, Decimal('80'))])
+        ledger = CustomerLedger.objects.get(customer=self.customer)
+        self.assertEqual((ledger.last_sequence, ledger.running_balance), (3, Decimal('80')))
+
+    def test_running_balance_keeps_the_ledger_precision(self):
+        # Each row fits Transaction.total, their sum needs the extra digits
+        for _ in range(2):
+            stock(self.customer, '60000000.00').save()
+        self.assertEqual(ledger_rows(self.customer)[-1], (2, Decimal('120000000.00')))
+        self.assertEqual(CustomerLedger.objects.get(customer=self.customer).running_balance, Decimal('120000000.00'))
+
+    def test_batch_continues_each_customers_sequence(self):
+        stock(self.customer, '100').save()
+        CustomerLedger.append_many([
+            stock(self.customer, '20'),
+            stock(self.other, '30'),
+            payment(self.customer, '40'),
+        ])
+
+        self.assertEqual(ledger_rows(self.customer), [(1, Decimal('100')), (2, Decimal('120')), (3, Decimal('80'))])
+        self.assertEqual(ledger_rows(self.other), [(1, Decimal('30'))])
+        self.assertEqual(CustomerLedger.objects.get(customer=self.other).last_sequence, 1)
+
+    def test_append_does_not_read_earlier_transactions(self):
+        for total in ('10', '20', '30'):
+            stock(self.customer, total).save()
+        with CaptureQueriesContext(connection) as queries:
+            stock(self.customer, '40').save()
+        self.assertFalse([query for query in queries if 'FROM "auth_system_transaction"' in query['sql']])
+        self.assertEqual(ledger_rows(self.customer)[-1], (4, Decimal('100')))
+
+
+class BackdatedRecomputeTests(TestCase):
+    """
+    Inserting, editing or deleting a row before the end of the ledger
+    rewrites the running balance of every later row.
+    """
+    def setUp(self):
+        self.customer = make_customer()
+        self.day = date(2024, 3, 10)
+        for offset, total in enumerate(('100', '50', '25')):
+            stock(self.customer, total, transaction_date=self.day + timedelta(days=offset), transaction_time=time(9)).save()
+
+    def balances(self):
+        return [balance for _, balance in ledger_rows(self.customer)]
+
+    def assertConsistent(self):
+        # Every running balance is the cumulative sum of the rows before it
+        expected = []
+        running = Decimal('0')
+        for txn in Transaction.objects.filter(customer=self.customer).order_by(*LEDGER_ORDERING):
+            running += txn.total if txn.transaction_type == 'stock' else -txn.amount_paid
+            expected.append(running)
+        self.assertEqual(self.balances(), expected)
+        self.assertEqual(CustomerLedger.objects.get(customer=self.customer).running_balance, running)
+
+    def test_backdated_insert(self):
+        payment(self.customer, '30', transaction_date=self.day, transaction_time=time(8)).save()
+        self.assertEqual(self.balances(), [Decimal('-30'), Decimal('70'), Decimal('120'), Decimal('145')])
+        self.assertConsistent()
+
+    def test_backdated_batch(self):
+        CustomerLedger.append_many([
+            stock(self.customer, '10', transaction_date=self.day + timedelta(days=1), transaction_time=time(8)),
+            payment(self.customer, '5', transaction_date=self.day - timedelta(days=1)),
+            stock(self.customer, '1', transaction_date=self.day + timedelta(days=5)),
+        ])
+        self.assertEqual(self.balances(), [
+            Decimal('-5'), Decimal('95'), Decimal('105'), Decimal('155'), Decimal('180'), Decimal('181')
+        ])
+        self.assertConsistent()
+
+    def test_edit_amount_and_move(self):
+        first = Transaction.objects.filter(customer=self.customer).order_by(*LEDGER_ORDERING).first()
+        first.total = Decimal('60')
+        first.save()
+        self.assertEqual(self.balances(), [Decimal('60'), Decimal('110'), Decimal('135')])
+
+        # Moving the row to the end reorders the ledger
+        first.transaction_date = self.day + timedelta(days=7)
+        first.save()
+        self.assertEqual(self.balances(), [Decimal('50'), Decimal('75'), Decimal('135')])
+        self.assertConsistent()
+
+    def test_delete(self):
+        Transaction.objects.filter(customer=self.customer, total=Decimal('50')).get().delete()
+        self.assertEqual(self.balances(), [Decimal('100'), Decimal('125')])
+        self.assertConsistent()
+
+    def test_command_repairs_balances(self):
+        Transaction.objects.filter(customer=self.customer).update(running_balance=0)
+        call_command('recompute_running_balances', customer=self.customer.id, stdout=io.StringIO())
+        self.assertEqual(self.balances(), [Decimal('100'), Decimal('150'), Decimal('175')])
+
+
+class StockIngestionTests(TestCase):
+    """
+    create_stock_transaction writes batches in bulk; the audit trail and
+    inventory must come out as if each row had been saved on its own.
+    """
+    def setUp(self):
+        self.user = make_user('stock')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = make_customer()
+
+    def post_stock(self, rows):
+        response = self.client.post('/api/transactions/stock/create/', rows, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data
+
+    def test_batch_is_audited(self):
+        Inventory.objects.create(customer=self.customer, quality_type='A', quantity=Decimal('1'), total_cost=Decimal('10'))
+        LogEntry.objects.all().delete()
+
+        created = self.post_stock([
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 2, 'rate': 5, 'total': 10},
+            {'customer_id': self.customer.id, 'quality_type': 'B', 'quantity': 4, 'rate': 5, 'total': 20},
+        ])
+
+        entries = LogEntry.objects.order_by('id')
+        self.assertEqual(
+            [(entry.content_type.model, entry.action) for entry in entries],
+            [
+                ('transaction', LogEntry.Action.CREATE),
+                ('transaction', LogEntry.Action.CREATE),
+                ('inventory', LogEntry.Action.CREATE),
+                ('inventory', LogEntry.Action.UPDATE),
+            ]
+        )
+        self.assertEqual([entry.object_id for entry in entries[:2]], [row['id'] for row in created])
+        self.assertEqual(entries[3].changes['quantity'], ['1.00', '3.00'])
+
+    def test_single_row_matches_save(self):
+        LogEntry.objects.all().delete()
+        created = self.post_stock({'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 2, 'rate': 5, 'total': 10})
+
+        entry = LogEntry.objects.get(content_type__model='transaction')
+        self.assertEqual(entry.object_id, created[0]['id'])
+        self.assertEqual(entry.changes['total'], ['None', '10.00'])
+        self.assertEqual(Inventory.objects.get(customer=self.customer, quality_type='A').quantity, Decimal('2'))
+
+    def test_batch_coalesces_inventory(self):
+        other = make_customer(name='Other', phone_number='9848000001')
+        created = self.post_stock([
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 2, 'rate': 5, 'total': 10},
+            {'customer_id': other.id, 'quality_type': 'A', 'quantity': 1, 'rate': 5, 'total': 5},
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 3, 'rate': 5, 'total': 15},
+        ])
+
+        self.assertEqual(len(created), 3)
+        self.assertEqual(ledger_rows(self.customer), [(1, Decimal('10')), (2, Decimal('25'))])
+        item = Inventory.objects.get(customer=self.customer, quality_type='A')
+        self.assertEqual((item.quantity, item.total_cost), (Decimal('5'), Decimal('25')))
+        self.assertEqual(Inventory.objects.get(customer=other, quality_type='A').quantity, Decimal('1'))
+
+
+class PaymentAuditTests(TestCase):
+    """
+    Allocations are written with bulk_update; every settled stock row still
+    gets its audit log entry.
+    """
+    def setUp(self):
+        self.user = make_user('payments')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = make_customer()
+        CustomerLedger.append_many([
+            Transaction(customer=self.customer, transaction_type='stock', quality_type='A',
+                        quantity=Decimal('1'), rate=total, total=total, payment_type='cash')
+            for total in (Decimal('100'), Decimal('50'))
+        ])
+
+    def test_payment_logs_settled_rows(self):
+        LogEntry.objects.all().delete()
+        response = self.client.post('/api/transactions/payment/create/', {
+            'customer_id': self.customer.id,
+            'payment_type': 'cash',
+            'amount_paid': '120',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        updates = LogEntry.objects.filter(action=LogEntry.Action.UPDATE).order_by('object_id')
+        stock_ids = list(Transaction.objects.filter(transaction_type='stock').order_by('id').values_list('id', flat=True))
+        self.assertEqual([entry.object_id for entry in updates], stock_ids)
+        self.assertEqual(updates[0].changes['payment_status'], ['pending', 'paid'])
+        self.assertEqual(updates[1].changes['balance'], ['50.00', '30.00'])
+        self.assertEqual(LogEntry.objects.filter(action=LogEntry.Action.CREATE).count(), 1)
+
+
+class PaymentAllocationTests(TestCase):
+    """
+    A payment settles the customer's pending stock rows in the requested
+    order, or by the amounts given for manual allocation.
+    """
+    def setUp(self):
+        self.user = make_user('allocator')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = make_customer()
+        start = timezone.now() - timedelta(days=3)
+        self.rows = CustomerLedger.append_many([
+            stock(self.customer, total, created_at=start + timedelta(hours=index))
+            for index, total in enumerate(('100', '30', '60'))
+        ])
+
+    def pay(self, amount, url='/api/transactions/payment/create/', status=201, **fields):
+        response = self.client.post(url, dict(customer_id=self.customer.id, payment_type='cash', amount_paid=amount, **fields), format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response.data
+
+    def balances(self):
+        return [Transaction.objects.get(id=row.id).balance for row in self.rows]
+
+    def test_orderings(self):
+        cases = {
+            'oldest_first': ['0', '0', '50'],
+            'smallest_first': ['50', '0', '0'],
+            'largest_first': ['0', '30', '20'],
+        }
+        for sort_order, expected in cases.items():
+            with self.subTest(sort_order=sort_order), transaction.atomic():
+                self.pay('140', sort_order=sort_order)
+                self.assertEqual(self.balances(), [Decimal(balance) for balance in expected])
+                transaction.set_rollback(True)
+
+    def test_payment_only_reads_the_rows_it_reaches(self):
+        reached = covering_pending_transactions(self.customer.id, Decimal('110'))
+        self.assertEqual([tx.id for tx in reached], [self.rows[0].id, self.rows[1].id])
+
+        self.pay('110')
+        self.assertEqual(self.balances(), [Decimal('0'), Decimal('20'), Decimal('60')])
+        statuses = Transaction.objects.filter(id__in=[row.id for row in self.rows]).order_by('id')
+        self.assertEqual([tx.payment_status for tx in statuses], ['paid', 'partial', 'pending'])
+        ledger = CustomerLedger.objects.get(customer=self.customer)
+        self.assertEqual((ledger.total_payments, ledger.total_pending, ledger.running_balance),
+                         (Decimal('110'), Decimal('80'), Decimal('80')))
+
+    def test_manual_allocation_is_capped_at_the_balance(self):
+        data = self.pay('100', manual_allocation=True, allocations={
+            str(self.rows[1].id): '50',
+            str(self.rows[2].id): '20',
+        })
+        self.assertEqual(data['allocation_type'], 'manual')
+        self.assertEqual(self.balances(), [Decimal('100'), Decimal('0'), Decimal('40')])
+
+    def test_preview_matches_payment_and_writes_nothing(self):
+        preview = self.pay('140', url='/api/transactions/payment/preview/', status=200, sort_order='largest_first')
+        self.assertEqual(self.balances(), [Decimal('100'), Decimal('30'), Decimal('60')])
+        self.assertFalse(Transaction.objects.filter(transaction_type='payment').exists())
+
+        self.pay('140', sort_order='largest_first')
+        self.assertEqual(
+            [(row['id'], Decimal(row['new_balance'])) for row in preview['allocations']],
+            [(row.id, Transaction.objects.get(id=row.id).balance) for row in (self.rows[0], self.rows[2])]
+        )
+        self.assertEqual(preview['summary']['unallocated_amount'], 0.0)
+
+
+class BulkPaymentTests(TestCase):
+    """
+    settle_payments records and allocates a whole batch with a fixed number
+    of queries, however many customers it covers.
+    """
+    def make_customers(self, count, offset=0):
+        customers = Customer.objects.bulk_create([
+            Customer(name=f'Customer {index}', phone_number=f'98480{index:05d}', email='customer@example.com')
+            for index in range(offset, offset + count)
+        ])
+        CustomerLedger.append_many([
+            Transaction(customer=customer, transaction_type='stock', quality_type='A',
+                        quantity=Decimal('1'), rate=Decimal('100'), total=Decimal('100'), payment_type='cash')
+            for customer in customers
+        ])
+        return customers
+
+    def settle_batch(self, customers):
+        payments = [{'customer_id': customer.id, 'amount_paid': '60', 'payment_type': 'cash'} for customer in customers]
+        with CaptureQueriesContext(connection) as queries:
+            settle_payments(payments, 'cashier')
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_customers(self):
+        few = self.settle_batch(self.make_customers(3))
+        many = self.settle_batch(self.make_customers(15, offset=3))
+        self.assertEqual(few, many)
+
+    def test_bank_account_needs_an_explicit_bank_payment(self):
+        customer = self.make_customers(1)[0]
+        account = BankAccount.objects.create(customer=customer, account_holder_name=customer.name, bank_name='SBI',
+                                             account_number='1234', ifsc_code='SBIN0000001')
+        saved, _ = settle_payments([
+            {'customer_id': customer.id, 'amount_paid': '10', 'payment_type': 'bank', 'bank_account_id': account.id},
+            # Not looked up at all for other payment types
+            {'customer_id': customer.id, 'amount_paid': '10', 'payment_type': 'cash', 'bank_account_id': account.id + 100},
+        ], 'cashier')
+        payments = Transaction.objects.filter(id__in=[row['id'] for row in saved]).order_by('id')
+        self.assertEqual([(tx.payment_type, tx.bank_account_id) for tx in payments],
+                         [('bank', account.id), ('cash', None)])
+
+        # Without a payment_type the payment is stored as 'bank' but does not
+        # take the account, so it is rejected
+        with self.assertRaisesMessage(ValidationError, 'Bank account is required'):
+            settle_payments([{'customer_id': customer.id, 'amount_paid': '10', 'bank_account_id': account.id}], 'cashier')
+        with self.assertRaisesMessage(ValidationError, 'No BankAccount matches'):
+            settle_payments([{'customer_id': customer.id, 'amount_paid': '10', 'payment_type': 'bank',
+                              'bank_account_id': account.id + 100}], 'cashier')
+
+    def test_batch_updates_heads_and_audit_log(self):
+        customers = self.make_customers(2)
+        LogEntry.objects.all().delete()
+        self.settle_batch(customers)
+
+        for customer in customers:
+            ledger = CustomerLedger.objects.get(customer=customer)
+            self.assertEqual(ledger.running_balance, Decimal('40'))
+            self.assertEqual(ledger.total_payments, Decimal('60'))
+            self.assertEqual(ledger.total_pending, Decimal('40'))
+        # A create entry per payment and an update entry per settled row
+        self.assertEqual(LogEntry.objects.filter(action=LogEntry.Action.CREATE).count(), 2)
+        self.assertEqual(LogEntry.objects.filter(action=LogEntry.Action.UPDATE).count(), 2)
+
+    def post_batch(self, payments, status=201, url='/api/transactions/payment/bulk/'):
+        client = APIClient()
+        client.force_authenticate(make_user('bulk'))
+        response = client.post(url, payments, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response.data
+
+    def test_payments_for_the_same_customer_see_each_other(self):
+        customer = self.make_customers(1)[0]
+        CustomerLedger.append_many([
+            stock(customer, '50', created_at=timezone.now() + timedelta(seconds=1))
+        ])
+        data = self.post_batch([
+            {'customer_id': customer.id, 'amount_paid': '120', 'payment_type': 'cash'},
+            {'customer_id': customer.id, 'amount_paid': '40', 'payment_type': 'cash'},
+        ])
+
+        self.assertEqual(len(data['payments']), 2)
+        self.assertEqual(
+            [[row['new_balance'] for row in result['updated_transactions']] for result in data['updated_transactions']],
+            [[0.0, 30.0], [0.0]]
+        )
+        self.assertEqual(data['updated_transactions'][1]['remaining_payment'], 10.0)
+        self.assertEqual(CustomerLedger.objects.get(customer=customer).running_balance, Decimal('-10'))
+
+    def test_unknown_customer_rejects_the_whole_batch(self):
+        customer = self.make_customers(1)[0]
+        data = self.post_batch([
+            {'customer_id': customer.id, 'amount_paid': '60', 'payment_type': 'cash'},
+            {'customer_id': customer.id + 100, 'amount_paid': '60', 'payment_type': 'cash'},
+        ], status=400)
+
+        self.assertIn('error', data)
+        self.assertFalse(Transaction.objects.filter(transaction_type='payment').exists())
+        self.assertEqual(CustomerLedger.objects.get(customer=customer).running_balance, Decimal('100'))
+
+    def test_job_mode_queues_the_batch(self):
+        customers = self.make_customers(2)
+        data = self.post_batch([
+            {'customer_id': customer.id, 'amount_paid': '60', 'payment_type': 'cash'} for customer in customers
+        ], status=202, url='/api/transactions/payment/bulk/?mode=job')
+
+        self.assertEqual((data['status'], data['total_customers']), ('queued', 2))
+        self.assertFalse(Transaction.objects.filter(transaction_type='payment').exists())
+
+
+class SettlementJobTests(TestCase):
+    """
+    Queued bulk payments are settled customer by customer; a job taken over
+    from a stalled worker never settles a customer twice.
+    """
+    def setUp(self):
+        self.customers = [make_customer(name=f'Customer {index}', phone_number=f'98480{index:05d}') for index in range(3)]
+        CustomerLedger.append_many([
+            Transaction(customer=customer, transaction_type='stock', quality_type='A',
+                        quantity=Decimal('1'), rate=Decimal('100'), total=Decimal('100'), payment_type='cash')
+            for customer in self.customers
+        ])
+        self.job = enqueue_settlement_job([
+            {'customer_id': customer.id, 'amount_paid': '100', 'payment_type': 'cash'}
+            for customer in self.customers
+        ], 'cashier')
+
+    def payment_count(self):
+        return Transaction.objects.filter(transaction_type='payment').count()
+
+    def test_job_settles_every_customer(self):
+        job = run_settlement_job(claim_settlement_job())
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.processed_customers, job.failed_customers), (3, 0))
+        self.assertEqual(self.payment_count(), 3)
+        self.assertFalse(Transaction.objects.filter(transaction_type='stock').exclude(payment_status='paid').exists())
+        self.assertIsNone(claim_settlement_job())
+
+    def test_failed_customer_is_recorded_and_job_moves_on(self):
+        self.job.payments[1]['amount_paid'] = 'not a number'
+        self.job.save()
+
+        job = run_settlement_job(claim_settlement_job())
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.processed_customers, job.failed_customers), (3, 1))
+        self.assertEqual(job.results[str(self.customers[1].id)]['status'], 'failed')
+        self.assertEqual(self.payment_count(), 2)
+
+    def test_stale_job_is_taken_over_without_double_settlement(self):
+        stalled = claim_settlement_job()
+        # The first worker settles one customer, then stops making progress
+        payments = stalled.payments
+        stalled.payments = payments[:1]
+        run_settlement_job(stalled)
+        stalled.payments = payments
+        SettlementJob.objects.filter(id=stalled.id).update(status='running', updated_at=timezone.now() - timedelta(hours=1))
+
+        self.assertIsNone(claim_settlement_job(stale_after=timedelta(hours=2)))
+        takeover = claim_settlement_job(stale_after=timedelta(minutes=10))
+        self.assertEqual(takeover.id, stalled.id)
+        self.assertEqual(takeover.lease, stalled.lease + 1)
+
+        # The stalled worker wakes up: its lease is gone, it settles nothing
+        with self.assertRaises(LeaseLost):
+            run_settlement_job(stalled)
+        self.assertEqual(self.payment_count(), 1)
+
+        takeover = run_settlement_job(takeover)
+        self.assertEqual(takeover.status, 'completed')
+        self.assertEqual(takeover.processed_customers, 3)
+        # One payment per customer, the first one from the stalled worker
+        self.assertEqual(self.payment_count(), 3)
+        for customer in self.customers:
+            self.assertEqual(CustomerLedger.objects.get(customer=customer).running_balance, Decimal('0'))
+
+    def test_command_works_off_the_queue(self):
+        output = io.StringIO()
+        call_command('run_settlement_jobs', once=True, stdout=output)
+        self.assertIn(f'Settlement job {self.job.id} completed: 3 settled, 0 failed', output.getvalue())
+
+        client = APIClient()
+        client.force_authenticate(make_user('poller'))
+        response = client.get(f'/api/transactions/payment/bulk/jobs/{self.job.id}/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.data['status'], response.data['processed_customers']), ('completed', 3))
+        self.assertEqual(
+            {result['status'] for result in response.data['results'].values()},
+            {'settled'}
+        )
+
+    def test_invalid_batches_are_not_queued(self):
+        with self.assertRaises(ValidationError):
+            enqueue_settlement_job([{'customer_id': self.customers[0].id}], 'cashier')
+        with self.assertRaises(ValidationError):
+            enqueue_settlement_job([{'customer_id': self.customers[0].id + 100, 'amount_paid': '10'}], 'cashier')
+        self.assertEqual(SettlementJob.objects.count(), 1)
+
+
+class StatementJobTests(TestCase):
+    """
+    PDF statements, rendered by generate_statement as the
+    generate_statements workers do, into a temporary STATEMENTS_ROOT.
+    """
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(STATEMENTS_ROOT=root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.root = root
+
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('statements'))
+        self.customer = make_customer(name='Ravi Traders')
+        stock(self.customer, 100, transaction_date=date(2024, 1, 20)).save()
+        stock(self.customer, 50, transaction_date=date(2024, 2, 5)).save()
+        payment(self.customer, 30, transaction_date=date(2024, 2, 10)).save()
+        stock(self.customer, 70, transaction_date=date(2024, 3, 1)).save()
+
+    def request_statement(self):
+        response = self.client.post(f'/api/customers/{self.customer.id}/statements/',
+                                    {'start_date': '2024-02-01', 'end_date': '2024-02-29'}, format='json')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.data['status'], 'queued')
+        return response.data['id']
+
+    def download(self, job_id):
+        return self.client.get(f'/api/statements/{job_id}/download/')
+
+    def test_statement_covers_the_period(self):
+        job_id = self.request_statement()
+        self.assertEqual(self.download(job_id).status_code, 409)
+
+        self.assertEqual(generate_statement(job_id), (job_id, 'completed', None))
+        job = StatementJob.objects.get(id=job_id)
+        self.assertEqual(job.opening_balance, Decimal('100'))
+        self.assertEqual(job.closing_balance, Decimal('120'))
+        self.assertIsNotNone(job.started_at)
+        self.assertIsNotNone(job.finished_at)
+
+        status = self.client.get(f'/api/statements/{job_id}/')
+        self.assertTrue(status.data['download_url'].endswith(f'/api/statements/{job_id}/download/'))
+        response = self.download(job_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        # Reading it to the end closes the file
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        # Only the finished file is left behind
+        self.assertEqual(os.listdir(os.path.join(self.root, str(self.customer.id))), [os.path.basename(job.file_path)])
+
+        os.remove(os.path.join(self.root, job.file_path))
+        self.assertEqual(self.download(job_id).status_code, 404)
+        self.assertEqual(self.download(job_id + 1).status_code, 404)
+
+    def test_render_statement_pdf(self):
+        data = statement_data(self.customer, date(2024, 2, 1), date(2024, 2, 29))
+        self.assertEqual([txn.total for txn in data['transactions']], [Decimal('50'), Decimal('30')])
+        self.assertEqual(data['total_billed'], Decimal('50'))
+        self.assertEqual(data['total_paid'], Decimal('30'))
+
+        path = os.path.join(self.root, 'statement.pdf')
+        render_statement_pdf(data, path)
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'%%EOF', content[-32:])
+        self.assertIn(b'Statement Ravi Traders', content)
+
+    def test_claimed_job_is_not_claimed_again(self):
+        job_id = self.request_statement()
+        # Another worker got there first
+        StatementJob.objects.filter(id=job_id).update(status='running')
+        with mock.patch('auth_system.statements.render_statement_pdf') as render:
+            self.assertEqual(generate_statement(job_id), (job_id, None, None))
+        render.assert_not_called()
+        self.assertEqual(StatementJob.objects.get(id=job_id).status, 'running')
+
+        # Nor is a finished one
+        StatementJob.objects.filter(id=job_id).update(status='completed')
+        self.assertEqual(generate_statement(job_id), (job_id, None, None))
+
+    def test_failure_is_recorded_on_the_job(self):
+        job_id = self.request_statement()
+        with mock.patch('auth_system.statements.render_statement_pdf', side_effect=OSError('disk full')):
+            self.assertEqual(generate_statement(job_id), (job_id, 'failed', 'disk full'))
+
+        job = StatementJob.objects.get(id=job_id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'disk full')
+        self.assertIsNone(job.file_path)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(self.client.get(f'/api/statements/{job_id}/').data['download_url'], None)
+        self.assertEqual(self.download(job_id).status_code, 409)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = make_user('exporter')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_xlsx_sheet_named_after_customer_with_reserved_characters(self):
+        from openpyxl import load_workbook
+
+        customer = make_customer(name='Traders [A/B]: Wholesale? * Retail')
+        CustomerLedger.append_many([
+            Transaction(customer=customer, transaction_type='stock', quality_type='A',
+                        quantity=Decimal('2'), rate=Decimal('50'), total=Decimal('100'), payment_type='cash')
+        ])
+
+        response = self.client.get(f'/api/customers/{customer.id}/transactions/', {'file_format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['Traders -A-B-- Wholesale- - Ret'])
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 2)
+
+
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reports')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_date_relative_entries_expire_at_midnight(self):
+        url = '/api/transactions/insights?timeFrame=today'
+        today = timezone.localdate()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        with mock.patch('auth_system.cache.timezone.localdate', return_value=today + timedelta(days=1)):
+            self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        first = data_version()
+        bump_data_version()
+        cache.delete(VERSION_KEY)
+        self.assertGreater(data_version(), first + 1)
+
+
+class CustomerBalanceTests(TestCase):
+    def setUp(self):
+        self.user = make_user('balance')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = make_customer()
+        response = self.client.post('/api/transactions/stock/create/', [
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 1, 'rate': 10, 'total': 10},
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 2, 'rate': 10, 'total': 20},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def get_balance(self, **params):
+        response = self.client.get(f'/api/customers/{self.customer.id}/balance/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_debug_rows_clamp_page_and_page_size(self):
+        debug_info = self.get_balance(debug=1, page=0, page_size=-5)['debug_info']
+        self.assertEqual((debug_info['page'], debug_info['page_size']), (1, 1))
+        self.assertEqual(len(debug_info['stock_transactions']), 1)
+        self.assertEqual(debug_info['stock_count'], 2)
+
+    def test_debug_rows_are_opt_in(self):
+        self.assertNotIn('debug_info', self.get_balance())
+
+    def summary(self):
+        ledger = CustomerLedger.objects.get(customer=self.customer)
+        return (ledger.total_stock_amount, ledger.total_payments, ledger.total_pending)
+
+    def test_summary_follows_every_write(self):
+        response = self.client.post('/api/transactions/payment/create/', {
+            'customer_id': self.customer.id, 'payment_type': 'cash', 'amount_paid': '40',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.summary(), (Decimal('30'), Decimal('40'), Decimal('0')))
+
+        edited = Transaction.objects.filter(customer=self.customer, transaction_type='stock').order_by('id').last()
+        edited.total = Decimal('35')
+        edited.balance = Decimal('15')
+        edited.save()
+        Transaction.objects.filter(customer=self.customer, transaction_type='stock').order_by('id').first().delete()
+
+        self.assertEqual(self.summary(), balance_summaries([self.customer.id])[self.customer.id])
+        self.assertEqual(self.summary(), (Decimal('35'), Decimal('40'), Decimal('15')))
+        data = self.get_balance()
+        self.assertEqual((data['total_paid'], data['total_pending']), (40.0, 15.0))
+        self.assertEqual((data['is_advance'], data['advance_amount']), (True, 5.0))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        CustomerLedger.objects.filter(customer=self.customer).update(total_pending=Decimal('999'))
+
+        output = io.StringIO()
+        call_command('reconcile_balances', stdout=output)
+        self.assertIn('1 of 1 balance summaries do not match', output.getvalue())
+        self.assertEqual(self.summary()[2], Decimal('999'))
+
+        output = io.StringIO()
+        call_command('reconcile_balances', fix=True, stdout=output)
+        self.assertIn('Rebuilt 1 of 1 balance summaries', output.getvalue())
+        self.assertEqual(self.summary(), (Decimal('30'), Decimal('0'), Decimal('30')))
+
+        output = io.StringIO()
+        call_command('reconcile_balances', stdout=output)
+        self.assertIn('All 1 balance summaries match', output.getvalue())
+
+
+class CursorPaginationTests(TestCase):
+    """
+    Every cursor-paginated listing sends the next cursor in X-Next-Cursor
+    """
+    def setUp(self):
+        self.user = make_user('pages')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = make_customer()
+        for index in range(4):
+            make_customer(name=f'Other {index}', phone_number=f'98480000{index + 10}')
+        response = self.client.post('/api/transactions/stock/create/', [
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 1, 'rate': 10, 'total': 10}
+            for _ in range(5)
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        inventory = Inventory.objects.get(customer=self.customer, quality_type='A')
+        for _ in range(5):
+            InventoryExpense.objects.create(inventory=inventory)
+
+    def walk(self, url, params):
+        ids = []
+        cursor = None
+        while True:
+            response = self.client.get(url, dict(params, **({'cursor': cursor} if cursor else {})))
+            self.assertEqual(response.status_code, 200, response.content)
+            rows = response.data if isinstance(response.data, list) else response.data['results']
+            if not isinstance(response.data, list):
+                self.assertNotIn('next_cursor', response.data)
+            ids.extend(row['id'] for row in rows)
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                return ids
+
+    def test_listings_follow_the_header(self):
+        customer_url = f'/api/customers/{self.customer.id}'
+        cases = [
+            ('/api/customers/search/', {'limit': 2}, Customer.objects.all()),
+            (f'{customer_url}/transactions/', {'page_size': 2}, Transaction.objects.filter(customer=self.customer)),
+            (f'{customer_url}/pending-transactions/', {'page_size': 2},
+             Transaction.objects.filter(customer=self.customer, payment_status__in=['pending', 'partial'])),
+            (f'{customer_url}/inventory/expenses/', {'page_size': 2}, InventoryExpense.objects.all()),
+        ]
+        for url, params, expected in cases:
+            with self.subTest(url=url):
+                ids = self.walk(url, params)
+                self.assertEqual(len(ids), 5)
+                self.assertEqual(sorted(ids), sorted(expected.values_list('id', flat=True)))
+
+
+class RollupTests(TestCase):
+    """
+    Daily rollups kept current on write match what backfill_rollups rebuilds
+    from the raw transactions.
+    """
+    def setUp(self):
+        self.customer = make_customer()
+        self.account = BankAccount.objects.create(
+            customer=self.customer, account_holder_name='Customer', bank_name='Bank',
+            account_number='1234567890', ifsc_code='BANK0000001'
+        )
+        self.day = date(2024, 5, 1)
+
+    def snapshot(self):
+        purchases = DailyPurchaseRollup.objects.filter(transaction_count__gt=0).order_by('date', 'quality_type')
+        payments = DailyPaymentRollup.objects.filter(transaction_count__gt=0).order_by('date', 'payment_type', 'bank_account_id')
+        return (
+            list(purchases.values_list('date', 'quality_type', 'quantity', 'total_amount', 'transaction_count')),
+            list(payments.values_list('date', 'payment_type', 'bank_account_id', 'amount', 'transaction_count'))
+        )
+
+    def assertMatchesBackfill(self):
+        maintained = self.snapshot()
+        call_command('backfill_rollups', stdout=io.StringIO())
+        self.assertEqual(maintained, self.snapshot())
+        return maintained
+
+    def test_writes_keep_rollups_current(self):
+        first = stock(self.customer, '100', transaction_date=self.day)
+        first.save()
+        CustomerLedger.append_many([
+            stock(self.customer, '40', transaction_date=self.day),
+            stock(self.customer, '25', transaction_date=self.day + timedelta(days=1), quality_type='B'),
+            payment(self.customer, '30', transaction_date=self.day, payment_type='bank', bank_account=self.account),
+            payment(self.customer, '20', transaction_date=self.day),
+        ])
+
+        # Move a row to another day and quality type, then delete one
+        first.transaction_date = self.day + timedelta(days=1)
+        first.quality_type = 'B'
+        first.save()
+        Transaction.objects.get(transaction_type='payment', payment_type='cash').delete()
+
+        purchases, payments = self.assertMatchesBackfill()
+        self.assertEqual(purchases, [
+            (self.day, 'A', Decimal('1'), Decimal('40'), 1),
+            (self.day + timedelta(days=1), 'B', Decimal('2'), Decimal('125'), 2),
+        ])
+        self.assertEqual(payments, [(self.day, 'bank', self.account.id, Decimal('30'), 1)])
+
+    def test_deleted_account_is_folded_into_no_account_row(self):
+        payment(self.customer, '30', transaction_date=self.day, payment_type='bank', bank_account=self.account).save()
+        payment(self.customer, '20', transaction_date=self.day, payment_type='bank').save()
+        self.account.delete()
+
+        _, payments = self.assertMatchesBackfill()
+        self.assertEqual(payments, [(self.day, 'bank', None, Decimal('50'), 2)])
+
+    def test_backfill_only_touches_the_given_dates(self):
+        for offset in range(2):
+            stock(self.customer, '10', transaction_date=self.day + timedelta(days=offset)).save()
+        DailyPurchaseRollup.objects.update(total_amount=Decimal('0'))
+
+        call_command('backfill_rollups', start=self.day, end=self.day, stdout=io.StringIO())
+        self.assertEqual(
+            list(DailyPurchaseRollup.objects.order_by('date').values_list('total_amount', flat=True)),
+            [Decimal('10'), Decimal('0')]
+        )
+
+
+class InsightsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('insights')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = make_customer()
+
+    def test_purchase_insights_filter_on_date(self):
+        day = date(2024, 3, 5)
+        rows = [
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 2, 'rate': 5, 'total': 10,
+             'transaction_date': day.isoformat()},
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 3, 'rate': 5, 'total': 15,
+             'transaction_date': (day - timedelta(days=1)).isoformat()},
+        ]
+        response = self.client.post('/api/transactions/stock/create/', rows, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        response = self.client.get('/api/transactions/insights', {'timeFrame': 'today', 'date': day.isoformat()})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['summary']['total_purchases'], 1)
+        self.assertEqual(response.data['summary']['total_amount'], 10.0)
+        self.assertEqual([row['total_amount'] for row in response.data['insights']], [10.0])
+
+    def walk(self, url, params):
+        rows = []
+        pages = 0
+        cursor = None
+        while True:
+            response = self.client.get(url, dict(params, **({'cursor': cursor} if cursor else {})))
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertNotIn('next_cursor', response.data)
+            rows.extend(response.data['insights'])
+            pages += 1
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                return rows, pages
+
+    def assert_pages_cover_every_row(self, url, count):
+        # No page_size or cursor: every row in one response, whatever the default page size
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.data['insights']), count)
+        self.assertIsNone(response.get('X-Next-Cursor'))
+
+        rows, pages = self.walk(url, {'page_size': 25})
+        self.assertEqual(pages, 3)
+        self.assertEqual(rows, response.data['insights'])
+
+        # Served from the cache, the header comes along
+        first = self.client.get(url, {'page_size': 25})
+        self.assertEqual(first['X-Cache'], 'HIT')
+        self.assertIsNotNone(first.get('X-Next-Cursor'))
+
+    def test_purchase_insights_pages(self):
+        response = self.client.post('/api/transactions/stock/create/', [
+            {'customer_id': self.customer.id, 'quality_type': 'A', 'quantity': 1, 'rate': index + 1,
+             'total': index + 1, 'transaction_date': (date(2024, 3, 1) + timedelta(days=index % 5)).isoformat()}
+            for index in range(60)
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assert_pages_cover_every_row('/api/transactions/insights', 60)
+
+    def test_payment_insights_pages(self):
+        for index in range(60):
+            payment(self.customer, index + 1, transaction_date=date(2024, 3, 1) + timedelta(days=index % 5)).save()
+        self.assert_pages_cover_every_row('/api/transactions/payment-insights', 60)
+
+
+class InventoryOverviewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('inventory'))
+        for index in range(3):
+            customer = make_customer(name=f'Customer {index}', phone_number=f'98480000{index + 10}')
+            for offset, quality_type in enumerate(['A', 'B', 'C', 'D']):
+                Inventory.objects.create(customer=customer, quality_type=quality_type,
+                                         quantity=Decimal(index + offset + 1),
+                                         total_cost=Decimal((index + 1) * (offset + 2) * 10))
+
+    def test_summary_matches_the_items_and_pages_cover_them(self):
+        response = self.client.get('/api/inventory/')
+        self.assertEqual(response.status_code, 200, response.content)
+        items = response.data['inventory_items']
+        self.assertEqual([item['id'] for item in items], list(Inventory.objects.order_by('id').values_list('id', flat=True)))
+        self.assertIsNone(response.get('X-Next-Cursor'))
+
+        summary = response.data['summary']
+        self.assertEqual(summary['total_quantity'], sum(Decimal(item['quantity']) for item in items))
+        self.assertEqual(summary['total_cost'], sum(Decimal(item['total_cost']) for item in items))
+        expected = {}
+        for item in items:
+            totals = expected.setdefault(item['quality_type'], {'total_quantity': 0, 'total_cost': 0})
+            totals['total_quantity'] += Decimal(item['quantity'])
+            totals['total_cost'] += Decimal(item['total_cost'])
+        for totals in expected.values():
+            totals['avg_cost'] = totals['total_cost'] / totals['total_quantity']
+        self.assertEqual(summary['quality_summary'], expected)
+
+        ids = []
+        cursor = None
+        while True:
+            params = {'page_size': 5}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/inventory/', params)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertNotIn('next_cursor', response.data)
+            # Every page carries the summary of all items
+            self.assertEqual(response.data['summary'], summary)
+            ids.extend(item['id'] for item in response.data['inventory_items'])
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                break
+        self.assertEqual(ids, [item['id'] for item in items])
+
+
+class NdjsonStreamTests(TestCase):
+    """
+    ?stream=ndjson sends the same rows as the JSON response, one per line,
+    read in several iterator chunks and written in several batches.
+    """
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('stream'))
+        self.customer = make_customer()
+        for index in range(10):
+            day = date(2024, 3, 1) + timedelta(days=index)
+            stock(self.customer, 10 + index, quality_type='AB'[index % 2], transaction_date=day).save()
+            payment(self.customer, 5, payment_type=['cash', 'upi'][index % 2], transaction_date=day).save()
+
+        for patcher in (mock.patch('auth_system.views.STREAM_CHUNK_SIZE', 3),
+                        mock.patch('auth_system.streaming.LINES_PER_WRITE', 4)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stream(self, url, params=None):
+        response = self.client.get(url, dict(params or {}, stream='ndjson'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 1)
+        text = ''.join(chunks)
+        self.assertTrue(text.endswith('\n'))
+        return [json.loads(line) for line in text.splitlines()]
+
+    def test_transaction_history(self):
+        url = f'/api/customers/{self.customer.id}/history/'
+        lines = self.stream(url)
+        self.assertEqual(len(lines), 20)
+        self.assertEqual(lines, self.client.get(url).json())
+
+        lines = self.stream(url, {'fields': 'id,total'})
+        self.assertEqual(lines, [{'id': row['id'], 'total': row['total']} for row in self.client.get(url).json()])
+
+    def test_insights(self):
+        for url, filters in [('/api/transactions/insights', {'qualityTypes[]': 'A'}),
+                             ('/api/transactions/payment-insights', {'paymentTypes[]': 'upi'})]:
+            for params in [{}, filters]:
+                expected = self.client.get(url, params).json()
+                header, *rows = self.stream(url, params)
+                # The summary comes first, then one line per row
+                self.assertEqual(header, {'summary': expected['summary']})
+                self.assertEqual(rows, expected['insights'])
+                self.assertEqual(len(rows), 10 if not params else 5)
+
+
+class InsightSeriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('series'))
+        self.customer = make_customer()
+
+    def series(self, **params):
+        response = self.client.get('/api/transactions/insights/series/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def add_purchases(self):
+        # 3 March 2024 is a Sunday, 4 March a Monday
+        for day, quality_type, total in [(date(2024, 3, 3), 'A', 10), (date(2024, 3, 4), 'A', 20),
+                                         (date(2024, 3, 4), 'B', 5), (date(2024, 3, 10), 'B', 7),
+                                         (date(2024, 4, 1), 'A', 40)]:
+            stock(self.customer, total, quality_type=quality_type, transaction_date=day).save()
+
+    def test_purchase_buckets(self):
+        self.add_purchases()
+        days = self.series(kind='purchases', granularity='day')
+        self.assertEqual(days['split_by'], 'quality_type')
+        self.assertEqual([(bucket['period'], bucket['count'], bucket['total_amount']) for bucket in days['series']], [
+            ('2024-03-03', 1, 10.0), ('2024-03-04', 2, 25.0), ('2024-03-10', 1, 7.0), ('2024-04-01', 1, 40.0)
+        ])
+        self.assertEqual(days['series'][1]['by_type'], {
+            'A': {'count': 1, 'total_amount': 20.0, 'quantity': 1.0},
+            'B': {'count': 1, 'total_amount': 5.0, 'quantity': 1.0},
+        })
+        self.assertEqual(days['series'][1]['quantity'], 2.0)
+
+        # Weeks start on Monday: the Sunday belongs to the week before
+        weeks = self.series(kind='purchases', granularity='week')
+        self.assertEqual([(bucket['period'], bucket['count'], bucket['total_amount']) for bucket in weeks['series']], [
+            ('2024-02-26', 1, 10.0), ('2024-03-04', 3, 32.0), ('2024-04-01', 1, 40.0)
+        ])
+
+        months = self.series(kind='purchases', granularity='month')
+        self.assertEqual([(bucket['period'], bucket['count'], bucket['total_amount']) for bucket in months['series']], [
+            ('2024-03-01', 4, 42.0), ('2024-04-01', 1, 40.0)
+        ])
+        self.assertEqual(months['series'][0]['by_type'], {
+            'A': {'count': 2, 'total_amount': 30.0, 'quantity': 2.0},
+            'B': {'count': 2, 'total_amount': 12.0, 'quantity': 2.0},
+        })
+
+        # Only the chosen split values, and only within the dates given
+        only_b = self.series(**{'kind': 'purchases', 'granularity': 'month', 'qualityTypes[]': 'B'})
+        self.assertEqual([(bucket['period'], list(bucket['by_type']), bucket['total_amount'])
+                          for bucket in only_b['series']], [('2024-03-01', ['B'], 12.0)])
+        march = self.series(kind='purchases', granularity='week', startDate='2024-03-04', endDate='2024-03-31')
+        self.assertEqual([bucket['period'] for bucket in march['series']], ['2024-03-04'])
+
+    def test_payments_split_by_payment_type(self):
+        for day, payment_type, amount in [(date(2024, 3, 4), 'cash', 10), (date(2024, 3, 5), 'upi', 15),
+                                          (date(2024, 3, 5), 'cash', 5)]:
+            payment(self.customer, amount, payment_type=payment_type, transaction_date=day).save()
+
+        weeks = self.series(kind='payments', granularity='week')
+        self.assertEqual(weeks['split_by'], 'payment_type')
+        self.assertEqual(weeks['series'], [{
+            'period': '2024-03-04', 'count': 3, 'total_amount': 30.0,
+            'by_type': {'cash': {'count': 2, 'total_amount': 15.0}, 'upi': {'count': 1, 'total_amount': 15.0}},
+        }])
+        upi = self.series(**{'kind': 'payments', 'paymentTypes[]': 'upi'})
+        self.assertEqual([(bucket['period'], bucket['total_amount']) for bucket in upi['series']], [('2024-03-05', 15.0)])
+
+    def test_time_frame(self):
+        today = timezone.now().date()
+        for days_ago, total in [(0, 1), (3, 2), (20, 4), (60, 8)]:
+            stock(self.customer, total, transaction_date=today - timedelta(days=days_ago)).save()
+
+        def total(time_frame):
+            return sum(bucket['total_amount'] for bucket in self.series(timeFrame=time_frame)['series'])
+
+        self.assertEqual(total('today'), 1.0)
+        self.assertEqual(total('weekly'), 3.0)
+        self.assertEqual(total('monthly'), 7.0)
+        self.assertEqual(total('all'), 15.0)
+
+    def test_bad_parameters(self):
+        for params in [{'kind': 'sales'}, {'granularity': 'year'}, {'kind': 'payments', 'granularity': 'hour'}]:
+            response = self.client.get('/api/transactions/insights/series/', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.data)
+
+
+class ReceivablesAgingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('aging'))
+        self.as_of = date(2024, 6, 30)
+        self.customer = make_customer(name='Ravi Traders')
+        self.other = make_customer(name='Suresh Agencies', phone_number='9848000011')
+        for days_ago, total in [(200, 100), (91, 50), (90, 40), (61, 30), (60, 20), (31, 10), (30, 8), (0, 4), (-1, 1000)]:
+            stock(self.customer, total, transaction_date=self.as_of - timedelta(days=days_ago)).save()
+        stock(self.other, 500, transaction_date=self.as_of - timedelta(days=45)).save()
+
+        # Pays the 200-day row off and 30 of the 91-day one
+        response = self.client.post('/api/transactions/payment/create/', {
+            'customer_id': self.customer.id, 'payment_type': 'cash', 'amount_paid': '130', 'sort_order': 'oldest_first'
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def aging(self, **params):
+        response = self.client.get('/api/transactions/aging/', dict({'as_of': self.as_of.isoformat()}, **params))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_buckets(self):
+        data = self.aging()
+        self.assertEqual(data['customers'], [{
+            'customer_id': self.other.id, 'customer_name': 'Suresh Agencies',
+            'days_0_30': 0.0, 'days_31_60': 500.0, 'days_61_90': 0.0, 'days_over_90': 0.0,
+            'total_outstanding': 500.0, 'open_transactions': 1,
+        }, {
+            'customer_id': self.customer.id, 'customer_name': 'Ravi Traders',
+            # 30 days is still the first bucket, 91 the last; the paid row
+            # and the one after as_of are left out
+            'days_0_30': 12.0, 'days_31_60': 30.0, 'days_61_90': 70.0, 'days_over_90': 20.0,
+            'total_outstanding': 132.0, 'open_transactions': 7,
+        }])
+        self.assertEqual(data['overall'], {
+            'days_0_30': 12.0, 'days_31_60': 530.0, 'days_61_90': 70.0, 'days_over_90': 20.0,
+            'total_outstanding': 632.0, 'open_transactions': 8, 'customer_count': 2,
+        })
+
+    def test_customer_filter(self):
+        data = self.aging(customer_id=self.customer.id)
+        self.assertEqual([row['customer_id'] for row in data['customers']], [self.customer.id])
+        self.assertEqual(data['overall']['total_outstanding'], 132.0)
+        self.assertEqual(data['overall']['customer_count'], 1)
+
+        response = self.client.get('/api/transactions/aging/', {'customer_id': self.other.id + 100})
+        self.assertEqual(response.status_code, 400)
+
+    def test_as_of_moves_the_buckets(self):
+        # A day later the 30/60/90-day rows cross into the next bucket
+        later = self.aging(as_of=(self.as_of + timedelta(days=1)).isoformat())['overall']
+        self.assertEqual([later[bucket] for bucket in ('days_0_30', 'days_31_60', 'days_61_90', 'days_over_90')],
+                         [1004.0, 518.0, 50.0, 60.0])
+        self.assertEqual(later['total_outstanding'], 1632.0)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('fields'))
+        self.customers = [make_customer(name=f'Ravi {index}', phone_number=f'98480000{index + 10}') for index in range(5)]
+        for customer in self.customers:
+            for number in range(3):
+                BankAccount.objects.create(customer=customer, account_holder_name=customer.name, bank_name='SBI',
+                                           account_number=f'{customer.id}00{number}', ifsc_code='SBIN0000001')
+
+    def test_fields_trim_the_rows(self):
+        response = self.client.get('/api/customers/search/', {'fields': 'id, name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        for row in response.data:
+            self.assertEqual(set(row), {'id', 'name'})
+
+        response = self.client.get(f'/api/customers/{self.customers[0].id}/history/', {'fields': 'id,total'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_fields_are_rejected(self):
+        for url in ['/api/customers/search/', f'/api/customers/{self.customers[0].id}/history/']:
+            response = self.client.get(url, {'fields': 'id,bogus,secret'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], 'Unknown fields: bogus, secret')
+
+    def test_bank_accounts_are_prefetched(self):
+        # One query for the customers and one for all their accounts,
+        # however many customers there are
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/customers/search/')
+        self.assertEqual([len(row['bank_accounts']) for row in response.data], [3] * 5)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/customers/search/', {'fields': 'id,name'})
+
+        make_customer(name='Ravi 5', phone_number='9848000099')
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/customers/search/')
+        self.assertEqual(len(response.data), 6)
+
+        # Ranked search: the index, the customers, their accounts (on
+        # PostgreSQL the customers come ranked in one query)
+        if connection.vendor == 'postgresql':
+            search._has_trigram()
+        queries = 3 if connection.vendor == 'sqlite' else 2
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/customers/search/', {'query': 'ravi'})
+        self.assertEqual(len(response.data), 6)
+
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = make_customer(name='Ravi Traders')
+
+    def test_lookups_survive_concurrent_changes(self):
+        self.assertEqual([label['id'] for label in typeahead.lookup('ravi')], [self.customer.id])
+
+        errors = []
+
+        def change():
+            for index in range(300):
+                typeahead._apply_change(10000 + index % 20, (f'Ravi {index}', '98480', ''))
+                typeahead._apply_change(10000 + (index + 7) % 20)
+
+        def read():
+            try:
+                for _ in range(300):
+                    typeahead.lookup('ra', limit=50)
+            except Exception as e:
+                errors.append(e)
+
+        # Switch threads as often as possible to give races a chance
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=change)] + [threading.Thread(target=read) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+
+    def test_evicted_version_forces_rebuild(self):
+        typeahead.lookup('ravi')
+        built_at = typeahead._index_version
+        cache.delete(typeahead.VERSION_KEY)
+        typeahead.lookup('ravi')
+        self.assertGreater(typeahead._index_version, built_at)
+
+
+class CustomerSearchTests(TestCase):
+    """
+    /api/customers/search/ through the backend's index: FTS5 on SQLite,
+    pg_trgm on PostgreSQL.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('searcher'))
+        self.ravi = make_customer(name='Ravi Traders', phone_number='+91 98480 12345')
+        self.ravindra = make_customer(name='Ravindra Kumar', phone_number='9123456789')
+        self.suresh = make_customer(name='Suresh Agencies', phone_number='9848099999')
+
+    def search(self, query, **params):
+        response = self.client.get('/api/customers/search/', dict(params, query=query))
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data], response.headers.get('X-Next-Cursor')
+
+    def test_index_is_in_use(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT count(*) FROM {search.FTS_TABLE}')
+                self.assertEqual(cursor.fetchone()[0], 3)
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+                if cursor.fetchone() is None:
+                    self.skipTest('pg_trgm is not available on this server')
+            self.assertTrue(search._has_trigram())
+            # Ranked by word similarity, best first
+            ids, _ = self.search('ravi')
+            self.assertEqual(ids, [self.ravi.id, self.ravindra.id])
+        else:
+            self.skipTest('no search index on this backend')
+
+    def test_name_prefix(self):
+        ids, next_cursor = self.search('rav')
+        self.assertEqual(sorted(ids), sorted([self.ravi.id, self.ravindra.id]))
+        self.assertIsNone(next_cursor)
+        self.assertEqual(self.search('ravi trad')[0], [self.ravi.id])
+
+    def test_phone_fragment(self):
+        self.assertEqual(sorted(self.search('98480')[0]), sorted([self.ravi.id, self.suresh.id]))
+        # Country code and spaces are not needed to find a number
+        self.assertEqual(self.search('9848012345')[0], [self.ravi.id])
+        self.assertEqual(self.search('919848012345')[0], [self.ravi.id])
+
+    def test_cursor_continues_the_ranking(self):
+        first, next_cursor = self.search('rav', limit=1)
+        self.assertEqual(len(first), 1)
+        self.assertIsNotNone(next_cursor)
+        second, next_cursor = self.search('rav', limit=1, cursor=next_cursor)
+        self.assertEqual(len(second), 1)
+        self.assertIsNone(next_cursor)
+        self.assertEqual(sorted(first + second), sorted([self.ravi.id, self.ravindra.id]))
+
+        response = self.client.get('/api/customers/search/', {'query': 'rav', 'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_edits_and_deletes_reach_the_index(self):
+        self.suresh.name = 'Mahesh Agencies'
+        self.suresh.save()
+        self.assertEqual(self.search('suresh')[0], [])
+        self.assertEqual(self.search('mahesh')[0], [self.suresh.id])
+
+        suresh_id = self.suresh.id
+        self.suresh.delete()
+        self.assertEqual(self.search('mahesh')[0], [])
+        if connection.vendor == 'sqlite':
+            # Not just filtered out after ranking: gone from the FTS table
+            self.assertEqual(search._fts_ranked_ids(['mahesh'], None, 10), [])
+            self.assertNotIn(suresh_id, [customer_id for _, customer_id in search._fts_ranked_ids(['98480'], None, 10)])
+
+
+class CustomerLookupTests(TestCase):
+    """
+    Exact identifier lookups through the normalized_* columns, and the
+    duplicate check on create.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('lookup'))
+        self.customer = Customer.objects.create(
+            name='Ravi Traders', phone_number='+91 98480 12345', email='ravi@example.com',
+            aadhaar_number='123456789012', pan_number='abcde1234f', gst_number='36abcde1234f1z5'
+        )
+
+    def lookup(self, **params):
+        response = self.client.get('/api/customers/lookup/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data]
+
+    def test_normalizers(self):
+        self.assertEqual(search.normalize_phone('+91 98480 12345'), '9848012345')
+        self.assertEqual(search.normalize_phone('098480-12345'), '9848012345')
+        self.assertIsNone(search.normalize_phone(' - '))
+        self.assertEqual(search.normalize_digits('1234 5678 9012'), '123456789012')
+        self.assertEqual(search.normalize_code('abcde1234f'), 'ABCDE1234F')
+        self.assertEqual(search.normalize_code(' abcde-1234 f'), 'ABCDE1234F')
+        self.assertIsNone(search.normalize_code(None))
+
+        self.assertEqual(self.customer.normalized_phone, '9848012345')
+        self.assertEqual(self.customer.normalized_aadhaar, '123456789012')
+        self.assertEqual(self.customer.normalized_pan, 'ABCDE1234F')
+        self.assertEqual(self.customer.normalized_gst, '36ABCDE1234F1Z5')
+
+    def test_lookup_matches_any_spelling(self):
+        self.assertEqual(self.lookup(phone='9848012345'), [self.customer.id])
+        self.assertEqual(self.lookup(phone='+919848012345'), [self.customer.id])
+        self.assertEqual(self.lookup(pan='ABCDE1234F'), [self.customer.id])
+        self.assertEqual(self.lookup(aadhaar='123456789012'), [self.customer.id])
+        self.assertEqual(self.lookup(gst='36ABCDE1234F1Z5'), [self.customer.id])
+        self.assertEqual(self.lookup(pan='ZZZZZ9999Z'), [])
+        # Any of the given identifiers
+        self.assertEqual(self.lookup(pan='ZZZZZ9999Z', phone='98480 12345'), [self.customer.id])
+
+        response = self.client.get('/api/customers/lookup/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_rejects_duplicate_identifiers(self):
+        data = {'name': 'Other', 'phone_number': '9000000001', 'email': 'other@example.com'}
+        response = self.client.post('/api/customers/create/', dict(data, pan_number='ABCDE1234F'), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Customer with this PAN already exists')
+
+        response = self.client.post('/api/customers/create/', dict(data, aadhaar_number='123456789012'), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Customer with this Aadhaar number already exists')
+
+        # A shared phone number is allowed
+        response = self.client.post('/api/customers/create/', dict(data, phone_number='9848012345'), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(self.lookup(phone='9848012345')), sorted([self.customer.id, response.data['id']]))
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'the FTS5 triggers are SQLite only')
+class SearchIndexReinstallTests(TransactionTestCase):
+    """
+    Table-remaking migrations drop the FTS5 triggers; post_migrate puts them
+    back.
+    """
+    def drop_triggers(self):
+        with connection.cursor() as cursor:
+            for suffix in ('insert', 'delete', 'update'):
+                cursor.execute(f'DROP TRIGGER {search.FTS_TABLE}_{suffix}')
+
+    def test_post_migrate_reinstalls_the_triggers(self):
+        self.drop_triggers()
+        self.addCleanup(search.reinstall_search_index, sender=None)
+        customer = make_customer(name='Ravi Traders')
+        self.assertEqual(search._fts_ranked_ids(['ravi'], None, 10), [])
+
+        search.reinstall_search_index(sender=None)
+        # Rebuilt from the table, and kept in sync again
+        self.assertEqual([customer_id for _, customer_id in search._fts_ranked_ids(['ravi'], None, 10)], [customer.id])
+        customer.name = 'Mahesh Traders'
+        customer.save()
+        self.assertEqual(search._fts_ranked_ids(['ravi'], None, 10), [])
+
+
+class QueryPlanRegressionTests(TestCase):
+    """
+    Seeds a realistic dataset, replays the hot read endpoints and runs EXPLAIN
+    on every query they send to the transaction and inventory tables. A test
+    fails if any of those queries would read a whole table instead of using
+    an index.
+    """
+    CUSTOMERS = 40
+    TRANSACTIONS_PER_CUSTOMER = 60
+    QUALITY_TYPES = ['A', 'B', 'C', 'D']
+    PAYMENT_TYPES = ['cash', 'upi']
+
+    WATCHED_TABLES = {
+        Transaction._meta.db_table,
+        Inventory._meta.db_table,
+        InventoryExpense._meta.db_table,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        cls.user = make_user('planner')
+
+        customers = Customer.objects.bulk_create([
+            Customer(
+                name=f'Customer {index}',
+                phone_number=f'98480{index:05d}',
+                email=f'customer{index}@example.com'
+            )
+            for index in range(cls.CUSTOMERS)
+        ])
+        cls.customer = customers[0]
+
+        start = date.today() - timedelta(days=365)
+        transactions = []
+        for customer in customers:
+            for index in range(cls.TRANSACTIONS_PER_CUSTOMER):
+                day = start + timedelta(days=index * 6 + rng.randint(0, 5))
+                if rng.random() < 0.7:
+                    quantity = Decimal(rng.randint(1, 500))
+                    rate = Decimal(rng.randint(10, 90))
+                    total = quantity * rate
+                    paid = rng.choice([Decimal('0'), total / 2, total])
+                    transactions.append(Transaction(
+                        customer=customer,
+                        transaction_type='stock',
+                        quality_type=rng.choice(cls.QUALITY_TYPES),
+                        quantity=quantity,
+                        rate=rate,
+                        total=total,
+                        amount_paid=paid,
+                        balance=total - paid,
+                        transaction_date=day,
+                        transaction_time=time(rng.randint(6, 20), rng.randint(0, 59)),
+                        payment_type='cash',
+                    ))
+                else:
+                    amount = Decimal(rng.randint(100, 20000))
+                    transactions.append(Transaction(
+                        customer=customer,
+                        transaction_type='payment',
+                        payment_type=rng.choice(cls.PAYMENT_TYPES),
+                        quality_type='payment',
+                        quantity=1,
+                        rate=amount,
+                        total=amount,
+                        amount_paid=amount,
+                        transaction_date=day,
+                        transaction_time=time(rng.randint(6, 20), rng.randint(0, 59)),
+                    ))
+        # Seed rows in ledger order so the heads come out consistent
+        transactions.sort(key=lambda txn: (txn.transaction_date, txn.transaction_time))
+        CustomerLedger.append_many(transactions)
+
+        inventory = Inventory.objects.bulk_create([
+            Inventory(
+                customer=customer,
+                quality_type=quality_type,
+                quantity=Decimal('100'),
+                total_cost=Decimal('5000'),
+                avg_cost=Decimal('50')
+            )
+            for customer in customers
+            for quality_type in cls.QUALITY_TYPES
+        ])
+        InventoryExpense.objects.bulk_create([
+            InventoryExpense(inventory=item, weight_loss=Decimal('1'), is_processing=True)
+            for item in inventory
+        ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def hot_endpoints(self):
+        customer_id = self.customer.id
+        return [
+            ('get_transactions', f'/api/customers/{customer_id}/transactions/?page=2&page_size=10'),
+            ('get_pending_transactions', f'/api/customers/{customer_id}/pending-transactions/'),
+            ('get_customer_balance', f'/api/customers/{customer_id}/balance/'),
+            ('get_customer_inventory', f'/api/customers/{customer_id}/inventory/'),
+            ('get_inventory_expenses', f'/api/customers/{customer_id}/inventory/expenses/'),
+            ('get_purchase_insights', '/api/transactions/insights?timeFrame=weekly'),
+            ('get_payment_insights', '/api/transactions/payment-insights?timeFrame=monthly'),
+            ('get_receivables_aging', '/api/transactions/aging/'),
+            ('get_receivables_aging_customer', f'/api/transactions/aging/?customer_id={customer_id}'),
+        ]
+
+    def full_table_scans(self, sql):
+        """
+        Return the watched tables that the plan for `sql` reads in full.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                details = [row[-1] for row in cursor.fetchall()]
+                # "SCAN <table>" without an index is a full table scan;
+                # "SEARCH" and "SCAN ... USING INDEX" are not
+                return {
+                    table for table in self.WATCHED_TABLES
+                    for detail in details
+                    if detail.split()[:2] == ['SCAN', table] and 'USING' not in detail
+                }
+
+            if connection.vendor == 'postgresql':
+                # On small tables Postgres prefers sequential scans even when
+                # an index applies; disabling them leaves a Seq Scan in the
+                # plan only when no usable index exists
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = set()
+                nodes = [plan[0]['Plan']]
+                while nodes:
+                    node = nodes.pop()
+                    if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in self.WATCHED_TABLES:
+                        scans.add(node['Relation Name'])
+                    nodes.extend(node.get('Plans', []))
+                return scans
+
+        self.skipTest(f'No query plan inspection for {connection.vendor}')
+
+    def test_hot_queries_use_indexes(self):
+        for name, url in self.hot_endpoints():
+            with self.subTest(endpoint=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, response.content)
+
+                for query in queries.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    if not any(table in sql for table in self.WATCHED_TABLES):
+                        continue
+                    self.assertFalse(
+                        self.full_table_scans(sql),
+                        f'{name} regressed to a full table scan:\n{sql}'
+                    )
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Row locks need PostgreSQL (set DB_NAME)')
+class ConcurrentPaymentTests(TransactionTestCase):
+    """
+    Fires payments from parallel threads against a real PostgreSQL database.
+    Payments for the same customer must never allocate the same pending
+    stock transaction twice, and a customer whose ledger is locked must not
+    hold up payments for anyone else.
+    """
+    PAYMENTS = 8
+
+    def setUp(self):
+        self.user = make_user('cashier')
+        self.customers = [
+            Customer.objects.create(name=f'Customer {index}', phone_number=f'90000{index:05d}')
+            for index in range(2)
+        ]
+        stock = []
+        for customer in self.customers:
+            for index in range(self.PAYMENTS):
+                stock.append(Transaction(
+                    customer=customer,
+                    transaction_type='stock',
+                    quality_type='A',
+                    quantity=Decimal('10'),
+                    rate=Decimal('10'),
+                    total=Decimal('100'),
+                    balance=Decimal('100'),
+                    payment_type='cash',
+                ))
+        CustomerLedger.append_many(stock)
+
+    def pay(self, customer, amount, results, start=None):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        try:
+            if start:
+                start.wait()
+            response = client.post('/api/transactions/payment/create/', {
+                'customer_id': customer.id,
+                'payment_type': 'cash',
+                'amount_paid': str(amount),
+            }, format='json')
+            results.append(response.status_code)
+        finally:
+            close_old_connections()
+            connection.close()
+
+    def run_payments(self, payments):
+        results = []
+        start = threading.Barrier(len(payments))
+        threads = [
+            threading.Thread(target=self.pay, args=(customer, amount, results, start))
+            for customer, amount in payments
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        return results
+
+    def test_parallel_payments_do_not_double_allocate(self):
+        payments = [(customer, Decimal('60')) for customer in self.customers for _ in range(self.PAYMENTS)]
+        results = self.run_payments(payments)
+        self.assertEqual(results, [201] * len(payments))
+
+        for customer in self.customers:
+            stock = Transaction.objects.filter(customer=customer, transaction_type='stock')
+            totals = stock.aggregate(paid=Sum('amount_paid'), balance=Sum('balance'))
+            # Every rupee paid lands on exactly one pending row
+            self.assertEqual(totals['paid'], Decimal('60') * self.PAYMENTS)
+            self.assertEqual(totals['balance'], Decimal('40') * self.PAYMENTS)
+            for row in stock:
+                self.assertEqual(row.amount_paid + row.balance, row.total)
+
+            ledger = CustomerLedger.objects.get(customer=customer)
+            self.assertEqual(ledger.last_sequence, self.PAYMENTS * 2)
+            self.assertEqual(ledger.running_balance, Decimal('40') * self.PAYMENTS)
+
+    def test_locked_customer_does_not_block_others(self):
+        locked, other = self.customers
+        results = []
+        with transaction.atomic():
+            # Hold the first customer's ledger lock from this thread
+            CustomerLedger.lock_for(locked.id)
+
+            blocked = threading.Thread(target=self.pay, args=(locked, Decimal('50'), results))
+            blocked.start()
+            free = threading.Thread(target=self.pay, args=(other, Decimal('50'), results))
+            free.start()
+
+            free.join(timeout=10)
+            self.assertFalse(free.is_alive(), 'payment for an unlocked customer waited on another customer')
+            blocked.join(timeout=1)
+            self.assertTrue(blocked.is_alive(), 'payment went ahead while its customer was locked')
+
+        blocked.join(timeout=10)
+        self.assertFalse(blocked.is_alive())
+        self.assertEqual(results, [201, 201])
@@ -0,0 +1,196 @@
+"""
+In-process prefix index for the customer typeahead.
+
+Each worker keeps sorted arrays of normalized customer names and of the
+words of names, company names and phone numbers (see CustomerPrefixIndex).
+A lookup bisects to the first entry starting with the query and scans
+forward, so it never touches the database. The index is
+built on first use. Customer saves and deletes update it in place once they
+commit, and bump a version counter in the cache. A worker whose index was
+built at an older version than the cache holds rebuilds it on its next
+lookup, which is how changes made in other workers reach it. Use a shared
+cache (CACHE_DIR) when running several workers. Lookups, updates and
+rebuilds all hold the module lock, so request threads never see the index
+half-changed.
+"""
+import re
+import threading
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import new_version
+from .search import search_words
+
+VERSION_KEY = 'customer_typeahead:version'
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Upper bound on index entries a single lookup looks at
+MAX_SCAN = 1000
+
+
+def customer_words(name, phone_number, company_name):
+    words = search_words(name) + search_words(company_name) + search_words(phone_number)
+    digits = re.sub(r'\D', '', phone_number or '')
+    words += [digits, digits[-10:]]
+    return {word for word in words if word}
+
+
+class CustomerPrefixIndex:
+    """
+    Two sorted arrays: (normalized full name, id) for names starting with
+    the query, which rank first, and (word, id) for a match on any word
+    """
+    def __init__(self):
+        self.names = []
+        self.entries = []
+        self.customers = {}
+
+    def _label(self, customer_id, name, phone_number, company_name):
+        label = {
+            'id': customer_id,
+            'name': name,
+            'phone_number': phone_number,
+            'company_name': company_name,
+        }
+        full_name = ' '.join(search_words(name))
+        self.customers[customer_id] = (label, full_name, customer_words(name, phone_number, company_name))
+        return full_name, self.customers[customer_id][2]
+
+    def add(self, customer_id, name, phone_number, company_name):
+        self.remove(customer_id)
+        full_name, words = self._label(customer_id, name, phone_number, company_name)
+        insort(self.names, (full_name, customer_id))
+        for word in words:
+            insort(self.entries, (word, customer_id))
+
+    def remove(self, customer_id):
+        if customer_id not in self.customers:
+            return
+        _, full_name, words = self.customers.pop(customer_id)
+        for array, key in [(self.names, full_name)] + [(self.entries, word) for word in words]:
+            position = bisect_left(array, (key, customer_id))
+            if position < len(array) and array[position] == (key, customer_id):
+                del array[position]
+
+    @classmethod
+    def build(cls, rows):
+        """
+        Index (id, name, phone_number, company_name) rows with one sort per array
+        """
+        index = cls()
+        for row in rows:
+            full_name, words = index._label(*row)
+            index.names.append((full_name, row[0]))
+            index.entries.extend((word, row[0]) for word in words)
+        index.names.sort()
+        index.entries.sort()
+        return index
+
+    def lookup(self, query, limit=DEFAULT_LIMIT):
+        """
+        Labels of up to `limit` customers having a word that starts with each
+        term of `query`: names starting with the query first, alphabetically,
+        then other matches
+        """
+        terms = search_words(query)
+        if not terms:
+            return []
+
+        results = []
+        full_query = ' '.join(terms)
+        position = bisect_left(self.names, (full_query,))
+        for full_name, customer_id in self.names[position:position + limit]:
+            if not full_name.startswith(full_query):
+                break
+            results.append(customer_id)
+
+        if len(results) < limit:
+            first, others = terms[0], terms[1:]
+            seen = set(results)
+            extra = []
+            position = bisect_left(self.entries, (first,))
+            for word, customer_id in self.entries[position:position + MAX_SCAN]:
+                if not word.startswith(first) or len(results) + len(extra) >= limit:
+                    break
+                if customer_id in seen:
+                    continue
+                seen.add(customer_id)
+                words = self.customers[customer_id][2]
+                if all(any(other_word.startswith(term) for other_word in words) for term in others):
+                    extra.append(customer_id)
+            results += sorted(extra, key=lambda customer_id: (self.customers[customer_id][1], customer_id))
+
+        return [self.customers[customer_id][0] for customer_id in results]
+
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, new_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _get_index(version):
+    # Callers hold _lock
+    global _index, _index_version
+    from .models import Customer
+
+    # Versions only grow: a version read before this worker applied a change
+    # of its own is older than the index, not newer
+    if _index is None or version is None or _index_version is None or version > _index_version:
+        _index = CustomerPrefixIndex.build(
+            Customer.objects.order_by().values_list('id', 'name', 'phone_number', 'company_name').iterator()
+        )
+        _index_version = version
+    return _index
+
+
+def lookup(query, limit=DEFAULT_LIMIT):
+    """
+    CustomerPrefixIndex.lookup on this worker's index, (re)built first if it
+    is missing or behind the cache version
+    """
+    version = _current_version()
+    with _lock:
+        return _get_index(version).lookup(query, limit=limit)
+
+
+def _apply_change(customer_id, label=None):
+    global _index_version
+    with _lock:
+        if not cache.add(VERSION_KEY, new_version(), timeout=None):
+            try:
+                version = cache.incr(VERSION_KEY)
+            except ValueError:
+                version = None
+        else:
+            # The counter was missing: no telling what other workers changed
+            version = None
+
+        if _index is None:
+            return
+        if label is None:
+            _index.remove(customer_id)
+        else:
+            _index.add(customer_id, *label)
+        # Only skip the rebuild if no other worker changed anything meanwhile
+        if version is not None and _index_version is not None and version == _index_version + 1:
+            _index_version = version
+
+
+def customer_saved(customer):
+    customer_id = customer.id
+    label = (customer.name, customer.phone_number, customer.company_name)
+    transaction.on_commit(lambda: _apply_change(customer_id, label))
+
+
+def customer_deleted(customer_id):
+    transaction.on_commit(lambda: _apply_change(customer_id))
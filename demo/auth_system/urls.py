@@ -1,15 +1,22 @@
 from django.urls import path
 from .views import (
     user_login, verify_user, home_page,
-     verify_token, search_customers, create_customer,
+     verify_token, search_customers, customer_typeahead, lookup_customers, create_customer,
     get_transactions,
     add_bank_account, get_bank_accounts, get_customer_bank_accounts, 
     get_transaction_details, get_transaction_history, create_stock_transaction,
-    create_payment_transaction, get_customer_details, get_customer_balance,
+    create_payment_transaction, preview_payment_allocation, get_customer_details, get_customer_balance,
     get_purchase_insights,
     create_bulk_payment,
+    get_settlement_job,
     get_payment_insights,
+    get_insight_series,
+    get_report_cache_stats,
+    request_customer_statement,
+    get_statement_job,
+    download_statement,
     get_pending_transactions,
+    get_receivables_aging,
     set_default_bank_account,
     setup_google_auth,
     verify_google_auth_setup,
@@ -29,21 +36,32 @@ urlpatterns = [
     # path('twilio/status/', twilio_status),
     path('api/auth/verify/', verify_token, name='verify_token'),
     path('api/customers/search/', search_customers, name='search_customers'),
+    path('api/customers/typeahead/', customer_typeahead, name='customer_typeahead'),
+    path('api/customers/lookup/', lookup_customers, name='lookup_customers'),
     path('api/customers/create/', create_customer, name='create_customer'),
     path('api/customers/<int:customer_id>/', get_customer_details, name='get_customer_details'),
     path('api/customers/<int:customer_id>/balance/', get_customer_balance, name='get_customer_balance'),
     path('api/customers/<int:customer_id>/transactions/', get_transactions, name='get_transactions'),
+    path('api/customers/<int:customer_id>/history/', get_transaction_history, name='get_transaction_history'),
     path('api/customers/<int:customer_id>/bank-accounts/', get_customer_bank_accounts, name='get_customer_bank_accounts'),
     path('api/customers/<int:customer_id>/bank-accounts/add/', add_bank_account, name='add_bank_account'),
     path('api/customers/<int:customer_id>/bank-accounts/<int:account_id>/set-default/', set_default_bank_account, name='set_default_bank_account'),
     path('api/transactions/stock/create/', create_stock_transaction, name='create_stock_transaction'),
     path('api/transactions/payment/create/', create_payment_transaction, name='create_payment_transaction'),
+    path('api/transactions/payment/preview/', preview_payment_allocation, name='preview_payment_allocation'),
     path('api/transactions/<int:transaction_id>/', get_transaction_details, name='get_transaction_details'),
     path('api/transactions/search/', get_transactions, name='get_transactions'),
     path('api/transactions/insights', get_purchase_insights, name='purchase_insights'),
     path('api/transactions/payment/bulk/', create_bulk_payment, name='create_bulk_payment'),
+    path('api/transactions/payment/bulk/jobs/<int:job_id>/', get_settlement_job, name='get_settlement_job'),
     path('api/transactions/payment-insights', get_payment_insights, name='get_payment_insights'),
+    path('api/transactions/insights/series/', get_insight_series, name='get_insight_series'),
+    path('api/reports/cache-stats/', get_report_cache_stats, name='get_report_cache_stats'),
+    path('api/customers/<int:customer_id>/statements/', request_customer_statement, name='request_customer_statement'),
+    path('api/statements/<int:job_id>/', get_statement_job, name='get_statement_job'),
+    path('api/statements/<int:job_id>/download/', download_statement, name='download_statement'),
     path('api/customers/<int:customer_id>/pending-transactions/', get_pending_transactions),
+    path('api/transactions/aging/', get_receivables_aging, name='get_receivables_aging'),
     path('login/', user_login, name='user_login'),
     path('verify/', verify_user, name='verify_user'),
     path('home/', home_page, name='home_page'),
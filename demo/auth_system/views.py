@@ -4,10 +4,22 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import UserSerializer, CustomerSerializer, TransactionSerializer, BankAccountSerializer, InventorySerializer, InventoryExpenseSerializer
-from .models import Transaction, Customer, BankAccount, Inventory, InventoryExpense
+from .serializers import UserSerializer, CustomerSerializer, TransactionSerializer, BankAccountSerializer, InventorySerializer, InventoryExpenseSerializer, SettlementJobSerializer, StatementJobSerializer, fields_from
+from .models import Transaction, Customer, BankAccount, Inventory, InventoryExpense, CustomerLedger, SettlementJob, StatementJob, DailyPurchaseRollup, DailyPaymentRollup
+from .allocation import (
+    apply_allocation, covering_pending_transactions, pending_stock_transactions,
+    plan_automatic_allocation, plan_manual_allocation, preview_allocation,
+)
+from .settlement import enqueue_settlement_job, settle_payments
+from .pagination import keyset_page, page_size_from, set_next_cursor, wants_count
+from .streaming import STREAM_CHUNK_SIZE, ndjson_response, wants_ndjson
+from .cache import cache_stats, cached_response
+from .exports import export_format, export_response
+from .statements import enqueue_statement_job
+from .search import MAX_SEARCH_RESULTS, duplicate_identifier, identifier_filter, search_customers_page
+from .typeahead import DEFAULT_LIMIT as TYPEAHEAD_LIMIT, MAX_LIMIT as TYPEAHEAD_MAX_LIMIT, lookup as typeahead_lookup
 from django.core.mail import send_mail
-from django.db.models import Q, Sum, Count, Avg
+from django.db.models import Q, F, Sum, Count, Avg
 from django.utils import timezone
 from django.db import transaction
 from django.core.paginator import Paginator
@@ -28,14 +40,16 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from twilio.twiml.messaging_response import MessagingResponse
 from django.core.exceptions import ValidationError
-from django.db.models.functions import TruncDate
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
 
 import qrcode
 import io
 import base64
-from django.http import HttpResponse
+import logging
+from django.http import FileResponse, HttpResponse
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 otp_storage = {}  # Store OTP temporarily
 
 load_dotenv()
@@ -248,25 +262,118 @@ def home_page(request):
 @permission_classes([IsAuthenticated])
 def search_customers(request):
     query = request.GET.get('query', '')
+    fields = fields_from(request)
     
     customers = Customer.objects.all()
+    if fields is None or 'bank_accounts' in fields:
+        customers = customers.prefetch_related('bank_accounts')
+    next_cursor = None
     
     if query:
-        customers = customers.filter(
-            Q(name__icontains=query) |
-            Q(email__icontains=query) |
-            Q(phone_number__icontains=query) |
-            Q(company_name__icontains=query) |
-            Q(gst_number__icontains=query) |
-            Q(pan_number__icontains=query)
-        )
+        # Ranked prefix matches from the search index, at most
+        # MAX_SEARCH_RESULTS per request; X-Next-Cursor continues the list
+        try:
+            customers, next_cursor = search_customers_page(
+                customers,
+                query,
+                cursor=request.GET.get('cursor'),
+                limit=int(request.GET.get('limit', MAX_SEARCH_RESULTS))
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
     
-    # Limit to 100 results if no search query, otherwise show all matches
+    # Without a query, the newest customers, 100 at a time
     if not query:
-        customers = customers[:100]
+        try:
+            customers, next_cursor = keyset_page(
+                customers,
+                ('-created_at', '-id'),
+                cursor=request.GET.get('cursor'),
+                page_size=max(1, min(int(request.GET.get('limit', MAX_SEARCH_RESULTS)), MAX_SEARCH_RESULTS))
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
         
-    serializer = CustomerSerializer(customers, many=True)
-    return Response(serializer.data)
+    try:
+        serializer = CustomerSerializer(customers, many=True, fields=fields)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    return set_next_cursor(Response(serializer.data), next_cursor)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def customer_typeahead(request):
+    """
+    Top matches for a customer name, phone or company prefix, as
+    id/name/phone_number/company_name labels, from the in-process index
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', TYPEAHEAD_LIMIT)), TYPEAHEAD_MAX_LIMIT))
+        results = typeahead_lookup(request.GET.get('q', ''), limit=limit)
+        return Response({'results': results})
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def lookup_customers(request):
+    """
+    Customers with an exact phone, aadhaar, pan or gst match (any of the given
+    ones), through the normalized identifier indexes
+    """
+    try:
+        condition = identifier_filter(request.GET)
+        if condition is None:
+            return Response({'error': 'Pass at least one of phone, aadhaar, pan or gst'}, status=400)
+        fields = fields_from(request)
+
+        customers = Customer.objects.filter(condition).order_by('id')[:MAX_SEARCH_RESULTS]
+        if fields is None or 'bank_accounts' in fields:
+            customers = customers.prefetch_related('bank_accounts')
+        serializer = CustomerSerializer(customers, many=True, fields=fields)
+        return Response(serializer.data)
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
+# (header, key) columns of the CSV/XLSX exports
+TRANSACTION_EXPORT_COLUMNS = [
+    ('Date', 'transaction_date'),
+    ('Time', 'transaction_time'),
+    ('Type', 'transaction_type'),
+    ('Details', 'details'),
+    ('Bank Account', 'bank_account'),
+    ('Quantity', 'quantity'),
+    ('Rate', 'rate'),
+    ('Total', 'total'),
+    ('Amount Paid', 'amount_paid'),
+    ('Balance', 'balance'),
+    ('Status', 'payment_status'),
+    ('Notes', 'notes'),
+]
+
+PURCHASE_INSIGHT_EXPORT_COLUMNS = [
+    ('Date', 'transaction_date'),
+    ('Time', 'transaction_time'),
+    ('Customer', 'customer_name'),
+    ('Quality Type', 'quality_type'),
+    ('Quantity', 'quantity'),
+    ('Rate', 'rate'),
+    ('Total Amount', 'total_amount'),
+    ('Status', 'payment_status'),
+    ('Notes', 'notes'),
+    ('Created By', 'created_by'),
+]
+
+PAYMENT_INSIGHT_EXPORT_COLUMNS = [
+    ('Date', 'transaction_date'),
+    ('Time', 'transaction_time'),
+    ('Customer', 'customer_name'),
+    ('Payment Type', 'payment_type'),
+    ('Bank Account', 'bank_account'),
+    ('Amount Paid', 'amount_paid'),
+    ('Notes', 'notes'),
+    ('Created By', 'created_by'),
+]
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -274,18 +381,27 @@ def get_transactions(request, customer_id):
     # Verify the customer belongs to the current user
     customer = get_object_or_404(Customer, id=customer_id)
     
+    # ?page=N keeps the original offset pagination with an exact count;
+    # otherwise pages follow ?cursor= (the next one in the X-Next-Cursor header)
+    # and the count is only computed on request (?count=true)
+    offset_mode = 'page' in request.GET
     page = int(request.GET.get('page', 1))
-    page_size = int(request.GET.get('page_size', 10))
+    page_size = page_size_from(request, default=10)
     
     # Get filter parameters
     filter_type = request.GET.get('filterType', None)
     start_date = request.GET.get('startDate', None)
     end_date = request.GET.get('endDate', None)
     
+    try:
+        file_format = export_format(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    
     # Base query
     transactions_query = Transaction.objects.filter(
         customer_id=customer_id
-    ).select_related('bank_account')
+    ).select_related('customer', 'bank_account')
     
     # Apply date range filter if provided
     if filter_type == 'date_range' and start_date and end_date:
@@ -294,39 +410,81 @@ def get_transactions(request, customer_id):
             transaction_date__lte=end_date
         )
     
+    # ?file_format=csv|xlsx: every matching transaction as a download
+    if file_format:
+        export_rows = transactions_query.order_by('-created_at', '-id').values(
+            'transaction_date', 'transaction_time', 'transaction_type', 'quality_type',
+            'payment_type', 'bank_account__bank_name', 'bank_account__account_number',
+            'quantity', 'rate', 'total', 'amount_paid', 'balance', 'payment_status', 'notes'
+        ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+        
+        def format_export_row(transaction):
+            bank_account = None
+            if transaction['bank_account__account_number']:
+                bank_account = f"{transaction['bank_account__bank_name']} - {transaction['bank_account__account_number']}"
+            is_stock = transaction['transaction_type'] == 'stock'
+            return dict(
+                transaction,
+                transaction_time=transaction['transaction_time'].strftime('%H:%M:%S'),
+                details=transaction['quality_type'] if is_stock else transaction['payment_type'],
+                bank_account=bank_account,
+                quantity=transaction['quantity'] if is_stock else None,
+                rate=transaction['rate'] if is_stock else None
+            )
+        
+        return export_response(
+            file_format,
+            (format_export_row(transaction) for transaction in export_rows),
+            TRANSACTION_EXPORT_COLUMNS,
+            f"transactions_{customer_id}_{timezone.now().date().isoformat()}",
+            title=customer.name
+        )
+    
     # Order and paginate
-    transactions = transactions_query.order_by('-created_at')[
-        (page - 1) * page_size : (page - 1) * page_size + page_size
-    ]
+    next_cursor = None
+    if offset_mode:
+        transactions = transactions_query.order_by('-created_at', '-id')[
+            (page - 1) * page_size : (page - 1) * page_size + page_size
+        ]
+    else:
+        try:
+            transactions, next_cursor = keyset_page(
+                transactions_query,
+                ('-created_at', '-id'),
+                cursor=request.GET.get('cursor'),
+                page_size=page_size
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
     
-    total = transactions_query.count()
+    total = None
+    if offset_mode or wants_count(request):
+        total = transactions_query.count()
     
-    serializer = TransactionSerializer(transactions, many=True)
+    try:
+        serializer = TransactionSerializer(transactions, many=True, fields=fields_from(request))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
     
-    # Calculate total pending amount for this customer
-    total_pending = Transaction.objects.filter(
-        customer_id=customer_id,
-        payment_status__in=['pending', 'partial']
-    ).aggregate(
-        total_pending=Sum('balance')
-    )['total_pending'] or 0
+    # Total pending amount for this customer, from the balance summary
+    total_pending = CustomerLedger.summary_for(customer_id).total_pending
     
-    return Response({
+    return set_next_cursor(Response({
         'results': serializer.data,
         'count': total,
         'customer_name': customer.name,
         'total_pending': float(total_pending),
         'filter_applied': filter_type == 'date_range'
-    })
+    }), next_cursor)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_customer(request):
-    # Check for duplicate Aadhaar
-    aadhaar_number = request.data.get('aadhaar_number')
-    if Customer.objects.filter(aadhaar_number=aadhaar_number).exists():
+    # Check for duplicate Aadhaar/PAN/GST (only the ones given)
+    duplicate = duplicate_identifier(request.data)
+    if duplicate:
         return Response({
-            "error": "Customer with this Aadhaar number already exists"
+            "error": f"Customer with this {duplicate} already exists"
         }, status=400)
 
     serializer = CustomerSerializer(data=request.data)
@@ -456,35 +614,40 @@ def create_stock_transaction(request):
         if not isinstance(transactions_data, list):
             transactions_data = [transactions_data]
             
-        saved_transactions = []
+        new_transactions = []
+        inventory_deltas = {}
         
         with transaction.atomic():
+            # Resolve every customer in the batch with a single query
+            customer_ids = {int(data.get('customer_id')) for data in transactions_data}
+            customers = Customer.objects.in_bulk(customer_ids)
+            if len(customers) != len(customer_ids):
+                raise ValidationError("No Customer matches the given query.")
+            
+            # Lock the ledger heads so advances and running balances are
+            # computed against a stable snapshot
+            ledgers = CustomerLedger.lock_many(customer_ids)
+            
+            # Check for advance payments (negative balance)
+            # If payments exceed the stock billed, we have an advance payment;
+            # the locked ledger heads carry both totals
+            advances = {
+                customer_id: ledger.advance_amount
+                for customer_id, ledger in ledgers.items()
+            }
+            
             for data in transactions_data:
-                customer_id = data.get('customer_id')
-                customer = get_object_or_404(Customer, id=customer_id)
-                
-                # Convert string values to float, with error handling
-                quantity = float(data.get('quantity', 0))
-                rate = float(data.get('rate', 0))
-                total = float(data.get('total', 0))
-                
-                # Check for advance payments (negative balance)
-                # Calculate current balance before this transaction
-                stock_total = Transaction.objects.filter(
-                    customer=customer,
-                    transaction_type='stock'
-                ).aggregate(total=Sum('total'))['total'] or 0
+                customer = customers[int(data.get('customer_id'))]
                 
-                payment_total = Transaction.objects.filter(
-                    customer=customer,
-                    transaction_type='payment'
-                ).aggregate(total=Sum('amount_paid'))['total'] or 0
+                # Convert string values to Decimal, with error handling
+                quantity = Decimal(str(data.get('quantity', 0)))
+                rate = Decimal(str(data.get('rate', 0)))
+                total = Decimal(str(data.get('total', 0)))
                 
-                # If payment_total > stock_total, we have an advance payment
-                advance_amount = float(payment_total) - float(stock_total)
+                advance_amount = advances.get(customer.id, Decimal('0'))
                 
                 # Determine initial values for the new transaction
-                initial_amount_paid = 0
+                initial_amount_paid = Decimal('0')
                 initial_balance = total
                 initial_payment_status = 'pending'
                 
@@ -496,16 +659,8 @@ def create_stock_transaction(request):
                     initial_balance = total - amount_to_apply
                     initial_payment_status = 'paid' if initial_balance == 0 else 'partial'
                 
-                # Print debug information
-                print(f"Creating stock transaction for customer {customer_id}")
-                print(f"Stock total: {stock_total}, Payment total: {payment_total}")
-                print(f"Advance amount: {advance_amount}")
-                print(f"Initial amount paid: {initial_amount_paid}")
-                print(f"Initial balance: {initial_balance}")
-                print(f"Initial payment status: {initial_payment_status}")
-                
-                # Print debug information for created_by
-                print(f"User creating transaction: {request.user.username}")
+                # The next row in the batch sees this one in the customer's balance
+                advances[customer.id] = advance_amount - total
                 
                 transaction_data = {
                     'customer': customer.id,
@@ -524,44 +679,29 @@ def create_stock_transaction(request):
                     'created_by': request.user.username
                 }
                 
-                # Print the transaction data for debugging
-                print(f"Transaction data before serialization: {transaction_data}")
-                
-                serializer = TransactionSerializer(data=transaction_data)
-                if serializer.is_valid():
-                    transaction_obj = serializer.save()
-                    print(f"Transaction saved with created_by: {transaction_obj.created_by}")
-                    print(f"Full transaction object after save: {transaction_obj.__dict__}")
-                    saved_transactions.append(serializer.data)
-                    
-                    # Update inventory table
-                    quality_type = data.get('quality_type')
-                    decimal_quantity = Decimal(str(quantity))
-                    decimal_total = Decimal(str(total))
-                    
-                    # Get or create inventory item
-                    inventory_item, created = Inventory.objects.get_or_create(
-                        customer=customer,
-                        quality_type=quality_type,
-                        defaults={
-                            'quantity': Decimal('0'),
-                            'total_cost': Decimal('0'),
-                            'created_by': request.user.username
-                        }
-                    )
-                    
-                    # Update inventory quantity and total cost
-                    inventory_item.quantity += decimal_quantity
-                    inventory_item.total_cost += decimal_total
-                    
-                    # Save inventory item (avg_cost will be calculated in the save method)
-                    inventory_item.save()
-                    
-                    print(f"Inventory updated: {inventory_item.customer.name} - {inventory_item.quality_type} - Quantity: {inventory_item.quantity} - Total Cost: {inventory_item.total_cost} - Avg Cost: {inventory_item.avg_cost}")
-                else:
+                serializer = TransactionSerializer(data=transaction_data, context={'customers': customers})
+                if not serializer.is_valid():
                     print(f"Serializer errors: {serializer.errors}")
                     raise ValidationError(f"Validation error for transaction: {serializer.errors}")
+                new_transactions.append(Transaction(**serializer.validated_data))
+                
+                # Coalesce inventory changes per (customer, quality_type)
+                key = (customer.id, data.get('quality_type'))
+                delta_quantity, delta_total = inventory_deltas.get(key, (Decimal('0'), Decimal('0')))
+                inventory_deltas[key] = (delta_quantity + quantity, delta_total + total)
+            
+            # Write all rows with one insert, running balances assigned in memory
+            created_transactions = CustomerLedger.append_many(new_transactions, ledgers)
+            
+            # Update inventory table, one write per (customer, quality_type)
+            Inventory.apply_deltas(inventory_deltas, created_by=request.user.username)
+            
+            logger.info(
+                "Created %s stock transactions and updated %s inventory items",
+                len(created_transactions), len(inventory_deltas)
+            )
         
+        saved_transactions = TransactionSerializer(created_transactions, many=True).data
         return Response(saved_transactions, status=201)
         
     except ValidationError as e:
@@ -578,10 +718,6 @@ def create_payment_transaction(request):
         from decimal import Decimal
         data = request.data
         
-        # Print user information at the start
-        print(f"User authenticated: {request.user.is_authenticated}")
-        print(f"Username: {request.user.username}")
-        
         # Validate required fields
         required_fields = ['customer_id', 'payment_type', 'amount_paid']
         for field in required_fields:
@@ -601,6 +737,12 @@ def create_payment_transaction(request):
             bank_account = get_object_or_404(BankAccount, id=bank_account_id)
         
         with transaction.atomic():
+            # Lock the customer's ledger head before reading pending transactions:
+            # concurrent payments for the same customer wait here instead of
+            # allocating the same pending rows twice, while payments for other
+            # customers go ahead
+            CustomerLedger.lock_for(customer.id)
+            
             # Create the payment transaction
             transaction_data = {
                 'customer': customer.id,
@@ -623,24 +765,16 @@ def create_payment_transaction(request):
             if data.get('payment_type') == 'bank' and bank_account:
                 transaction_data['bank_account_id'] = bank_account.id
             
-            # Print the transaction data for debugging
-            print(f"Payment transaction data before serialization: {transaction_data}")
-            
             serializer = TransactionSerializer(data=transaction_data)
             if not serializer.is_valid():
-                print(f"Payment serializer errors: {serializer.errors}")
                 return Response(serializer.errors, status=400)
             
             payment_transaction = serializer.save()
-            print(f"Payment transaction saved with created_by: {payment_transaction.created_by}")
-            print(f"Full payment transaction object after save: {payment_transaction.__dict__}")
             
             # Check if manual allocation is enabled
             manual_allocation = data.get('manual_allocation', False)
             allocations = data.get('allocations', {})
             
-            updated_transactions = []
-            
             if manual_allocation and allocations:
                 # Convert allocations from string keys to integers if needed
                 processed_allocations = {}
@@ -649,68 +783,20 @@ def create_payment_transaction(request):
                     processed_allocations[int(tx_id)] = Decimal(str(amount))
                 
                 # Get all transactions that have allocations
-                tx_ids = list(processed_allocations.keys())
-                transactions_to_update = Transaction.objects.filter(
-                    id__in=tx_ids,
-                    customer=customer,
-                    transaction_type='stock',
-                    payment_status__in=['pending', 'partial']
+                transactions_to_update = pending_stock_transactions(customer.id).filter(
+                    id__in=list(processed_allocations.keys())
                 )
-                
-                # Apply allocations to each transaction
-                for tx in transactions_to_update:
-                    allocation_amount = processed_allocations.get(tx.id, Decimal('0'))
-                    if allocation_amount > 0:
-                        current_balance = Decimal(str(tx.balance or '0'))
-                        # Ensure we don't allocate more than the balance
-                        amount_to_apply = min(allocation_amount, current_balance)
-                        
-                        tx.amount_paid = Decimal(str(tx.amount_paid or '0')) + amount_to_apply
-                        tx.balance = current_balance - amount_to_apply
-                        tx.payment_status = 'paid' if tx.balance == 0 else 'partial'
-                        tx.save()
-                        
-                        updated_transactions.append({
-                            'id': tx.id,
-                            'amount_applied': str(amount_to_apply),
-                            'new_balance': str(tx.balance)
-                        })
+                plan = plan_manual_allocation(transactions_to_update, processed_allocations)
             else:
                 # Use the default allocation logic (oldest transactions first)
-                # Update pending transactions
-                pending_transactions = Transaction.objects.filter(
-                    customer=customer,
-                    transaction_type='stock',
-                    payment_status__in=['pending', 'partial']
-                ).order_by('created_at')  # Default is oldest first
-                
-                # Check if we should use a different sorting order
+                # Only the pending transactions this payment reaches are read,
+                # in the requested order
                 sort_order = data.get('sort_order', 'oldest_first')
-                if sort_order == 'smallest_first':
-                    pending_transactions = pending_transactions.order_by('balance')
-                elif sort_order == 'largest_first':
-                    pending_transactions = pending_transactions.order_by('-balance')
-                
-                remaining_payment = payment_amount
-                
-                for pending_tx in pending_transactions:
-                    if remaining_payment <= 0:
-                        break
-                        
-                    current_balance = Decimal(str(pending_tx.balance or '0'))
-                    if current_balance > 0:
-                        amount_to_apply = min(remaining_payment, current_balance)
-                        pending_tx.amount_paid = Decimal(str(pending_tx.amount_paid or '0')) + amount_to_apply
-                        pending_tx.balance = current_balance - amount_to_apply
-                        pending_tx.payment_status = 'paid' if pending_tx.balance == 0 else 'partial'
-                        pending_tx.save()
-                        
-                        remaining_payment -= amount_to_apply
-                        updated_transactions.append({
-                            'id': pending_tx.id,
-                            'amount_applied': str(amount_to_apply),
-                            'new_balance': str(pending_tx.balance)
-                        })
+                pending_transactions = covering_pending_transactions(customer.id, payment_amount, sort_order)
+                plan, remaining_payment = plan_automatic_allocation(pending_transactions, payment_amount)
+            
+            # Write all allocations with a single update
+            updated_transactions = apply_allocation(plan)
             
             # Store updated_transactions in the payment transaction for serialization
             payment_transaction.updated_transactions = updated_transactions
@@ -726,6 +812,54 @@ def create_payment_transaction(request):
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def preview_payment_allocation(request):
+    """
+    Dry run of create_payment_transaction: shows how a payment would be
+    spread over the customer's pending stock transactions without saving
+    anything. Reads the pending transactions once, takes no locks and does
+    not open a transaction.
+    """
+    try:
+        from decimal import Decimal
+        data = request.data
+
+        # Validate required fields
+        required_fields = ['customer_id', 'amount_paid']
+        for field in required_fields:
+            if not data.get(field):
+                return Response({'error': f'Missing required field: {field}'}, status=400)
+
+        customer = get_object_or_404(Customer, id=data.get('customer_id'))
+        payment_amount = Decimal(str(data.get('amount_paid', '0')))
+        sort_order = data.get('sort_order', 'oldest_first')
+
+        manual_allocation = data.get('manual_allocation', False)
+        allocations = data.get('allocations', {})
+
+        processed_allocations = None
+        if manual_allocation and allocations:
+            processed_allocations = {
+                int(tx_id): Decimal(str(amount)) for tx_id, amount in allocations.items()
+            }
+
+        # Single snapshot of the pending transactions, ordered in memory
+        pending_transactions = list(pending_stock_transactions(customer.id))
+        preview = preview_allocation(
+            pending_transactions, payment_amount, sort_order, processed_allocations
+        )
+
+        return Response({
+            'customer_id': customer.id,
+            'allocation_type': 'manual' if processed_allocations else 'automatic',
+            'sort_order': sort_order,
+            **preview
+        })
+
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_transaction_details(request, transaction_id):
@@ -742,8 +876,18 @@ def get_transaction_history(request, customer_id):
     try:
         customer = get_object_or_404(Customer, id=customer_id)
 
-        transactions = Transaction.objects.filter(customer=customer)
-        serializer = TransactionSerializer(transactions, many=True)
+        transactions = Transaction.objects.filter(customer=customer).select_related('customer', 'bank_account')
+        fields = fields_from(request)
+        
+        # ?stream=ndjson: one serialized transaction per line
+        if wants_ndjson(request):
+            serializer = TransactionSerializer(fields=fields)
+            return ndjson_response(
+                serializer.to_representation(transaction)
+                for transaction in transactions.iterator(chunk_size=STREAM_CHUNK_SIZE)
+            )
+        
+        serializer = TransactionSerializer(transactions, many=True, fields=fields)
         return Response(serializer.data)
     except Exception as e:
         return Response({'error': str(e)}, status=400)
@@ -826,35 +970,12 @@ def get_customer_balance(request, customer_id):
     try:
         customer = get_object_or_404(Customer, id=customer_id)
         
-        # Get all transactions for this customer
-        all_transactions = Transaction.objects.filter(customer=customer)
-        
-        # Get stock transactions
-        stock_transactions = Transaction.objects.filter(
-            customer=customer,
-            transaction_type='stock'
-        )
-        
-        # Calculate total stock amount
-        total_stock_amount = stock_transactions.aggregate(
-            total=Sum('total')
-        )['total'] or 0
-        
-        # Get payment transactions
-        payment_transactions = Transaction.objects.filter(
-            customer=customer,
-            transaction_type='payment'
-        )
-        
-        # Calculate total payments
-        total_payments = payment_transactions.aggregate(
-            total=Sum('amount_paid')
-        )['total'] or 0
-        
-        # Calculate total pending amount (sum of remaining balances)
-        total_pending = stock_transactions.aggregate(
-            total_pending=Sum('balance')
-        )['total_pending'] or 0
+        # Stock total, payments and pending balance, kept up to date on
+        # every write in the customer's balance summary
+        summary = CustomerLedger.summary_for(customer.id)
+        total_stock_amount = summary.total_stock_amount
+        total_payments = summary.total_payments
+        total_pending = summary.total_pending
         
         # Calculate net balance (total payments - total stock amount)
         # This approach ensures advance payments are properly accounted for
@@ -863,57 +984,109 @@ def get_customer_balance(request, customer_id):
         # If net_balance is negative, it means there's an advance payment
         is_advance = net_balance < 0
 
-        return Response({
+        response_data = {
             'total_pending': float(total_pending),
             'total_paid': float(total_payments),
             'net_balance': float(net_balance),
             'is_advance': is_advance,
             'advance_amount': float(abs(net_balance) if is_advance else 0),
-            'debug_info': {
-                'stock_transactions': list(stock_transactions.values(
+        }
+
+        # The per-row listing is only sent on request (?debug=1), a page at a time
+        if request.GET.get('debug') in ('1', 'true'):
+            page = max(1, int(request.GET.get('page', 1)))
+            page_size = page_size_from(request)
+
+            offset = (page - 1) * page_size
+            stock_rows = Transaction.objects.filter(customer=customer, transaction_type='stock')
+            payment_rows = Transaction.objects.filter(customer=customer, transaction_type='payment')
+
+            response_data['debug_info'] = {
+                'stock_transactions': list(stock_rows.values(
                     'id', 'total', 'balance', 'amount_paid', 'transaction_date'
-                )),
-                'payment_transactions': list(payment_transactions.values(
+                )[offset:offset + page_size]),
+                'payment_transactions': list(payment_rows.values(
                     'id', 'amount_paid', 'transaction_date'
-                )),
+                )[offset:offset + page_size]),
+                'stock_count': stock_rows.count(),
+                'payment_count': payment_rows.count(),
+                'page': page,
+                'page_size': page_size,
                 'total_stock_amount': float(total_stock_amount),
                 'total_payments': float(total_payments)
             }
-        })
+
+        return Response(response_data)
 
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('purchase_insights', date_relative=True)
 def get_purchase_insights(request):
     try:
         # Get query parameters
         time_frame = request.GET.get('timeFrame', 'all')
         quality_types = request.GET.getlist('qualityTypes[]', [])
+        date_param = request.GET.get('date')
         
         # Base query for stock transactions
         query = Transaction.objects.filter(
             transaction_type='stock'
         ).select_related('customer')  # Add customer relation
         
+        # Daily rollups for the summary, filtered the same way
+        rollups = DailyPurchaseRollup.objects.all()
+        
         # Apply time frame filter
         today = timezone.now().date()
         if time_frame == 'today':
-            query = query.filter(transaction_date=today)
+            if date_param:
+                # Use the provided date
+                target_date = datetime.fromisoformat(date_param.replace('Z', '+00:00')).date()
+            else:
+                # Use current date in server's timezone
+                target_date = timezone.localtime(timezone.now()).date()
+            
+            query = query.filter(transaction_date=target_date)
+            rollups = rollups.filter(date=target_date)
         elif time_frame == 'weekly':
             week_ago = today - timedelta(days=7)
             query = query.filter(transaction_date__gte=week_ago)
+            rollups = rollups.filter(date__gte=week_ago)
         elif time_frame == 'monthly':
             month_ago = today - timedelta(days=30)
             query = query.filter(transaction_date__gte=month_ago)
+            rollups = rollups.filter(date__gte=month_ago)
         
         # Apply quality type filter
         if quality_types:
             query = query.filter(quality_type__in=quality_types)
+            rollups = rollups.filter(quality_type__in=quality_types)
             
-        # Get detailed transaction data
-        insights = query.values(
+        # Calculate summary from the daily rollups, in one query grouped by
+        # quality type whose cost depends on the number of days
+        type_totals = list(rollups.values('quality_type').annotate(
+            purchases=Sum('transaction_count'),
+            total_amount=Sum('total_amount'),
+            total_quantity=Sum('quantity')
+        ).filter(purchases__gt=0).order_by('quality_type'))
+        
+        summary = {
+            'total_purchases': sum(row['purchases'] for row in type_totals),
+            'total_amount': float(sum((row['total_amount'] or 0 for row in type_totals), 0)),
+            'total_quantity': float(sum((row['total_quantity'] or 0 for row in type_totals), 0)),
+            'by_quality_type': [{
+                'quality_type': row['quality_type'] or None,
+                'purchases': row['purchases'],
+                'total_amount': float(row['total_amount'] or 0),
+                'total_quantity': float(row['total_quantity'] or 0)
+            } for row in type_totals]
+        }
+        
+        insight_rows = query.values(
+            'id',
             'transaction_date',
             'transaction_time',
             'customer__name',
@@ -924,33 +1097,62 @@ def get_purchase_insights(request):
             'payment_status',
             'notes',
             'created_by'
-        ).order_by('-transaction_date', '-transaction_time')
+        )
+        ordering = ('-transaction_date', '-transaction_time', '-id')
         
         # Format the insights data
-        formatted_insights = [{
-            'transaction_date': transaction['transaction_date'],
-            'transaction_time': transaction['transaction_time'].strftime('%H:%M:%S'),
-            'customer_name': transaction['customer__name'],
-            'quality_type': transaction['quality_type'],
-            'quantity': float(transaction['quantity']),
-            'rate': float(transaction['rate']),
-            'total_amount': float(transaction['total']),
-            'payment_status': transaction['payment_status'],
-            'notes': transaction['notes'],
-            'created_by': transaction['created_by']
-        } for transaction in insights]
-        
-        # Calculate summary
-        summary = {
-            'total_purchases': query.count(),
-            'total_amount': float(query.aggregate(Sum('total'))['total__sum'] or 0),
-            'total_quantity': float(query.aggregate(Sum('quantity'))['quantity__sum'] or 0)
-        }
+        def format_insight(transaction):
+            return {
+                'transaction_date': transaction['transaction_date'],
+                'transaction_time': transaction['transaction_time'].strftime('%H:%M:%S'),
+                'customer_name': transaction['customer__name'],
+                'quality_type': transaction['quality_type'],
+                'quantity': float(transaction['quantity']),
+                'rate': float(transaction['rate']),
+                'total_amount': float(transaction['total']),
+                'payment_status': transaction['payment_status'],
+                'notes': transaction['notes'],
+                'created_by': transaction['created_by']
+            }
         
-        return Response({
-            'insights': formatted_insights,
+        # ?file_format=csv|xlsx: every matching row as a download
+        file_format = export_format(request)
+        if file_format:
+            return export_response(
+                file_format,
+                (format_insight(transaction) for transaction in
+                 insight_rows.order_by(*ordering).iterator(chunk_size=STREAM_CHUNK_SIZE)),
+                PURCHASE_INSIGHT_EXPORT_COLUMNS,
+                f"purchase_insights_{timezone.now().date().isoformat()}",
+                title='Purchase insights'
+            )
+        
+        # ?stream=ndjson: a summary line, then every matching row, one per line
+        if wants_ndjson(request):
+            return ndjson_response(
+                (format_insight(transaction) for transaction in
+                 insight_rows.order_by(*ordering).iterator(chunk_size=STREAM_CHUNK_SIZE)),
+                header={'summary': summary}
+            )
+        
+        # Every matching row by default (the charts use the whole list); one
+        # page at a time with ?page_size= / ?cursor=, the next cursor in the
+        # X-Next-Cursor header
+        next_cursor = None
+        if 'page_size' in request.GET or 'cursor' in request.GET:
+            insights, next_cursor = keyset_page(
+                insight_rows,
+                ordering,
+                cursor=request.GET.get('cursor'),
+                page_size=page_size_from(request)
+            )
+        else:
+            insights = insight_rows.order_by(*ordering)
+        
+        return set_next_cursor(Response({
+            'insights': [format_insight(transaction) for transaction in insights],
             'summary': summary
-        })
+        }), next_cursor)
         
     except Exception as e:
         return Response({'error': str(e)}, status=400)
@@ -961,88 +1163,19 @@ def create_bulk_payment(request):
     try:
         payments_data = request.data
         
-        saved_payments = []
-        updated_transactions = []
+        # Large batches can be queued instead and settled by the
+        # run_settlement_jobs worker; poll get_settlement_job for progress
+        if request.GET.get('mode') == 'job':
+            job = enqueue_settlement_job(payments_data, request.user.username)
+            return Response({
+                'job_id': job.id,
+                'status': job.status,
+                'total_customers': job.total_customers
+            }, status=202)
         
-        with transaction.atomic():
-            for payment in payments_data:
-                customer_id = payment.get('customer_id')
-                customer = get_object_or_404(Customer, id=customer_id)
-                payment_amount = float(payment.get('amount_paid', 0))
-                
-                # Get pending transactions for this customer
-                pending_transactions = Transaction.objects.filter(
-                    customer=customer,
-                    transaction_type='stock',
-                    payment_status__in=['pending', 'partial']
-                ).order_by('created_at')
-                
-                # Get bank account if provided - check both field names
-                bank_account_id = payment.get('bank_account_id')
-                if not bank_account_id:
-                    bank_account_id = payment.get('bank_account')
-                
-                bank_account = None
-                if bank_account_id and payment.get('payment_type') == 'bank':
-                    bank_account = get_object_or_404(BankAccount, id=bank_account_id)
-                
-                # Create the payment transaction
-                transaction_data = {
-                    'customer': customer.id,
-                    'transaction_type': 'payment',
-                    'payment_type': payment.get('payment_type', 'bank'),
-                    'quality_type': 'payment',
-                    'quantity': 1,
-                    'rate': payment_amount,
-                    'total': payment_amount,
-                    'amount_paid': payment_amount,
-                    'balance': 0,
-                    'notes': payment.get('notes', ''),
-                    'transaction_date': payment.get('transaction_date', timezone.now().date()),
-                    'transaction_time': payment.get('transaction_time', timezone.now().time()),
-                    'payment_status': 'paid',
-                    'created_by': request.user.username
-                }
-                
-                # Add bank_account_id if payment type is bank
-                if payment.get('payment_type') == 'bank' and bank_account:
-                    transaction_data['bank_account_id'] = bank_account.id
-                
-                serializer = TransactionSerializer(data=transaction_data)
-                if serializer.is_valid():
-                    payment_transaction = serializer.save()
-                    saved_payments.append(serializer.data)
-                    
-                    # Update pending transactions with this payment
-                    remaining_payment = payment_amount
-                    customer_updated_transactions = []
-                    
-                    for pending_tx in pending_transactions:
-                        if remaining_payment <= 0:
-                            break
-                            
-                        current_balance = float(pending_tx.balance or 0)
-                        if current_balance > 0:
-                            amount_to_apply = min(remaining_payment, current_balance)
-                            pending_tx.amount_paid = float(pending_tx.amount_paid or 0) + amount_to_apply
-                            pending_tx.balance = current_balance - amount_to_apply
-                            pending_tx.payment_status = 'paid' if pending_tx.balance == 0 else 'partial'
-                            pending_tx.save()
-                            
-                            remaining_payment -= amount_to_apply
-                            customer_updated_transactions.append({
-                                'id': pending_tx.id,
-                                'amount_applied': amount_to_apply,
-                                'new_balance': pending_tx.balance
-                            })
-                    
-                    updated_transactions.append({
-                        'customer_id': customer_id,
-                        'updated_transactions': customer_updated_transactions,
-                        'remaining_payment': remaining_payment
-                    })
-                else:
-                    raise ValidationError(f"Validation error for payment: {serializer.errors}")
+        # Customers, bank accounts and pending transactions for the whole
+        # batch are fetched up front and all changes are flushed in bulk
+        saved_payments, updated_transactions = settle_payments(payments_data, request.user.username)
         
         return Response({
             'payments': saved_payments,
@@ -1056,6 +1189,17 @@ def create_bulk_payment(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def get_settlement_job(request, job_id):
+    try:
+        job = get_object_or_404(SettlementJob, id=job_id)
+        serializer = SettlementJobSerializer(job)
+        return Response(serializer.data)
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response('payment_insights', date_relative=True)
 def get_payment_insights(request):
     try:
         # Get query parameters
@@ -1068,6 +1212,9 @@ def get_payment_insights(request):
             transaction_type='payment'
         ).select_related('customer', 'bank_account')
         
+        # Daily rollups for the summary, filtered the same way
+        rollups = DailyPaymentRollup.objects.all()
+        
         # Apply time frame filter
         if time_frame == 'today':
             if date_param:
@@ -1078,19 +1225,46 @@ def get_payment_insights(request):
                 target_date = timezone.localtime(timezone.now()).date()
             
             query = query.filter(transaction_date=target_date)
+            rollups = rollups.filter(date=target_date)
         elif time_frame == 'weekly':
             week_ago = timezone.now().date() - timedelta(days=7)
             query = query.filter(transaction_date__gte=week_ago)
+            rollups = rollups.filter(date__gte=week_ago)
         elif time_frame == 'monthly':
             month_ago = timezone.now().date() - timedelta(days=30)
             query = query.filter(transaction_date__gte=month_ago)
+            rollups = rollups.filter(date__gte=month_ago)
         
         # Apply payment type filter
         if payment_types:
             query = query.filter(payment_type__in=payment_types)
+            rollups = rollups.filter(payment_type__in=payment_types)
             
-        # Get detailed transaction data
-        insights = query.values(
+        # Calculate summary from the daily rollups, in one query grouped by
+        # payment type whose cost depends on the number of days
+        type_totals = list(rollups.values('payment_type').annotate(
+            payments=Sum('transaction_count'),
+            total_amount=Sum('amount')
+        ).filter(payments__gt=0).order_by('payment_type'))
+        
+        total_payments = sum(row['payments'] for row in type_totals)
+        total_amount = sum((row['total_amount'] or 0 for row in type_totals), 0)
+        most_common = max(type_totals, key=lambda row: row['payments'], default=None)
+        
+        summary = {
+            'total_payments': total_payments,
+            'total_amount': float(total_amount),
+            'average_payment': float(total_amount / total_payments) if total_payments else 0.0,
+            'most_common_type': (most_common['payment_type'] or None) if most_common else None,
+            'by_payment_type': [{
+                'payment_type': row['payment_type'] or None,
+                'payments': row['payments'],
+                'total_amount': float(row['total_amount'] or 0)
+            } for row in type_totals]
+        }
+        
+        insight_rows = query.values(
+            'id',
             'transaction_date',
             'transaction_time',
             'customer__name',
@@ -1099,41 +1273,214 @@ def get_payment_insights(request):
             'amount_paid',
             'notes',
             'created_by'
-        ).order_by('-transaction_date', '-transaction_time')
-        
-        # Calculate most common payment type
-        payment_type_count = query.values('payment_type').annotate(
-            count=Count('id')
-        ).order_by('-count').first()
+        )
+        ordering = ('-transaction_date', '-transaction_time', '-id')
         
         # Format insights data
-        formatted_insights = [{
-            'transaction_date': payment['transaction_date'],
-            'transaction_time': payment['transaction_time'].strftime('%H:%M:%S'),
-            'customer_name': payment['customer__name'],
-            'payment_type': payment['payment_type'],
-            'bank_account': payment['bank_account__account_number'],
-            'amount_paid': float(payment['amount_paid']),
-            'notes': payment['notes'],
-            'created_by': payment['created_by']
-        } for payment in insights]
-        
-        # Calculate summary
-        summary = {
-            'total_payments': query.count(),
-            'total_amount': float(query.aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0),
-            'average_payment': float(query.aggregate(Avg('amount_paid'))['amount_paid__avg'] or 0),
-            'most_common_type': payment_type_count['payment_type'] if payment_type_count else None
-        }
+        def format_insight(payment):
+            return {
+                'transaction_date': payment['transaction_date'],
+                'transaction_time': payment['transaction_time'].strftime('%H:%M:%S'),
+                'customer_name': payment['customer__name'],
+                'payment_type': payment['payment_type'],
+                'bank_account': payment['bank_account__account_number'],
+                'amount_paid': float(payment['amount_paid']),
+                'notes': payment['notes'],
+                'created_by': payment['created_by']
+            }
         
-        return Response({
-            'insights': formatted_insights,
+        # ?file_format=csv|xlsx: every matching row as a download
+        file_format = export_format(request)
+        if file_format:
+            return export_response(
+                file_format,
+                (format_insight(payment) for payment in
+                 insight_rows.order_by(*ordering).iterator(chunk_size=STREAM_CHUNK_SIZE)),
+                PAYMENT_INSIGHT_EXPORT_COLUMNS,
+                f"payment_insights_{timezone.now().date().isoformat()}",
+                title='Payment insights'
+            )
+        
+        # ?stream=ndjson: a summary line, then every matching row, one per line
+        if wants_ndjson(request):
+            return ndjson_response(
+                (format_insight(payment) for payment in
+                 insight_rows.order_by(*ordering).iterator(chunk_size=STREAM_CHUNK_SIZE)),
+                header={'summary': summary}
+            )
+        
+        # Every matching row by default (the charts use the whole list); one
+        # page at a time with ?page_size= / ?cursor=, the next cursor in the
+        # X-Next-Cursor header
+        next_cursor = None
+        if 'page_size' in request.GET or 'cursor' in request.GET:
+            insights, next_cursor = keyset_page(
+                insight_rows,
+                ordering,
+                cursor=request.GET.get('cursor'),
+                page_size=page_size_from(request)
+            )
+        else:
+            insights = insight_rows.order_by(*ordering)
+        
+        return set_next_cursor(Response({
+            'insights': [format_insight(payment) for payment in insights],
             'summary': summary
+        }), next_cursor)
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response('insight_series', date_relative=True)
+def get_insight_series(request):
+    """
+    Purchases (kind=purchases, split by quality_type) or payments
+    (kind=payments, split by payment_type) bucketed by day, week or month,
+    for charts. One GROUP BY over the daily rollups, one entry per bucket.
+    """
+    try:
+        kind = request.GET.get('kind', 'purchases')
+        granularity = request.GET.get('granularity', 'day')
+        time_frame = request.GET.get('timeFrame', 'all')
+        start_date = request.GET.get('startDate')
+        end_date = request.GET.get('endDate')
+
+        if kind == 'purchases':
+            rollups = DailyPurchaseRollup.objects.all()
+            split_field = 'quality_type'
+            split_values = request.GET.getlist('qualityTypes[]', [])
+            amount_field = 'total_amount'
+        elif kind == 'payments':
+            rollups = DailyPaymentRollup.objects.all()
+            split_field = 'payment_type'
+            split_values = request.GET.getlist('paymentTypes[]', [])
+            amount_field = 'amount'
+        else:
+            return Response({'error': 'kind must be purchases or payments'}, status=400)
+
+        # Daily rollup rows already are day buckets; weeks start on Monday
+        truncators = {'day': F, 'week': TruncWeek, 'month': TruncMonth}
+        if granularity not in truncators:
+            return Response({'error': 'granularity must be day, week or month'}, status=400)
+
+        # Apply time frame filter
+        today = timezone.now().date()
+        if time_frame == 'today':
+            rollups = rollups.filter(date=today)
+        elif time_frame == 'weekly':
+            rollups = rollups.filter(date__gte=today - timedelta(days=7))
+        elif time_frame == 'monthly':
+            rollups = rollups.filter(date__gte=today - timedelta(days=30))
+        if start_date:
+            rollups = rollups.filter(date__gte=start_date)
+        if end_date:
+            rollups = rollups.filter(date__lte=end_date)
+
+        if split_values:
+            rollups = rollups.filter(**{f'{split_field}__in': split_values})
+
+        period = truncators[granularity]('date')
+        aggregates = {
+            'count': Sum('transaction_count'),
+            'total_amount': Sum(amount_field),
+        }
+        if kind == 'purchases':
+            aggregates['quantity'] = Sum('quantity')
+
+        rows = rollups.values(
+            split_field, period=period
+        ).annotate(**aggregates).filter(count__gt=0).order_by('period', split_field)
+
+        series = []
+        for row in rows:
+            if not series or series[-1]['period'] != row['period']:
+                series.append({'period': row['period'], 'count': 0, 'total_amount': 0.0, 'by_type': {}})
+                if kind == 'purchases':
+                    series[-1]['quantity'] = 0.0
+            bucket = series[-1]
+
+            values = {
+                'count': row['count'],
+                'total_amount': float(row['total_amount'] or 0),
+            }
+            if kind == 'purchases':
+                values['quantity'] = float(row['quantity'] or 0)
+            bucket['by_type'][row[split_field] or 'unspecified'] = values
+            for key, value in values.items():
+                bucket[key] += value
+
+        return Response({
+            'kind': kind,
+            'granularity': granularity,
+            'split_by': split_field,
+            'series': series
         })
+
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_report_cache_stats(request):
+    """
+    Hit/miss counters of the insight and inventory report cache
+    """
+    try:
+        return Response(cache_stats())
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def request_customer_statement(request, customer_id):
+    """
+    Queue a PDF statement of a customer for start_date..end_date; the
+    generate_statements worker renders it. Poll get_statement_job for the
+    download URL.
+    """
+    try:
+        customer = get_object_or_404(Customer, id=customer_id)
+        
+        start_date = request.data.get('start_date')
+        end_date = request.data.get('end_date')
+        if not start_date or not end_date:
+            return Response({'error': 'start_date and end_date are required'}, status=400)
         
+        job = enqueue_statement_job(
+            customer,
+            datetime.strptime(start_date, '%Y-%m-%d').date(),
+            datetime.strptime(end_date, '%Y-%m-%d').date(),
+            created_by=request.user.username
+        )
+        serializer = StatementJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=202)
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_statement_job(request, job_id):
+    try:
+        job = get_object_or_404(StatementJob.objects.select_related('customer'), id=job_id)
+        serializer = StatementJobSerializer(job, context={'request': request})
+        return Response(serializer.data)
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def download_statement(request, job_id):
+    job = get_object_or_404(StatementJob, id=job_id)
+    if job.status != 'completed' or not job.file_path:
+        return Response({'error': f'Statement is {job.status}'}, status=409)
+    
+    path = os.path.join(settings.STATEMENTS_ROOT, job.file_path)
+    if not os.path.exists(path):
+        return Response({'error': 'Statement file is missing'}, status=404)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path), content_type='application/pdf')
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_pending_transactions(request, customer_id):
@@ -1145,18 +1492,107 @@ def get_pending_transactions(request, customer_id):
             customer=customer,
             transaction_type='stock',
             payment_status__in=['pending', 'partial']
-        ).order_by('created_at')
+        ).select_related('customer', 'bank_account')
+        ordering = ('created_at', 'id')
+        
+        # All of them by default (payment allocation needs the full list);
+        # one page at a time with ?page_size= / ?cursor=, the next cursor in
+        # the X-Next-Cursor header
+        next_cursor = None
+        if 'page_size' in request.GET or 'cursor' in request.GET:
+            pending_page, next_cursor = keyset_page(
+                pending_transactions,
+                ordering,
+                cursor=request.GET.get('cursor'),
+                page_size=page_size_from(request)
+            )
+            count = pending_transactions.count() if wants_count(request) else None
+        else:
+            pending_page = list(pending_transactions.order_by(*ordering))
+            count = len(pending_page)
         
-        serializer = TransactionSerializer(pending_transactions, many=True)
+        serializer = TransactionSerializer(pending_page, many=True)
         
-        return Response({
+        return set_next_cursor(Response({
             'results': serializer.data,
-            'count': pending_transactions.count()
-        })
+            'count': count
+        }), next_cursor)
         
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_receivables_aging(request):
+    """
+    Outstanding stock balances bucketed by age (days since transaction_date
+    as of `as_of`, default today), per customer and overall. Computed with a
+    single grouped query over open stock transactions.
+    """
+    try:
+        from datetime import date
+        from decimal import Decimal
+
+        as_of_param = request.GET.get('as_of')
+        as_of = date.fromisoformat(as_of_param) if as_of_param else timezone.localtime(timezone.now()).date()
+        customer_id = request.GET.get('customer_id')
+
+        open_transactions = Transaction.objects.filter(
+            transaction_type='stock',
+            payment_status__in=['pending', 'partial'],
+            balance__gt=0,
+            transaction_date__lte=as_of
+        )
+        if customer_id:
+            customer = get_object_or_404(Customer, id=customer_id)
+            open_transactions = open_transactions.filter(customer=customer)
+
+        # Bucket edges are plain date comparisons, so no date arithmetic runs in SQL
+        day_30 = as_of - timedelta(days=30)
+        day_60 = as_of - timedelta(days=60)
+        day_90 = as_of - timedelta(days=90)
+        buckets = {
+            'days_0_30': Q(transaction_date__gte=day_30),
+            'days_31_60': Q(transaction_date__lt=day_30, transaction_date__gte=day_60),
+            'days_61_90': Q(transaction_date__lt=day_60, transaction_date__gte=day_90),
+            'days_over_90': Q(transaction_date__lt=day_90),
+        }
+
+        rows = open_transactions.order_by().values('customer_id', 'customer__name').annotate(
+            total_outstanding=Sum('balance'),
+            open_transactions=Count('id'),
+            **{bucket: Sum('balance', filter=condition) for bucket, condition in buckets.items()}
+        ).order_by('-total_outstanding', 'customer_id')
+
+        amount_fields = list(buckets) + ['total_outstanding']
+        overall = {field: Decimal('0') for field in amount_fields}
+        overall['open_transactions'] = 0
+        customers = []
+        for row in rows:
+            for field in amount_fields:
+                overall[field] += row[field] or 0
+            overall['open_transactions'] += row['open_transactions']
+
+            customers.append({
+                'customer_id': row['customer_id'],
+                'customer_name': row['customer__name'],
+                **{field: float(row[field] or 0) for field in amount_fields},
+                'open_transactions': row['open_transactions']
+            })
+
+        return Response({
+            'as_of': as_of,
+            'customers': customers,
+            'overall': {
+                **{field: float(overall[field]) for field in amount_fields},
+                'open_transactions': overall['open_transactions'],
+                'customer_count': len(customers)
+            }
+        })
+
+    except Exception as e:
+        return Response({'error': str(e)}, status=400)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def set_default_bank_account(request, customer_id, account_id):
@@ -1237,46 +1673,57 @@ def verify_google_auth_setup(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('inventory_overview')
 def get_inventory_overview(request):
     """
-    Get an overview of all inventory items across all customers
+    Get an overview of all inventory items across all customers.
+    The summary covers every item; the items are all listed too unless
+    ?page_size= / ?cursor= ask for one page at a time
     """
     try:
-        # Get all inventory items
-        inventory_items = Inventory.objects.all()
-        
-        # Serialize the data
-        serializer = InventorySerializer(inventory_items, many=True)
-        
-        # Calculate totals
-        total_quantity = sum(item.quantity for item in inventory_items)
-        total_cost = sum(item.total_cost for item in inventory_items)
+        # Group by quality type in the database
+        quality_rows = Inventory.objects.order_by().values('quality_type').annotate(
+            total_quantity=Sum('quantity'),
+            total_cost=Sum('total_cost')
+        )
         
-        # Group by quality type
+        total_quantity = 0
+        total_cost = 0
         quality_summary = {}
-        for item in inventory_items:
-            if item.quality_type not in quality_summary:
-                quality_summary[item.quality_type] = {
-                    'total_quantity': 0,
-                    'total_cost': 0,
-                    'avg_cost': 0
-                }
-            quality_summary[item.quality_type]['total_quantity'] += item.quantity
-            quality_summary[item.quality_type]['total_cost'] += item.total_cost
+        for row in quality_rows:
+            total_quantity += row['total_quantity']
+            total_cost += row['total_cost']
+            quality_summary[row['quality_type']] = {
+                'total_quantity': row['total_quantity'],
+                'total_cost': row['total_cost'],
+                'avg_cost': row['total_cost'] / row['total_quantity'] if row['total_quantity'] > 0 else 0
+            }
         
-        # Calculate average costs for each quality type
-        for quality_type, data in quality_summary.items():
-            if data['total_quantity'] > 0:
-                data['avg_cost'] = data['total_cost'] / data['total_quantity']
+        # Items with their customers in the same query; paged on request,
+        # the next cursor in the X-Next-Cursor header
+        inventory_items = Inventory.objects.select_related('customer')
+        next_cursor = None
+        if 'page_size' in request.GET or 'cursor' in request.GET:
+            inventory_items, next_cursor = keyset_page(
+                inventory_items,
+                ('id',),
+                cursor=request.GET.get('cursor'),
+                page_size=page_size_from(request)
+            )
+        else:
+            inventory_items = inventory_items.order_by('id')
         
-        return Response({
+        # Serialize the data
+        serializer = InventorySerializer(inventory_items, many=True)
+        
+        return set_next_cursor(Response({
             'inventory_items': serializer.data,
             'summary': {
                 'total_quantity': total_quantity,
                 'total_cost': total_cost,
                 'quality_summary': quality_summary
             }
-        })
+        }), next_cursor)
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
@@ -1290,7 +1737,7 @@ def get_customer_inventory(request, customer_id):
         customer = get_object_or_404(Customer, id=customer_id)
         
         # Get all inventory items for this customer
-        inventory_items = Inventory.objects.filter(customer=customer)
+        inventory_items = Inventory.objects.filter(customer=customer).select_related('customer')
         
         # Serialize the data
         serializer = InventorySerializer(inventory_items, many=True)
@@ -1447,17 +1894,28 @@ def get_inventory_expenses(request, customer_id):
     try:
         customer = get_object_or_404(Customer, id=customer_id)
         
-        # Get all inventory items for this customer
-        inventory_items = Inventory.objects.filter(customer=customer)
-        
-        # Get all expenses for these inventory items
+        # Get all expenses for this customer's inventory items
         expenses = InventoryExpense.objects.filter(
-            inventory__in=inventory_items
-        ).order_by('-created_at')
+            inventory__customer=customer
+        ).select_related('inventory__customer')
+        ordering = ('-created_at', '-id')
+        
+        # All of them by default; one page at a time with ?page_size= /
+        # ?cursor=, the next cursor in the X-Next-Cursor header
+        next_cursor = None
+        if 'page_size' in request.GET or 'cursor' in request.GET:
+            expenses, next_cursor = keyset_page(
+                expenses,
+                ordering,
+                cursor=request.GET.get('cursor'),
+                page_size=page_size_from(request)
+            )
+        else:
+            expenses = expenses.order_by(*ordering)
         
         # Serialize the data
         serializer = InventoryExpenseSerializer(expenses, many=True)
         
-        return Response(serializer.data)
+        return set_next_cursor(Response(serializer.data), next_cursor)
     except Exception as e:
         return Response({'error': str(e)}, status=400)